@@ -17,12 +17,9 @@ We support a number of potential action types.  These are:
 
 """
 
-# Python imports.
-import logging as log
-import random
-
 # Module imports.
 from utils.exceptions import ActionException
+from utils.logs import combatLog as log
 import combat.event as event
 
 MELEE = 'melee'
@@ -48,7 +45,7 @@ class Action(event.Event):
         the combatlist.
 
         """
-        log.debug('Initializing a new action, type: {0}'.format(command.name))
+        log.debug('Initializing a new action, type: %s', command.name)
 
         self.command = command
         self.caller = caller
@@ -121,69 +118,83 @@ class Action(event.Event):
 
     def doAction(self):
         """Performs the action."""
-        log.debug('Performing action %s on: %s' % (self.command.name,
-                                                   self.target.name))
+        log.debug('Performing action %s on: %s',
+                  self.command.name, self.target.name)
+
+        recorder = self.caller.recorder
 
         if self.command.actionType == INACTIVE:
-            log.debug('Action is %s' % INACTIVE)
+            log.debug('Action is %s', INACTIVE)
 
             # Do nothing.
+            if recorder:
+                recorder.inactive(self.caller, self.command, self.target)
 
         elif self.command.actionType in ATTACKTYPES:
-            log.debug('Action is %s' % self.command.actionType)
+            log.debug('Action is %s', self.command.actionType)
 
             self._calculateDamage(self.caller, self.target)
-            log.info('{0} uses {1} on {2} for {3} damage'.format(
-                self.caller.name,
-                self.command.name,
-                self.target.name,
-                self.impact))
+            log.info('%s uses %s on %s for %s damage',
+                     self.caller.name,
+                     self.command.name,
+                     self.target.name,
+                     self.impact)
             self.target.damage(self.impact)
 
+            if recorder:
+                recorder.attack(self.caller, self.command, self.target,
+                                self.impact)
+
         elif self.command.actionType == BUFF:
-            log.debug('Action is %s' % BUFF)
+            log.debug('Action is %s', BUFF)
 
             self._buffAttribute()
 
+            if recorder:
+                for (attr, change) in self.impact.items():
+                    recorder.buff(self.caller, self.command, self.target,
+                                  attr, change)
+
             if self.impact:
-                log.info('{0} uses {1} on {2} to change {3} by {4}'.format(
+                log.info('%s uses %s on %s to change %s by %s',
                          self.caller.name,
                          self.command.name,
                          self.target.name,
                          ', '.join(self.command.buffAttrs),
-                         self.impact))
+                         self.impact)
             else:
-                log.info('{0} uses {1} on {2} with no impact'.format(
-                    self.caller.name,
-                    self.command.name,
-                    self.target.name))
+                log.info('%s uses %s on %s with no impact',
+                         self.caller.name, self.command.name, self.target.name)
 
         else:
-            log.debug('Unrecognised action type: %s' % self.command.actionType)
+            log.debug('Unrecognised action type: %s', self.command.actionType)
             raise ActionException('Unrecognised action type: %s' %
                                   self.command.actionType)
 
     def doExpire(self):
         """Expire the earlier action."""
-        log.debug('Expiring action of {0} on {1}'.format(self.command.name,
-                                                         self.target))
+        log.debug('Expiring action of %s on %s',
+                  self.command.name, self.target)
 
         if self.command.actionType == INACTIVE:
-            log.debug('Expiry of {0}'.format(INACTIVE))
+            log.debug('Expiry of %s', INACTIVE)
 
             # Do nothing.
 
         elif self.command.actionType in ATTACKTYPES:
-            log.debug('Expiry of {0}'.format(self.command.actionType))
+            log.debug('Expiry of %s', self.command.actionType)
             self.target.heal(self.impact)
 
+            if self.caller.recorder:
+                self.caller.recorder.expire(self.caller, self.command,
+                                            self.target, None, self.impact)
+
         elif self.command.actionType == BUFF:
-            log.debug('Expiry of {0}'.format(BUFF))
+            log.debug('Expiry of %s', BUFF)
             self._debuffAttribute()
 
         else:
-            log.debug('Unrecognised action type: {0}'.format(
-                self.command.actionType))
+            log.debug('Unrecognised action type: %s', self.command.actionType)
             raise ActionException('Unrecognised action type: {0}'.format(
                 self.actionType))
 
@@ -209,8 +220,8 @@ class Action(event.Event):
         if self.caller and self.command.actionType in ATTACKTYPES:
             log.debug('Add user-stat damage')
 
-            scaler = random.randint(75, 125)
-            log.debug('Scaler: {0}%'.format(scaler))
+            scaler = caller.rng.randint(75, 125)
+            log.debug('Scaler: %s%%', scaler)
 
             callerdmg = (caller.getAttack(self.command.actionType) *
                          (scaler / 100))
@@ -219,8 +230,8 @@ class Action(event.Event):
         targetdef = self.caller.getDefence() / 100
 
         self.impact = int((basedmg + callerdmg) * (1 - targetdef))
-        log.debug('Damage calculated: "({0} + {1}) * (1 - {2}) = {3}"'.format(
-            basedmg, callerdmg, targetdef, self.impact))
+        log.debug('Damage calculated: "(%s + %s) * (1 - %s) = %s"',
+                  basedmg, callerdmg, targetdef, self.impact)
 
     def _buffAttribute(self):
         """Applies appropriate buffs to the target's attributes.
@@ -238,14 +249,14 @@ class Action(event.Event):
         self.impact = {}
 
         for attr in self.command.buffAttrs:
-            log.debug('Acting on {0}'.format(attr))
+            log.debug('Acting on %s', attr)
             change = self.target.buff(attr, baseBuff)
 
             # Only record the value if a change occured.
             if change:
                 self.impact[attr] = change
 
-        log.debug('Final impact is: {0}'.format(self.impact))
+        log.debug('Final impact is: %s', self.impact)
 
     def _debuffAttribute(self):
         """Removes the buffs previously applied by this action.
@@ -255,6 +266,12 @@ class Action(event.Event):
         """
         log.debug('Applying debuffs')
 
+        recorder = self.caller.recorder
+
         for attr in self.impact:
-            log.debug('Debuff: {0}'.format(attr))
-            self.target.buff(attr, (-1 * self.impact[attr]))
+            log.debug('Debuff: %s', attr)
+            change = self.target.buff(attr, (-1 * self.impact[attr]))
+
+            if recorder:
+                recorder.expire(self.caller, self.command, self.target, attr,
+                                change)
@@ -4,16 +4,27 @@
 """Module for managing a combat"""
 
 # Python imports.
-import logging as log
+import asyncio
+import contextlib
+import random
 
 # Module imports.
 from utils.exceptions import CombatException
+from utils.logs import combatLog as log
+import combat.combatlist as combatlist
 import combat.event as event
+import combat.scheduler as scheduler
+import combat.summary as summary
+import combat.targets as targets
+import combat.victory as victory
+import units.statstore as statstore
 import units.unit as unit
 import display.interface as intface
 
-# Victory conditions.
+# Victory conditions.  Conditions taking arguments, such as those in
+# _combat.victory_, are given as instances instead.
 DEATHMATCH = 0
+LASTSTANDING = 1
 
 LIST_LIMIT = 4
 
@@ -29,21 +40,66 @@ UNITINFO = """%s %d/%d
 class Combat:
     """Class for managing, handling and displaying hostile combats"""
 
-    def __init__(self, units, victory=DEATHMATCH):
-        """Initialises a new combat"""
+    def __init__(self, units, victory=DEATHMATCH, headless=False,
+                 seed=None, recorder=None, mass=False, sink=None):
+        """Initialises a new combat
+
+        A _headless_ combat displays nothing, so all of its units must be
+        automated.
+
+        While it runs, the combat's output is written through _sink_ if
+        given (see _display.interface_), and otherwise through the sink of
+        the interface.  Headless combats are given a null sink, so their
+        output is never even formatted.
+
+        All random choices in the combat are drawn from a stream of its own,
+        so a combat given a _seed_ always plays out the same way.
+
+        Everything which happens in the combat is written to _recorder_, if
+        given.
+
+        A _mass_ combat is one of many units.  Its automated units pick
+        targets from pools of live units (see _combat.targets_), and those
+        due in the same lap choose their actions together before resolving
+        them.  Units never target the dead, so a seed plays out differently
+        than in an ordinary combat.  The stats of its units are moved into a
+        stat store (see _units.statstore_), for changes in bulk.
+
+        """
         log.debug('Initialise a new combat')
 
         self.units = units
+        self.headless = headless
+        self.turns = 0
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.recorder = recorder
+        self.mass = mass
+
+        if sink is None and headless:
+            sink = intface.NullSink()
+        self.sink = sink
+
+        if headless and not all(unt.auto for unt in units):
+            raise CombatException('Headless combats require automated units')
+
         self._setVictoryCond(victory)
         self._setupCombat()
 
-    def _setVictoryCond(self, victoryCondId):
+    def _setVictoryCond(self, victoryCond):
         """Sets the victory condition for the combat"""
         log.debug('Set victory condition')
 
-        victoryCond = {DEATHMATCH: self.conditionDeathmatch}
+        if isinstance(victoryCond, int):
+            victoryConds = {DEATHMATCH: victory.Deathmatch,
+                            LASTSTANDING: victory.LastStanding}
+            if victoryCond not in victoryConds:
+                raise CombatException('Unknown victory condition %d' %
+                                      victoryCond)
+            victoryCond = victoryConds[victoryCond]()
 
-        self.checkCombatEnd = victoryCond[victoryCondId]
+        victoryCond.validate(self)
+        self.victory = victoryCond
 
     def _setupCombat(self):
         """Sets up the combat.
@@ -52,29 +108,32 @@ class Combat:
         of the units involved."""
         log.debug('Set up combat IDs')
 
-        self.nextActive = 0
         names = {}
 
-        self.combatList = []
+        self.combatList = combatlist.CombatList()
+        self.scheduler = scheduler.Scheduler()
+
+        # Units which have died since the last clean-up.
+        self._dead = []
         for entry in self.units:
-            log.debug('Adding %s to combat-list.' % entry)
+            log.debug('Adding %s to combat-list.', entry)
 
             if entry.uniqueName:
-                log.debug('Use unique name "{0}"'.format(entry.uniqueName))
+                log.debug('Use unique name "%s"', entry.uniqueName)
                 idn = entry.uniqueName
             else:
-                log.debug('Use non-unique ID "{0}"'.format(entry.unitId))
+                log.debug('Use non-unique ID "%s"', entry.unitId)
                 idn = entry.unitId
 
             if idn in names:
-                log.debug('Increment name {0}, previous usage: {1}'.format(
-                          idn, names[idn]))
+                log.debug('Increment name %s, previous usage: %s',
+                          idn, names[idn])
                 if entry.uniqueName:
-                    log.error('Unique name already in use: "{0}"'.format(
-                              entry.uniqueName))
+                    log.error('Unique name already in use: "%s"',
+                              entry.uniqueName)
                 names[idn] += 1
             else:
-                log.debug('New name: {0}'.format(idn))
+                log.debug('New name: %s', idn)
                 names[idn] = 0
 
             if entry.uniqueName and names[idn] == 0:
@@ -84,130 +143,381 @@ class Combat:
                 log.debug('Set non-unique name')
                 entry.name = ''.join([idn, str(names[idn])])
 
-            self.combatList.append(entry)
+            entry.rng = self.rng
+            entry.recorder = self.recorder
+            self._addEntry(entry)
+
+        self.attached = False
+        self.targetPools = None
+        self.teamSummaries = None
+        self.statStore = None
+        if self.mass:
+            self.statStore = statstore.StatStore(self.units)
+
+        if self.recorder:
+            self.recorder.start(self.seed, self.units)
+
+    def attach(self):
+        """Starts listening to the units of the combat
+
+        The victory condition, the combat itself and, as the combat needs
+        them, target pools and team summaries listen to the units only while
+        attached.  A run attaches the combat for its duration; it may also
+        be attached to look at a combat outside of a run, and should then be
+        detached afterwards so that its units may join other combats.
+
+        """
+        if self.attached:
+            return
+        log.debug('Attaching combat to its units')
+
+        self.victory.attach(self)
+        for entry in self.units:
+            entry.hpListeners.append(self._unitChanged)
+
+        if self.mass:
+            self.targetPools = targets.TargetPools(self.units)
+        if any(unt.auto and unt.policy.summaries for unt in self.units):
+            self.teamSummaries = summary.TeamSummaries(self.units)
+        self.attached = True
+
+    def detach(self):
+        """Stops listening to the units of the combat"""
+        if not self.attached:
+            return
+        log.debug('Detaching combat from its units')
+
+        self.victory.detach()
+        for entry in self.units:
+            entry.hpListeners.remove(self._unitChanged)
+
+        if self.targetPools:
+            self.targetPools.detach()
+            self.targetPools = None
+        if self.teamSummaries:
+            self.teamSummaries.detach()
+            self.teamSummaries = None
+        self.attached = False
+
+    def _addEntry(self, entry):
+        """Adds a unit or event to the end of the combatlist"""
+        self.combatList.append(entry)
+        self.scheduler.add(entry)
+
+    def _unitChanged(self, unt, alive):
+        """Listener for a unit dying or coming back to life"""
+        if not alive:
+            self._dead.append(unt)
 
     def _cleanUnits(self):
         """Remove dead units from the combatlist"""
         log.debug('Removing dead units')
 
-        for unt in self.combatList:
-            log.debug('Check unit: {0}'.format(unt))
-            if isinstance(unt, unit.Unit) and unt.state() == unit.DEAD:
-                log.info('Remove dead unit: {0}'.format(unt.name))
-                self.combatList.remove(unt)
+        (dead, self._dead) = (self._dead, [])
+        for unt in dead:
+            if unt.state() == unit.DEAD and unt in self.combatList:
+                log.info('Remove dead unit: %s', unt.name)
+                self._removeEntry(unt)
+
+    def _removeEntry(self, entry):
+        """Removes a unit or event from the combatlist"""
+        self.combatList.remove(entry)
+
+        if entry in self.scheduler:
+            self.scheduler.remove(entry)
+
+    def run(self, maxTurns=None):
+        """Runs a combat
+
+        Returns the list of victorious team IDs, or None if the combat is
+        still undecided after _maxTurns_ turns.
+
+        A combat with a player's unit is run by _runAsync_ in an event loop
+        of its own, so should be run that way from within a running event
+        loop.
+
+        """
+        if not all(unt.auto for unt in self.units):
+            return asyncio.run(self.runAsync(maxTurns))
 
-    def run(self):
-        """Runs a combat"""
         log.info('Running combat')
+        self._checkCanRun()
+
+        self.attach()
+        try:
+            with self._output():
+                while (len(self.units) > 0):
+                    if maxTurns is not None and self.turns >= maxTurns:
+                        log.info('Combat undecided after %d turns',
+                                 self.turns)
+                        return self._finish(None)
+
+                    victors = self._takeBatch(self._nextBatch(maxTurns))
+                    if victors is not None:
+                        log.debug('Combat finished, outcome victors: %s',
+                                  ', '.join(victors))
+                        return self._finish(victors)
+        finally:
+            self.detach()
+
+        #----------------------------------------------------------------------
+        # Unexpected exit of run function.
+        #----------------------------------------------------------------------
+        raise CombatException('Unexpected exit of running combat')
+
+    async def runAsync(self, maxTurns=None, background=()):
+        """Runs a combat, as _run_, as a coroutine
+
+        The choices of a player's units are awaited without blocking the
+        event loop, and other tasks are given a chance to run between
+        turns.  Each of _background_ is a coroutine function which is called
+        with the combat and run as a task alongside it, such as lookahead
+        for upcoming automated units or map pathfinding; any still running
+        are cancelled when the combat ends.
 
-        if not self.checkCombatEnd:
+        """
+        log.info('Running combat asynchronously')
+        self._checkCanRun()
+
+        self.attach()
+        tasks = [asyncio.ensure_future(task(self)) for task in background]
+        try:
+            with self._output():
+                while (len(self.units) > 0):
+                    if maxTurns is not None and self.turns >= maxTurns:
+                        log.info('Combat undecided after %d turns',
+                                 self.turns)
+                        return self._finish(None)
+
+                    batch = self._nextBatch(maxTurns)
+                    if len(batch) == 1:
+                        victors = await self._takeTurnAsync(batch[0])
+                    else:
+                        victors = self._takeBatch(batch)
+
+                    if victors is not None:
+                        log.debug('Combat finished, outcome victors: %s',
+                                  ', '.join(victors))
+                        return self._finish(victors)
+
+                    await asyncio.sleep(0)
+        finally:
+            self.detach()
+            await self._stopTasks(tasks)
+
+        #----------------------------------------------------------------------
+        # Unexpected exit of run function.
+        #----------------------------------------------------------------------
+        raise CombatException('Unexpected exit of running combat')
+
+    def _checkCanRun(self):
+        """Checks the combat has the conditions it needs to run"""
+        if not self.victory:
             log.error('No combat end conditions set')
             raise CombatException('No combat end conditions set')
 
-        while (len(self.units) > 0):
-            nextEvent = self.spin()
-            log.debug('Next event: %s' % nextEvent)
+    @contextlib.contextmanager
+    def _output(self):
+        """Writes the output of the interface through the combat's sink,
+        if it has one, for the duration of a run
+
+        """
+        if self.sink is None:
+            yield
+            return
+
+        previous = intface.setSink(self.sink)
+        try:
+            yield
+        finally:
+            self.sink.flush()
+            intface.setSink(previous)
+
+    @staticmethod
+    async def _stopTasks(tasks):
+        """Cancels the background _tasks_ of a run, logging any which
+        failed
+
+        """
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                log.error('Background task failed: %r', result)
+
+    def _nextBatch(self, maxTurns):
+        """Returns the entries taking the next turns, as a batch for
+        _takeBatch_
 
-            intface.printRefresh()
+        """
+        if self.mass:
+            limit = None if maxTurns is None else maxTurns - self.turns
+            return self.spinBatch(limit)
+        return [self.spin()]
+
+    def _takeTurn(self, nextEvent, plan=None):
+        """Takes the turn of an entry, following its _plan_ if given.
+
+        Returns the victors, or None if the combat has not ended.
+
+        """
+        self._startTurn(nextEvent)
+        return self._endTurn(nextEvent, plan)
+
+    async def _takeTurnAsync(self, nextEvent):
+        """Takes the turn of an entry, as _takeTurn_, awaiting the choice of
+        a player's unit
+
+        """
+        if not isinstance(nextEvent, unit.Unit) or nextEvent.auto:
+            return self._takeTurn(nextEvent)
+
+        self._startTurn(nextEvent)
+        plan = await nextEvent.planAsync(self.units)
+        return self._endTurn(nextEvent, plan)
+
+    def _startTurn(self, nextEvent):
+        """Starts the turn of an entry, displaying the combat"""
+        log.debug('Next event: %s', nextEvent)
+        self.turns += 1
+
+        if intface.sink.enabled:
+            intface.startFrame()
             intface.printSpacer()
             intface.printBlank()
             self.printStatus()
             self.printOrder()
             intface.printBlank()
             intface.printSpacer()
+            intface.endFrame()
+
+    def _endTurn(self, nextEvent, plan):
+        """Resolves the turn of an entry, following its _plan_ if given.
 
+        Returns the victors, or None if the combat has not ended.
+
+        """
+        if plan is None:
             newEvent = nextEvent.turn(self.units)
-            if newEvent:
-                log.debug('Add new event to the combatlist: {0}'.format(
-                    newEvent))
-                self.combatList.append(newEvent)
+        else:
+            newEvent = nextEvent.act(*plan)
+
+        if newEvent:
+            log.debug('Add new event to the combatlist: %s', newEvent)
+            self._addEntry(newEvent)
+
+        self._cleanUnits()
+
+        return self.checkCombatEnd()
+
+    def _takeBatch(self, batch):
+        """Takes the turns of a batch of entries from _spinBatch_
+
+        Automated units in the batch choose their actions first, then each
+        is resolved in turn.  A unit killed earlier in the batch loses its
+        turn, and one whose target was killed chooses again.
+
+        Returns the victors, or None if the combat has not ended.
+
+        """
+        if len(batch) == 1:
+            return self._takeTurn(batch[0])
+
+        plans = [entry.plan(self.units) for entry in batch]
 
-            self._cleanUnits()
+        for (entry, plan) in zip(batch, plans):
+            if entry.state() == unit.DEAD:
+                log.debug('%s died before its turn', entry.name)
+                continue
 
-            victors = self.checkCombatEnd()
+            if plan[1] is not None and plan[1].state() == unit.DEAD:
+                plan = entry.plan(self.units)
+
+            victors = self._takeTurn(entry, plan)
             if victors is not None:
-                log.debug('Combat finished, outcome victors: {0}'.format(
-                    ', '.join(victors)))
                 return victors
 
-        #----------------------------------------------------------------------
-        # Unexpected exit of run function.
-        #----------------------------------------------------------------------
-        raise CombatException('Unexpected exit of running combat')
+        return None
+
+    def _finish(self, victors):
+        """Ends the combat, returning its victors"""
+        if self.recorder:
+            self.recorder.end(victors, self.turns)
+        return victors
 
-    def activelist(self):
-        """Returns the active combatlist"""
-        return (self.combatList[self.nextActive:] +
-                self.combatList[:self.nextActive])
+    def activelist(self, count=None):
+        """Returns the active combatlist, or its first _count_ entries"""
+        return self.combatList.active(count)
 
     def spin(self):
         """Cycle the combat to the next action"""
         log.debug('Spinning cycle')
-        cycles = 0
 
-        #----------------------------------------------------------------------
-        # For safety ensure we find a result within 500 cycles.
-        #----------------------------------------------------------------------
-        while cycles < 500:
-            for action in self.activelist():
-                log.debug('Checking %s' % action)
-                result = action.checkValid()
+        (action, result) = self.scheduler.pop()
+        log.debug('Found next event: %s', action)
 
-                if result is not event.SILENT:
-                    log.debug('Found next event: %s' % action)
-                    if result is event.POP_DIE:
-                        self.combatList.remove(action)
-                    self.nextActive = self.combatList.index(action) + 1
+        if self.recorder:
+            self.recorder.tick = self.scheduler.lap
 
-                    if self.nextActive > len(self.combatList):
-                        self.nextActive = 0
-                    return action
+        self.combatList.acted(action)
+        if result is event.POP_DIE:
+            self.combatList.remove(action)
+        return action
 
-            cycles += 1
-        log.error('Cycle span for too long without a result')
-        raise CombatException
+    def spinBatch(self, limit=None):
+        """Cycle the combat to the next actions, returning their entries
 
-    #--------------------------------------------------------------------------
-    # Combat end conditions.
-    #
-    # These return either 'None' (no winner - yet), or by returning a
-    # list of the winning team IDs.
-    #--------------------------------------------------------------------------
-    def conditionDeathmatch(self):
-        """Traditional match to the death.
+        Automated units due in the same lap as the next entry, and directly
+        after it, are taken together, up to _limit_ entries.  Other entries
+        are taken alone.
+
+        """
+        batch = [self.spin()]
+
+        def batched(entry):
+            return isinstance(entry, unit.Unit) and entry.auto
+
+        if batched(batch[0]):
+            lap = self.scheduler.lap
+            while limit is None or len(batch) < limit:
+                upcoming = self.scheduler.peek()
+                if (upcoming is None or upcoming[0] != lap or
+                        not batched(upcoming[1])):
+                    break
+                batch.append(self.spin())
 
-        Victory occurs when all teams have removed their oppositions.
+        log.debug('Batch of %d entries', len(batch))
+        return batch
+
+    def _checkCondition(self, condition):
+        """Checks _condition_ for the victors of the combat, attaching it for
+        the check
 
         """
-        log.debug('Checking condition "Deathmatch"')
+        condition.attach(self)
+        try:
+            return condition.check()
+        finally:
+            condition.detach()
 
-        liveTeams = {}
-        matchFin = True
+    def checkCombatEnd(self):
+        """Returns the victors, or None if the combat has not ended
 
-        for unt in self.units:
-            log.debug('Checking unit {0}'.format(unt))
-            if unt.state() != unit.DEAD and unt.team.teamId not in liveTeams:
-                log.debug('Add new live team: {0}'.format(unt.team.teamId))
-                liveTeams[unt.team.teamId] = unt.team.allies
-
-        log.debug('Live teams: {0}'.format(', '.join(liveTeams.keys())))
-
-        for team, allies in liveTeams.items():
-            log.debug('Check team {0} with allies: {1}'.format(team,
-                      ', '.join(allies)))
-
-            for otherTeam in liveTeams.keys():
-                log.debug('Check team {0}'.format(otherTeam))
-                if otherTeam not in allies:
-                    log.debug('Enemy team still standing')
-                    matchFin = False
-
-        if matchFin:
-            log.debug('Battle finished')
-            return [tm for tm in liveTeams.keys()]
-        else:
-            log.debug('Battle incomplete')
-            return None
+        Outside of a run, the victory condition is attached for the check,
+        scanning the units of the combat.
+
+        """
+        if self.attached:
+            return self.victory.check()
+        return self._checkCondition(self.victory)
+
+    def conditionDeathmatch(self):
+        """Returns the victors of a deathmatch, or None if one has not ended,
+        whatever the victory condition of the combat
+
+        """
+        return self._checkCondition(victory.Deathmatch())
 
     #--------------------------------------------------------------------------
     # Combat display handling.
@@ -254,16 +564,17 @@ class Combat:
             log.debug('Limit combat list to next four units')
             numToPrint = LIST_LIMIT
 
-        if numToPrint > len(self.activelist()):
+        upcoming = self.activelist(numToPrint)
+        if numToPrint > len(upcoming):
             raise CombatException
 
         intface.printText('Upcoming turns:')
-        intface.printText('  ' + ', '.join([entry.name for entry in
-                                            self.activelist()[:numToPrint]]))
+        intface.printText('  ' + ', '.join([entry.name
+                                            for entry in upcoming]))
 
     def printCommands(self, unit):
         """Prints commands available for the next turn"""
-        log.debug('Printing commands for %s' % unit.name)
+        log.debug('Printing commands for %s', unit.name)
 
         intface.printText('Available actions for %s:' % unit.name)
         intface.printText('  %s' % unit.listCommands())
@@ -0,0 +1,107 @@
+#------------------------------------------------------------------------------
+# Module: combatlist
+#------------------------------------------------------------------------------
+"""Module for the turn order of a combat.
+
+The combat list holds the entries (units and events) of a combat in the order
+they joined, along with the position of the next entry to act, so that the
+upcoming turns can be listed round-robin from there.
+
+Entries are kept in slots which never move while the entry is present; a
+removed entry leaves an empty slot behind.  Adding, removing and marking an
+entry as having acted do not depend on the number of entries.  Once empty
+slots outnumber entries the list is compacted, which keeps the cost of
+removal constant on average.
+
+"""
+
+# Module imports.
+from utils.exceptions import CombatException
+from utils.logs import combatLog as log
+
+# Fewest empty slots worth compacting.
+MINCOMPACT = 16
+
+
+class CombatList:
+    """Class for ordering the entries of a combat"""
+
+    def __init__(self, entries=()):
+        """Initialises a combat list holding _entries_"""
+        self.slots = []
+        self.positions = {}
+        self.nextSlot = 0
+
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, entry):
+        return entry in self.positions
+
+    def __iter__(self):
+        """Iterates over the entries in the order they joined"""
+        return (entry for entry in self.slots if entry is not None)
+
+    def append(self, entry):
+        """Adds an entry after all current entries"""
+        if entry in self.positions:
+            raise CombatException('%s is already in the combat list' % entry)
+
+        self.positions[entry] = len(self.slots)
+        self.slots.append(entry)
+
+    def remove(self, entry):
+        """Removes an entry, leaving its slot empty"""
+        slot = self.positions.pop(entry)
+        self.slots[slot] = None
+
+        empty = len(self.slots) - len(self.positions)
+        if empty >= MINCOMPACT and empty > len(self.positions):
+            self._compact()
+
+    def acted(self, entry):
+        """Marks an entry as having acted, so that the list continues from
+        the entry after it
+
+        After the last entry acts, entries added before the next turn are
+        the next to act.
+
+        """
+        self.nextSlot = self.positions[entry] + 1
+
+    def _compact(self):
+        """Drops the empty slots"""
+        log.debug('Compacting combat list of %d slots', len(self.slots))
+
+        nextSlot = None
+        entries = []
+        for (slot, entry) in enumerate(self.slots):
+            if slot == self.nextSlot:
+                nextSlot = len(entries)
+            if entry is not None:
+                entries.append(entry)
+
+        self.slots = entries
+        self.positions = {entry: slot for (slot, entry) in enumerate(entries)}
+        self.nextSlot = len(entries) if nextSlot is None else nextSlot
+
+    def active(self, count=None):
+        """Returns up to _count_ entries, in the order they will next be
+        reached round-robin
+
+        """
+        if count is None:
+            count = len(self.positions)
+
+        entries = []
+        total = len(self.slots)
+        for offset in range(total):
+            if len(entries) >= count:
+                break
+            entry = self.slots[(self.nextSlot + offset) % total]
+            if entry is not None:
+                entries.append(entry)
+        return entries
@@ -4,15 +4,18 @@
 """Contains class information on unit commands"""
 
 # Python imports.
-import logging as log
-import configparser
 import random
 
 # Module imports.
 from utils.exceptions import CommandException
-from utils.config import getBool
+from utils.logs import combatLog as log
+import utils.logs as logs
+import utils.registry as registry
 from combat.action import Action
-from display.interface import userInput
+from display.interface import userInput, userInputAsync
+
+# Prompt for a player's choice of target.
+TARGETPROMPT = 'Targets available for action:'
 
 
 class Command:
@@ -20,50 +23,57 @@ class Command:
 
     def __init__(self, inputId):
         """Initialises a new command object"""
-        log.debug('New Command Object, ID: %s' % inputId)
+        log.debug('New Command Object, ID: %s', inputId)
 
         self.commandId = inputId
 
-        config = configparser.ConfigParser()
-        config.read('custom/command.ini')
-
-        if self.commandId not in config.sections():
-            log.error('Invalid command ID: %s' % self.commandId)
+        allCommands = registry.commands()
+        if self.commandId not in allCommands:
+            log.error('Invalid command ID: %s', self.commandId)
             raise CommandException
 
-        def getConfig(field):
-            return config.get(self.commandId, field)
+        definition = allCommands[self.commandId]
 
         self.name = self.commandId
-        self.description = getConfig('description')
+        self.description = definition.description
 
-        self.selfOnly = getBool(getConfig('self'))
-        self.offensive = getBool(getConfig('offensive'))
+        self.selfOnly = definition.selfOnly
+        self.offensive = definition.offensive
 
-        self.amount = int(getConfig('amount'))
-        self.actionType = getConfig('type')
+        self.amount = definition.amount
+        self.actionType = definition.actionType
 
-        rawAttrs = getConfig('buffattr').split(',')
-        self.buffAttrs = [attr.strip() for attr in rawAttrs
-                          if attr.strip() is not '']
+        self.buffAttrs = list(definition.buffAttrs)
 
-        self.delay = int(getConfig('delay'))
+        self.delay = definition.delay
         if self.delay:
             log.debug('Delayed action')
-            self.delayDescription = getConfig('delay_description')
+            self.delayDescription = definition.delayDescription
 
-        self.expiry = int(getConfig('expiry'))
+        self.expiry = definition.expiry
         if self.expiry:
-            self.expiryDescription = getConfig('expiry_description')
+            self.expiryDescription = definition.expiryDescription
+
+    def getTarget(self, targets, allies, auto=False, rng=random, pools=None):
+        """Gets a target for an action
 
-    def getTarget(self, targets, allies, auto=False):
-        """Gets a target for an action"""
-        log.debug('Getting a target, excluding allies: {0}'.format(
-                  ', '.join(allies)))
+        Automated targets are chosen using the random stream _rng_, from
+        the live units in the target _pools_ of a mass combat if given, and
+        otherwise from _targets_.  A pool may be empty, giving no target.
+
+        """
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Getting a target, excluding allies: %s',
+                      ', '.join(allies))
 
         if auto:
             log.debug('Unit is automated')
 
+            if pools is not None:
+                if self.offensive:
+                    return pools.enemies(allies).choice(rng)
+                return pools.friends(allies).choice(rng)
+
             if self.offensive:
                 log.debug('Offensive attack')
                 validTargets = [unit for unit in targets
@@ -73,12 +83,20 @@ class Command:
                 validTargets = [unit for unit in targets
                                 if unit.team.name in allies]
 
-            log.debug('Choice of target from: {0}'.format(', '.join(
-                      [unit.name for unit in validTargets])))
-            return random.choice(validTargets)
+            if log.isEnabledFor(logs.DEBUG):
+                log.debug('Choice of target from: %s',
+                          ', '.join([unit.name for unit in validTargets]))
+            return rng.choice(validTargets)
+
+        return userInput(TARGETPROMPT, [act for act in (targets)])
 
-        return userInput('Targets available for action:',
-                         [act for act in (targets)])
+    async def getTargetAsync(self, targets):
+        """Gets a player's target for an action, from _targets_, without
+        blocking the event loop
+
+        """
+        log.debug('Getting a target, asynchronously')
+        return await userInputAsync(TARGETPROMPT, list(targets))
 
     def activate(self, caller, target):
         """Performs the command.
@@ -87,7 +105,7 @@ class Command:
         return the action as an event for the combat to activate later.
 
         """
-        log.debug('Activating command: {0}'.format(self.name))
+        log.debug('Activating command: %s', self.name)
 
         newAction = Action(self, caller, target)
 
@@ -0,0 +1,234 @@
+#------------------------------------------------------------------------------
+# Module: estimate
+#------------------------------------------------------------------------------
+"""Module for estimating the damage done by commands.
+
+Rather than playing out combats, damage rolls are drawn in bulk with NumPy and
+worked through as arrays, following the same sums as _Action_:
+   damage = int((amount + attack * scaler / 100) * (1 - defence / 100))
+where the scaler is drawn uniformly from 75 to 125.  As in _Action_, the
+defence applied is that of the unit making the attack.
+
+Buffs are applied to a unit's stats as _Unit.buff_ applies them, clamped to
+the range of each stat, before any rolls are made.
+
+NumPy is an optional dependency, only needed for estimates.  Estimates may be
+printed for every attacking command and pairing of units with:
+   python -m combat.estimate
+
+"""
+
+# Python imports.
+import argparse
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Module imports.
+from utils.exceptions import CombatException
+from utils.logs import combatLog as log
+import utils.registry as registry
+import combat.action as action
+import units.unit as unit
+
+# Range of the damage scaler, as a percentage.
+SCALERMIN = 75
+SCALERMAX = 125
+
+# Default number of rolls per estimate.
+ROLLS = 1000000
+TRIALS = 100000
+
+# Most hits considered when finding the time to kill.
+MAXHITS = 1000
+
+# Largest block of rolls drawn at once.
+BLOCKSIZE = 1 << 22
+
+# Percentiles reported for distributions.
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _requireNumpy():
+    """Raises an exception if NumPy is not available"""
+    if numpy is None:
+        raise CombatException('Damage estimates require NumPy')
+
+
+def buffedStats(unitId, buffs=()):
+    """Returns the stats of a unit type after applying buff commands
+
+    _buffs_ is a sequence of command IDs, applied in turn.
+
+    """
+    templates = registry.unitTemplates()
+    if unitId not in templates:
+        raise CombatException('Unknown unit "%s"' % unitId)
+
+    stats = dict(templates[unitId].stats)
+    commands = registry.commands()
+
+    for buffId in buffs:
+        definition = commands[buffId]
+        if definition.actionType != action.BUFF:
+            raise CombatException('Command "%s" is not a buff' % buffId)
+
+        for attr in definition.buffAttrs:
+            # Hitpoints start full, so cannot be buffed above the maximum.
+            upper = stats[unit.HP] if attr == unit.HP else unit.MAXSTAT
+            stats[attr] = min(max(stats[attr] + definition.amount, 0), upper)
+
+    return stats
+
+
+def damageRolls(amount, attack, defence, scalers):
+    """Returns the damage dealt for each of an array of _scalers_"""
+    return ((amount + attack * (scalers / 100)) *
+            (1 - defence / 100)).astype(numpy.int64)
+
+
+def _attack(commandId, attackerId, buffs):
+    """Returns the command definition and attacking stats for an attack"""
+    definition = registry.commands()[commandId]
+    if definition.actionType not in action.ATTACKTYPES:
+        raise CombatException('Command "%s" is not an attack' % commandId)
+
+    stats = buffedStats(attackerId, buffs)
+    return (definition, stats[definition.actionType], stats[unit.DEF], stats)
+
+
+def _distribution(values):
+    """Summarises an array of values"""
+    return {'mean': float(values.mean()),
+            'min': values.min().item(),
+            'max': values.max().item(),
+            'percentiles': dict(zip(PERCENTILES,
+                                    numpy.percentile(values, PERCENTILES,
+                                                     method='inverted_cdf')
+                                    .tolist()))}
+
+
+def damageDistribution(commandId, attackerId, buffs=(), rolls=ROLLS,
+                       seed=None):
+    """Estimates the damage of a single use of a command"""
+    log.debug('Estimate damage of %s by %s', commandId, attackerId)
+    _requireNumpy()
+
+    (definition, attack, defence, stats) = _attack(commandId, attackerId,
+                                                   buffs)
+
+    rng = numpy.random.default_rng(seed)
+    scalers = rng.integers(SCALERMIN, SCALERMAX + 1, size=rolls)
+    return _distribution(damageRolls(definition.amount, attack, defence,
+                                     scalers))
+
+
+def timeToKill(commandId, attackerId, defenderId, buffs=(), trials=TRIALS,
+               seed=None):
+    """Estimates the time for an attacker to kill a defender with a command
+
+    The attacker is taken to use only this command, on every turn.  Returns
+    distributions of the number of hits and the number of ticks; trials in
+    which the defender survives _MAXHITS_ hits count as infinite.
+
+    """
+    log.debug('Estimate time for %s to kill %s with %s',
+              attackerId, defenderId, commandId)
+    _requireNumpy()
+
+    (definition, attack, defence, stats) = _attack(commandId, attackerId,
+                                                   buffs)
+    hitpoints = buffedStats(defenderId)[unit.HP]
+
+    # Damage only grows with the scaler, so the smallest roll bounds the
+    # number of hits needed.
+    least = damageRolls(definition.amount, attack, defence,
+                        numpy.array([SCALERMIN]))[0]
+    if least <= 0:
+        maxHits = MAXHITS
+    else:
+        maxHits = max(min(math.ceil(hitpoints / least), MAXHITS), 1)
+
+    rng = numpy.random.default_rng(seed)
+    hits = numpy.empty(trials)
+    blockTrials = max(1, BLOCKSIZE // maxHits)
+
+    for start in range(0, trials, blockTrials):
+        count = min(blockTrials, trials - start)
+        scalers = rng.integers(SCALERMIN, SCALERMAX + 1,
+                               size=(count, maxHits))
+        dealt = numpy.cumsum(damageRolls(definition.amount, attack, defence,
+                                         scalers), axis=1)
+
+        killed = dealt >= hitpoints
+        block = killed.argmax(axis=1) + 1.0
+        block[~killed[:, -1]] = numpy.inf
+        hits[start:start + count] = block
+
+    # Units act every _speed_ ticks; delayed commands land later still.
+    ticks = hits * max(stats[unit.SPE], 1) + definition.delay
+
+    return {'hits': _distribution(hits), 'ticks': _distribution(ticks)}
+
+
+def estimateAll(rolls=ROLLS, trials=TRIALS, seed=None):
+    """Estimates every attacking command for every pairing of unit types
+
+    Returns a mapping of (command ID, attacker ID, defender ID) to a mapping
+    of 'damage', 'hits' and 'ticks' distributions.
+
+    """
+    _requireNumpy()
+
+    attacks = [commandId
+               for (commandId, definition) in registry.commands().items()
+               if definition.actionType in action.ATTACKTYPES]
+    unitIds = list(registry.unitTemplates())
+
+    estimates = {}
+    for commandId in attacks:
+        for attackerId in unitIds:
+            damage = damageDistribution(commandId, attackerId, rolls=rolls,
+                                        seed=seed)
+            for defenderId in unitIds:
+                estimate = timeToKill(commandId, attackerId, defenderId,
+                                      trials=trials, seed=seed)
+                estimate['damage'] = damage
+                estimates[(commandId, attackerId, defenderId)] = estimate
+
+    return estimates
+
+
+def main():
+    """Estimate entry point"""
+    parser = argparse.ArgumentParser(
+        description='Estimate command damage and time to kill.')
+    parser.add_argument('--rolls', type=int, default=ROLLS,
+                        help='Damage rolls per estimate (default: '
+                             '%(default)s)')
+    parser.add_argument('--trials', type=int, default=TRIALS,
+                        help='Kills per estimate (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed')
+    args = parser.parse_args()
+
+    estimates = estimateAll(args.rolls, args.trials, args.seed)
+
+    print('%-12s %-8s %-8s %8s %18s %18s' %
+          ('command', 'attacker', 'defender', 'damage', 'hits p5/50/95',
+           'ticks p5/50/95'))
+    for ((commandId, attackerId, defenderId), estimate) in sorted(
+            estimates.items()):
+        (hits, ticks) = (estimate['hits']['percentiles'],
+                         estimate['ticks']['percentiles'])
+        print('%-12s %-8s %-8s %8.2f %18s %18s' %
+              (commandId, attackerId, defenderId,
+               estimate['damage']['mean'],
+               '%g/%g/%g' % (hits[5], hits[50], hits[95]),
+               '%g/%g/%g' % (ticks[5], ticks[50], ticks[95])))
+
+if __name__ == '__main__':
+    main()
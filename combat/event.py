@@ -3,10 +3,9 @@
 #-----------------------------------------------------------------------------
 """Contains class information on combat events"""
 
-# Python imports.
-import logging as log
-
 # Module imports.
+from utils.logs import combatLog as log
+import utils.logs as logs
 import utils.counter as counter
 
 # Timer types.
@@ -20,14 +19,14 @@ class Event:
 
     def __init__(self, count, recurring=False):
         """Initialise a new event"""
-        log.debug('Initializing new event %s' % self)
+        log.debug('Initializing new event %s', self)
 
-        self.time = counter.Counter(count)
+        self.time = counter.FastCounter(count)
         self.recurring = recurring
 
     def expire(self):
         """Behaviour when a event expires"""
-        log.debug('Event %s expired' % self)
+        log.debug('Event %s expired', self)
 
         if self.recurring:
             self.time.reset()
@@ -37,10 +36,10 @@ class Event:
 
     def checkValid(self):
         """Reduce and check the event timer"""
-        log.debug('Checking event timer %s' % self)
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Checking event timer %s', self)
 
-        self.time.reduce(1)
-        if self.time.getValue() is 0:
+        if self.time.tick():
             return self.expire()
         return SILENT
 
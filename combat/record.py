@@ -0,0 +1,395 @@
+#------------------------------------------------------------------------------
+# Module: record
+#------------------------------------------------------------------------------
+"""Binary records of combats.
+
+A combat given a _Recorder_ writes one record for each thing which happens
+in it, so that it can be replayed, or analysed, without being played out
+again.  A record log is laid out as:
+   header       - magic and version.
+   records      - any number of records, each a kind and the tick (the
+                  scheduler lap) in which it happened, then fields which
+                  depend on the kind.
+
+Each combat is a self-contained run of records, from its _START_ to its
+_END_, so the records of separate combats may be written to one log in any
+order.  Unit IDs, team IDs, names, commands and attributes are written once
+per combat as _STRING_ records, and referred to after by number.
+
+The kinds of record are:
+   STRING       - (string number, text)
+   START        - (whether seeded, seed, number of units)
+   UNIT         - (unit number, unit ID, team ID, name) and its stats.
+   ATTACK       - (actor, command, target, damage)
+   BUFF         - (actor, command, target, attribute, change)
+   EXPIRE       - (actor, command, target, attribute, change); attacks which
+                  expire heal their target, with no attribute.
+   INACTIVE     - (actor, command, target)
+   END          - (turns, number of victors) and the victorious team IDs;
+                  an undecided combat has _UNDECIDED_ victors.
+
+Logs may be summarised with:
+   python -m combat.record <log file>
+
+"""
+
+# Python imports.
+import argparse
+import collections
+import mmap
+import struct
+
+# Module imports.
+from utils.exceptions import RecordException
+from utils.logs import combatLog as log
+import units.unit as unit
+import combat.action as action
+
+MAGIC = b'MCBT'
+VERSION = 1
+
+HEADER = struct.Struct('<4sH')
+RECORD = struct.Struct('<BI')
+LENGTH = struct.Struct('<H')
+NUMBER = struct.Struct('<H')
+
+# Record kinds.
+STRING = 0
+START = 1
+UNIT = 2
+ATTACK = 3
+BUFF = 4
+EXPIRE = 5
+INACTIVE = 6
+END = 7
+
+# Stats recorded for each unit, after its current and maximum hitpoints.
+STATS = tuple(unit.SIMATTR) + tuple(action.ATTACKTYPES)
+
+FIELDS = {STRING: struct.Struct('<H'),
+          START: struct.Struct('<?qH'),
+          UNIT: struct.Struct('<HHHHii' + 'i' * len(STATS)),
+          ATTACK: struct.Struct('<HHHi'),
+          BUFF: struct.Struct('<HHHHi'),
+          EXPIRE: struct.Struct('<HHHHi'),
+          INACTIVE: struct.Struct('<HHH'),
+          END: struct.Struct('<IH')}
+
+# Attribute number of expiring attacks, and victor count of undecided
+# combats.
+NOATTR = 0xffff
+UNDECIDED = 0xffff
+
+Record = collections.namedtuple('Record', ['kind', 'tick', 'fields'])
+
+
+def writeHeader(stream):
+    """Writes the log header to an empty _stream_"""
+    stream.write(HEADER.pack(MAGIC, VERSION))
+
+
+def openLog(path):
+    """Returns a recorder appending to the log at _path_"""
+    stream = open(path, 'ab')
+    if stream.tell() == 0:
+        writeHeader(stream)
+    return Recorder(stream)
+
+
+class Recorder:
+    """Class for writing the records of combats.
+
+    The records of each combat are gathered in memory and written to
+    _stream_ in one go when it ends.  Without a stream, they are kept
+    until taken with _getvalue_.
+
+    """
+
+    def __init__(self, stream=None):
+        """Sets up a recorder writing to _stream_, if given"""
+        self.stream = stream
+        self.tick = 0
+        self._buffer = bytearray()
+        self._strings = {}
+        self._units = {}
+
+    def _write(self, kind, *fields):
+        """Adds a record to the current combat"""
+        self._buffer += RECORD.pack(kind, self.tick)
+        self._buffer += FIELDS[kind].pack(*fields)
+
+    def _string(self, text):
+        """Returns the number of a string, recording it if new"""
+        number = self._strings.get(text)
+        if number is None:
+            number = len(self._strings)
+            self._strings[text] = number
+            data = text.encode('utf-8')
+            self._write(STRING, number)
+            self._buffer += LENGTH.pack(len(data)) + data
+        return number
+
+    def _attr(self, attr):
+        """Returns the number of an attribute, or _NOATTR_"""
+        return NOATTR if attr is None else self._string(attr)
+
+    def start(self, seed, units):
+        """Records the start of a combat and its units"""
+        log.debug('Recording combat of %d units', len(units))
+
+        self.tick = 0
+        self._strings = {}
+        self._units = {}
+
+        self._write(START, seed is not None, seed or 0, len(units))
+        for (index, unt) in enumerate(units):
+            self._units[unt] = index
+            hitpoints = unt.attributes[unit.HP]
+            stats = ([unt.attributes[attr].value for attr in unit.SIMATTR] +
+                     [unt.getAttack(attType)
+                      for attType in action.ATTACKTYPES])
+            self._write(UNIT, index, self._string(unt.unitId),
+                        self._string(unt.team.teamId), self._string(unt.name),
+                        hitpoints.value, hitpoints.maximum, *stats)
+
+    def attack(self, caller, command, target, impact):
+        """Records an attack"""
+        self._write(ATTACK, self._units[caller], self._string(command.name),
+                    self._units[target], impact)
+
+    def buff(self, caller, command, target, attr, change):
+        """Records a change to one attribute by a buff"""
+        self._write(BUFF, self._units[caller], self._string(command.name),
+                    self._units[target], self._attr(attr), change)
+
+    def expire(self, caller, command, target, attr, change):
+        """Records the expiry of an action"""
+        self._write(EXPIRE, self._units[caller], self._string(command.name),
+                    self._units[target], self._attr(attr), change)
+
+    def inactive(self, caller, command, target):
+        """Records an action with no effect"""
+        self._write(INACTIVE, self._units[caller],
+                    self._string(command.name), self._units[target])
+
+    def end(self, victors, turns):
+        """Records the end of a combat, writing out its records"""
+        log.debug('Recording end of combat after %d turns', turns)
+
+        if victors is None:
+            self._write(END, turns, UNDECIDED)
+        else:
+            numbers = [self._string(teamId) for teamId in victors]
+            self._write(END, turns, len(numbers))
+            self._buffer += b''.join(NUMBER.pack(num) for num in numbers)
+
+        if self.stream:
+            self.stream.write(self._buffer)
+            self.stream.flush()
+            self._buffer = bytearray()
+
+    def getvalue(self):
+        """Returns and clears the records kept in memory"""
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+        return data
+
+    def close(self):
+        """Closes the stream"""
+        if self.stream:
+            self.stream.close()
+
+
+#------------------------------------------------------------------------------
+# Reading and replaying.
+#------------------------------------------------------------------------------
+def _readString(buf, offset):
+    """Reads a length-prefixed string, returning it and the next offset"""
+    (length,) = LENGTH.unpack_from(buf, offset)
+    offset += LENGTH.size
+    if offset + length > len(buf):
+        raise struct.error('String overruns buffer')
+    return (bytes(buf[offset:offset + length]).decode('utf-8'),
+            offset + length)
+
+
+def _readRecord(buf, offset, strings):
+    """Reads one record, returning it and the next offset.
+
+    _STRING_ records are added to _strings_, and return no record.
+
+    """
+    (kind, tick) = RECORD.unpack_from(buf, offset)
+    offset += RECORD.size
+    fields = FIELDS[kind].unpack_from(buf, offset)
+    offset += FIELDS[kind].size
+
+    if kind == STRING:
+        (strings[fields[0]], offset) = _readString(buf, offset)
+        return (None, offset)
+
+    if kind == START:
+        strings.clear()
+    elif kind == UNIT:
+        fields = ((fields[0],) + tuple(strings[num] for num in fields[1:4]) +
+                  fields[4:])
+    elif kind in (ATTACK, INACTIVE):
+        fields = (fields[0], strings[fields[1]]) + fields[2:]
+    elif kind in (BUFF, EXPIRE):
+        attr = None if fields[3] == NOATTR else strings[fields[3]]
+        fields = (fields[0], strings[fields[1]], fields[2], attr, fields[4])
+    elif kind == END:
+        (turns, count) = fields
+        if count == UNDECIDED:
+            fields = (turns, None)
+        else:
+            numbers = struct.unpack_from('<%dH' % count, buf, offset)
+            offset += NUMBER.size * count
+            fields = (turns, tuple(strings[num] for num in numbers))
+
+    return (Record(kind, tick, fields), offset)
+
+
+def readRecords(buf, offset=0):
+    """Yields the records in _buf_ from _offset_.
+
+    Numbered strings are replaced by their text, and attributes of
+    _NOATTR_ by None.
+
+    """
+    strings = {}
+
+    while offset < len(buf):
+        try:
+            (nextRecord, offset) = _readRecord(buf, offset, strings)
+        except (struct.error, KeyError, UnicodeDecodeError):
+            log.error('Invalid combat record at offset %d', offset)
+            raise RecordException('Invalid record at offset %d' % offset)
+
+        if nextRecord:
+            yield nextRecord
+
+
+class ReplayUnit:
+    """The state of a unit rebuilt from records"""
+
+    def __init__(self, fields):
+        """Sets up a unit from its _UNIT_ record fields"""
+        (self.index, self.unitId, self.teamId, self.name,
+         hitpoints, self.maxHitpoints) = fields[:6]
+        self.stats = dict(zip(STATS, fields[6:]))
+        self.stats[unit.HP] = hitpoints
+
+    @property
+    def hitpoints(self):
+        """Returns the unit's current hitpoints"""
+        return self.stats[unit.HP]
+
+    def alive(self):
+        """Returns whether the unit is alive"""
+        return self.stats[unit.HP] > 0
+
+    def changeHitpoints(self, amount):
+        """Changes the hitpoints of a live unit, as its counter would"""
+        if self.alive():
+            self.stats[unit.HP] = min(max(self.hitpoints + amount, 0),
+                                      self.maxHitpoints)
+
+
+class CombatReplay:
+    """A combat rebuilt from its records"""
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.units = []
+        self.records = []
+        self.victors = None
+        self.turns = 0
+        self.ticks = 0
+
+    def apply(self, record):
+        """Applies a record to the state of the combat"""
+        self.records.append(record)
+        self.ticks = record.tick
+
+        if record.kind == UNIT:
+            self.units.append(ReplayUnit(record.fields))
+
+        elif record.kind == ATTACK:
+            self.units[record.fields[2]].changeHitpoints(-record.fields[3])
+
+        elif record.kind == BUFF:
+            (actor, command, target, attr, change) = record.fields
+            self.units[target].stats[attr] += change
+
+        elif record.kind == EXPIRE:
+            (actor, command, target, attr, change) = record.fields
+            if attr is not None:
+                self.units[target].stats[attr] += change
+            else:
+                self.units[target].changeHitpoints(change)
+
+        elif record.kind == END:
+            (self.turns, self.victors) = record.fields
+
+
+def replay(buf):
+    """Yields the combats recorded in a log held in _buf_"""
+    try:
+        (magic, version) = HEADER.unpack_from(buf, 0)
+    except struct.error:
+        raise RecordException('Combat log is truncated')
+
+    if magic != MAGIC or version != VERSION:
+        raise RecordException('Unrecognised combat log format')
+
+    current = None
+    for record in readRecords(buf, HEADER.size):
+        if record.kind == START:
+            (seeded, seed, count) = record.fields
+            current = CombatReplay(seed if seeded else None)
+        elif current is None:
+            raise RecordException('Record before the start of a combat')
+
+        current.apply(record)
+
+        if record.kind == END:
+            yield current
+            current = None
+
+    if current is not None:
+        raise RecordException('Combat log ends part way through a combat')
+
+
+def replayFile(path):
+    """Yields the combats recorded in the log at _path_"""
+    log.debug('Replaying combat log %s', path)
+
+    with open(path, 'rb') as source:
+        try:
+            mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise RecordException('Combat log %s is empty' % path)
+
+    with mapping:
+        yield from replay(mapping)
+
+
+def main():
+    """Record summary entry point"""
+    parser = argparse.ArgumentParser(
+        description='Summarise the combats in a combat log.')
+    parser.add_argument('path', help='Combat log to read')
+    args = parser.parse_args()
+
+    for replayed in replayFile(args.path):
+        victors = ('undecided' if replayed.victors is None else
+                   ', '.join(replayed.victors) or 'none')
+        print('Seed %s: %d turns, %d ticks, victors: %s' %
+              (replayed.seed, replayed.turns, replayed.ticks, victors))
+        for unt in replayed.units:
+            print('  %-10s %-10s %d/%d' % (unt.name, unt.teamId,
+                                            unt.hitpoints, unt.maxHitpoints))
+
+if __name__ == '__main__':
+    main()
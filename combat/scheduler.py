@@ -0,0 +1,143 @@
+#------------------------------------------------------------------------------
+# Module: scheduler
+#------------------------------------------------------------------------------
+"""Module for scheduling combat events.
+
+Combat entries (units and events) take turns as their timers run out.  The
+combat checks its entries round-robin, in the order they joined, reducing
+each timer by one per check; the first entry whose timer reaches zero acts,
+and checking resumes from the entry after it.
+
+Rather than performing each check, the scheduler works out when each entry
+will fire: a full pass over the entries is a 'lap', and an entry with _n_
+checks left fires on the _n_th lap in which it is checked.  Entries are kept
+in a heap keyed on (lap, join order), so finding the next entry to act does
+not depend on timer values or on visiting every entry.
+
+"""
+
+# Python imports.
+import heapq
+
+# Module imports.
+from utils.exceptions import CombatException
+from utils.logs import combatLog as log
+import combat.event as event
+
+# Entry fields.
+LAP = 0
+SEQ = 1
+ITEM = 2
+
+
+class Scheduler:
+    """Class for finding the next combat entry to act"""
+
+    def __init__(self):
+        """Initialises an empty scheduler"""
+        log.debug('Initialise a new scheduler')
+
+        self.heap = []
+        self.entries = {}
+        self.lap = 0
+        self.pointer = -1
+        self._nextSeq = 0
+        self._pending = None
+
+    def __contains__(self, item):
+        return item in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _fireLap(self, seq, item):
+        """Returns the lap in which an entry's timer will next run out"""
+        # A timer already at zero still fires on its next check.
+        checks = max(item.time.value, 1)
+
+        if seq > self.pointer:
+            # Still to be checked during the current lap.
+            return self.lap + checks - 1
+        return self.lap + checks
+
+    def _push(self, entry):
+        """Queues an entry"""
+        entry[LAP] = self._fireLap(entry[SEQ], entry[ITEM])
+        heapq.heappush(self.heap, entry)
+
+    def add(self, item):
+        """Adds an entry after all current entries"""
+        log.debug('Schedule %s', item)
+
+        if item in self.entries:
+            raise CombatException('%s is already scheduled' % item)
+
+        entry = [0, self._nextSeq, item]
+        self._nextSeq += 1
+        self.entries[item] = entry
+        self._push(entry)
+
+    def remove(self, item):
+        """Removes an entry"""
+        log.debug('Unschedule %s', item)
+
+        entry = self.entries.pop(item)
+
+        # Leave a tombstone in the heap, skipped when it surfaces.
+        entry[ITEM] = None
+
+    def pop(self):
+        """Returns the next entry to act and its timer result.
+
+        The result is _event.POP_ if the entry will act again, or
+        _event.POP_DIE_ if it has been removed.
+
+        A recurring entry is requeued on the following call, so that any
+        change it makes to its own timer while acting is honoured.
+
+        """
+        self._requeue()
+
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            item = entry[ITEM]
+            if item is None:
+                continue
+
+            self.lap = entry[LAP]
+            self.pointer = entry[SEQ]
+
+            result = item.expire()
+            if result is event.POP_DIE:
+                log.debug('Entry %s expires', item)
+                del self.entries[item]
+            else:
+                self._pending = entry
+
+            return (item, result)
+
+        log.error('No entries left to schedule')
+        raise CombatException('No entries left to schedule')
+
+    def peek(self):
+        """Returns the lap and item of the next entry to act, without it
+        acting, or None if there are no entries
+
+        """
+        self._requeue()
+
+        while self.heap and self.heap[0][ITEM] is None:
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            return None
+        return (self.heap[0][LAP], self.heap[0][ITEM])
+
+    def _requeue(self):
+        """Queues the last recurring entry to act, if it is still present"""
+        entry = self._pending
+        self._pending = None
+
+        if entry is not None and entry[ITEM] is not None:
+            self._push(entry)
+
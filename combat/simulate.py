@@ -0,0 +1,253 @@
+#------------------------------------------------------------------------------
+# Module: simulate
+#------------------------------------------------------------------------------
+"""Module for running batches of headless combats.
+
+Combats are set up from a roster of (unit ID, team ID) pairs, all units being
+automated, and run once per seed with no display.  Seeds are shared out over
+a pool of worker processes and the results gathered into win rates, turn
+counts and damage distributions.
+
+Each combat draws from its own random stream, seeded per combat, so its
+outcome depends only on its seed and a batch gives the same results whatever
+the number of workers.
+
+The records of every combat may also be written, in order of seed, to a
+combat log (see _combat.record_).
+
+Batches may be run with:
+   python -m combat.simulate mech:rebels,drone:autoarmy --seeds 0:1000
+       --workers 4 [--record <log file>] [--mass]
+
+Roster entries may be given a count, as in 'mech:rebels:500', and large
+rosters run as mass combats (see _combat.targets_).
+
+"""
+
+# Python imports.
+import argparse
+import functools
+import multiprocessing
+
+# Module imports.
+from utils.exceptions import CombatException
+from utils.logs import combatLog as log
+import combat.combat as combat
+import combat.record as record
+import units.unit as unit
+
+# Turns after which a combat is declared a draw.
+MAXTURNS = 1000
+
+# Percentiles reported for distributions.
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Outcome keys for combats without a victor.
+DRAW = 'draw'
+NOVICTOR = 'none'
+
+
+def parseRoster(text):
+    """Parses a roster from 'unit:team,unit:team:count,...'"""
+    roster = []
+    for entry in text.split(','):
+        fields = entry.strip().split(':')
+        try:
+            (unitId, teamId) = fields[:2]
+            count = int(fields[2]) if len(fields) == 3 else 1
+            if len(fields) > 3 or count < 1:
+                raise ValueError
+        except ValueError:
+            raise CombatException('Invalid roster entry "%s"; expected '
+                                  'unit:team[:count]' % entry)
+        roster.extend([(unitId.strip(), teamId.strip())] * count)
+    return roster
+
+
+def parseSeeds(text):
+    """Parses a seed range from 'start:stop', holding at least one seed"""
+    try:
+        (start, stop) = text.split(':')
+        seeds = range(int(start), int(stop))
+    except ValueError:
+        raise CombatException('Invalid seed range "%s"; expected start:stop' %
+                              text)
+    if not seeds:
+        raise CombatException('Empty seed range "%s"; stop must be after '
+                              'start' % text)
+    return seeds
+
+
+def _argument(parse):
+    """Returns _parse_ as an argparse type, so that invalid arguments are
+    reported as usage errors
+
+    """
+    @functools.wraps(parse)
+    def parseArgument(text):
+        try:
+            return parse(text)
+        except CombatException as error:
+            raise argparse.ArgumentTypeError(str(error))
+    return parseArgument
+
+
+def runCombat(roster, seed, maxTurns=MAXTURNS, recorded=False, mass=False):
+    """Runs a single headless combat, returning a summary of its outcome
+
+    If _recorded_, the summary includes the combat's records.  If _mass_,
+    it is run as a mass combat.
+
+    """
+    log.debug('Simulate combat with seed %d', seed)
+
+    recorder = record.Recorder() if recorded else None
+
+    units = [unit.Unit(unitId, teamId) for (unitId, teamId) in roster]
+    newCombat = combat.Combat(units, headless=True, seed=seed,
+                              recorder=recorder, mass=mass)
+    victors = newCombat.run(maxTurns)
+
+    damage = {}
+    for unt in units:
+        hitpoints = unt.attributes[unit.HP]
+        damage[unt.team.teamId] = (damage.get(unt.team.teamId, 0) +
+                                   hitpoints.maximum - hitpoints.value)
+
+    summary = {'seed': seed,
+               'victors': None if victors is None else tuple(victors),
+               'turns': newCombat.turns,
+               'damage': damage}
+    if recorded:
+        summary['record'] = recorder.getvalue()
+    return summary
+
+
+def simulate(roster, seeds, workers=1, maxTurns=MAXTURNS, recordPath=None,
+             mass=False):
+    """Runs a combat of _roster_ for each seed and aggregates the results
+
+    Combats are shared between _workers_ processes.  Their records are
+    appended to the combat log at _recordPath_, if given.  If _mass_, they
+    are run as mass combats.
+
+    """
+    log.info('Simulating %d combats over %d workers', len(seeds), workers)
+
+    job = functools.partial(runCombat, roster, maxTurns=maxTurns,
+                            recorded=recordPath is not None, mass=mass)
+
+    if workers > 1:
+        # Hand out seeds in chunks to amortise the cost of messaging.
+        chunkSize = max(1, len(seeds) // (workers * 8))
+        with multiprocessing.Pool(workers) as pool:
+            results = list(pool.imap_unordered(job, seeds, chunkSize))
+    else:
+        results = [job(seed) for seed in seeds]
+
+    results.sort(key=lambda result: result['seed'])
+
+    if recordPath is not None:
+        with open(recordPath, 'ab') as output:
+            if output.tell() == 0:
+                record.writeHeader(output)
+            for result in results:
+                output.write(result.pop('record'))
+
+    return aggregate(results)
+
+
+def percentiles(values, points=PERCENTILES):
+    """Returns the nearest-rank percentiles of a list of values"""
+    if not values:
+        return {}
+
+    ordered = sorted(values)
+    return {point: ordered[min(len(ordered) - 1,
+                               max(0, -(-point * len(ordered) // 100) - 1))]
+            for point in points}
+
+
+def _distribution(values):
+    """Summarises a list of values"""
+    return {'mean': sum(values) / len(values),
+            'min': min(values),
+            'max': max(values),
+            'percentiles': percentiles(values)}
+
+
+def aggregate(results):
+    """Aggregates the summaries of many combats
+
+    With no combats, there are no win rates, turns or damage to summarise.
+
+    """
+    if not results:
+        return {'combats': 0, 'winRates': {}, 'turns': None, 'damage': {}}
+
+    outcomes = {}
+    damage = {}
+
+    for result in results:
+        if result['victors'] is None:
+            keys = [DRAW]
+        elif not result['victors']:
+            keys = [NOVICTOR]
+        else:
+            keys = result['victors']
+
+        for key in keys:
+            outcomes[key] = outcomes.get(key, 0) + 1
+
+        for (teamId, amount) in result['damage'].items():
+            damage.setdefault(teamId, []).append(amount)
+
+    total = len(results)
+    return {'combats': total,
+            'winRates': {key: count / total
+                         for (key, count) in outcomes.items()},
+            'turns': _distribution([result['turns'] for result in results]),
+            'damage': {teamId: _distribution(amounts)
+                       for (teamId, amounts) in damage.items()}}
+
+
+def main():
+    """Simulate entry point"""
+    parser = argparse.ArgumentParser(
+        description='Run batches of headless, automated combats.')
+    parser.add_argument('roster', type=_argument(parseRoster),
+                        help='Combatants, as unit:team[:count],...')
+    parser.add_argument('--seeds', type=_argument(parseSeeds),
+                        default=range(100),
+                        help='Range of seeds, as start:stop (default: 0:100)')
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--max-turns', type=int, default=MAXTURNS,
+                        help='Turns before a draw (default: %(default)s)')
+    parser.add_argument('--record', metavar='PATH', default=None,
+                        help='Combat log to append records to')
+    parser.add_argument('--mass', action='store_true',
+                        help='Run as mass combats, for large rosters')
+    args = parser.parse_args()
+
+    summary = simulate(args.roster, args.seeds, args.workers, args.max_turns,
+                       args.record, args.mass)
+
+    print('Combats: %d' % summary['combats'])
+    print('Win rates:')
+    for (key, rate) in sorted(summary['winRates'].items()):
+        print('  %-20s %6.2f%%' % (key, rate * 100))
+    if summary['turns'] is not None:
+        print('Turns: mean %.1f, min %d, max %d' % (summary['turns']['mean'],
+                                                     summary['turns']['min'],
+                                                     summary['turns']['max']))
+    print('Damage taken:')
+    for (teamId, dist) in sorted(summary['damage'].items()):
+        print('  %-20s mean %.1f, percentiles %s' %
+              (teamId, dist['mean'],
+               ', '.join('p%d=%d' % item
+                         for item in sorted(dist['percentiles'].items()))))
+
+if __name__ == '__main__':
+    main()
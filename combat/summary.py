@@ -0,0 +1,145 @@
+#------------------------------------------------------------------------------
+# Module: summary
+#------------------------------------------------------------------------------
+"""Module for the hitpoint summaries of the teams in a combat.
+
+A summary watches the hitpoints of each unit of a team and keeps:
+   live         - the number of live units.
+   hitpoints    - the total hitpoints of the live units.
+   maxHitpoints - the total maximum hitpoints of the live units.
+   lowest       - the live unit with fewest hitpoints, found from a heap
+                  whose out-of-date entries are dropped when they surface;
+                  ties go to the unit first in the combat.
+so that policies of automated units (see _units.policy_) can weigh up teams
+without searching the units of the combat.
+
+"""
+
+# Python imports.
+import heapq
+import itertools
+
+# Module imports.
+from utils.logs import combatLog as log
+import units.unit as unit
+
+# Fewest heap entries worth rebuilding the heap for.
+MINREBUILD = 16
+
+
+class TeamSummary:
+    """Hitpoints of the live units of one team"""
+
+    def __init__(self, teamId):
+        self.teamId = teamId
+        self.units = []
+        self.live = 0
+        self.hitpoints = 0
+        self.maxHitpoints = 0
+        self._heap = []
+        self._pushes = itertools.count()
+
+    def fraction(self):
+        """Returns the fraction of its live units' hitpoints the team has"""
+        if not self.maxHitpoints:
+            return 0
+        return self.hitpoints / self.maxHitpoints
+
+    def push(self, index, unt):
+        """Adds an entry for a live unit at its current hitpoints"""
+        heapq.heappush(self._heap, (unt.attributes[unit.HP].value, index,
+                                    next(self._pushes), unt))
+
+        if len(self._heap) > 2 * len(self.units) + MINREBUILD:
+            self._rebuild()
+
+    def _rebuild(self):
+        """Drops the out-of-date heap entries"""
+        log.debug('Rebuilding summary heap of team %s', self.teamId)
+
+        latest = {}
+        for entry in self._heap:
+            (hitpoints, index, push, unt) = entry
+            if hitpoints == unt.attributes[unit.HP].value and hitpoints:
+                latest[unt] = entry
+
+        self._heap = list(latest.values())
+        heapq.heapify(self._heap)
+
+    def lowestEntry(self):
+        """Returns the heap entry, ending with the unit, of the live unit
+        with fewest hitpoints, or None
+
+        """
+        heap = self._heap
+        while heap:
+            (hitpoints, index, push, unt) = heap[0]
+            if hitpoints and hitpoints == unt.attributes[unit.HP].value:
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    def lowest(self):
+        """Returns the live unit with fewest hitpoints, or None"""
+        entry = self.lowestEntry()
+        return None if entry is None else entry[-1]
+
+
+class TeamSummaries:
+    """Class for keeping the team summaries of a combat's units"""
+
+    def __init__(self, units):
+        """Starts summarising _units_, and gives the summaries to each unit"""
+        log.debug('Summarising the teams of %d units', len(units))
+
+        self.units = list(units)
+        self.teams = {}
+        self._index = {}
+        self._hitpoints = {}
+
+        for (index, unt) in enumerate(self.units):
+            teamId = unt.team.teamId
+            if teamId not in self.teams:
+                self.teams[teamId] = TeamSummary(teamId)
+            summary = self.teams[teamId]
+            summary.units.append(unt)
+
+            self._index[unt] = index
+            self._hitpoints[unt] = 0
+            self.unitChanged(unt)
+
+            unt.teamSummaries = self
+            unt.hpWatchers.append(self.unitChanged)
+
+    def detach(self):
+        """Stops summarising the units"""
+        for unt in self.units:
+            unt.teamSummaries = None
+            unt.hpWatchers.remove(self.unitChanged)
+
+    def unitChanged(self, unt):
+        """Watcher for a change in the hitpoints of a unit"""
+        summary = self.teams[unt.team.teamId]
+        hitpoints = unt.attributes[unit.HP]
+        previous = self._hitpoints[unt]
+        self._hitpoints[unt] = hitpoints.value
+
+        if bool(previous) != bool(hitpoints.value):
+            change = 1 if hitpoints.value else -1
+            summary.live += change
+            summary.maxHitpoints += change * hitpoints.maximum
+
+        summary.hitpoints += hitpoints.value - previous
+        if hitpoints.value and hitpoints.value != previous:
+            summary.push(self._index[unt], unt)
+
+    def lowestEnemy(self, allies):
+        """Returns the live unit with fewest hitpoints of the teams not in
+        _allies_, or None
+
+        """
+        entries = [summary.lowestEntry()
+                   for (teamId, summary) in self.teams.items()
+                   if teamId not in allies]
+        entries = [entry for entry in entries if entry is not None]
+        return min(entries)[-1] if entries else None
@@ -0,0 +1,115 @@
+#------------------------------------------------------------------------------
+# Module: targets
+#------------------------------------------------------------------------------
+"""Module for the target pools of mass combats.
+
+An automated unit picks a target at random from the live units of teams it is
+hostile to, for offensive commands, or allied to otherwise.  Rather than
+filtering every unit of the combat on each turn, a mass combat keeps a pool
+of live units for each set of allies and kind of command, which listens to
+the units for their hitpoints reaching, or leaving, zero.
+
+Units are added to and removed from a pool, and chosen from it, in constant
+time; the number of pools grows with the number of teams, not of units.
+Removal swaps the last unit of a pool into the gap, so the order of a pool,
+and hence the target a seed gives, differs from that of the filtered list.
+
+"""
+
+# Module imports.
+from utils.logs import combatLog as log
+import units.unit as unit
+
+
+class Pool:
+    """Live units to choose targets from"""
+
+    def __init__(self):
+        self.units = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.units)
+
+    def __contains__(self, unt):
+        return unt in self.positions
+
+    def add(self, unt):
+        """Adds a unit to the pool"""
+        if unt not in self.positions:
+            self.positions[unt] = len(self.units)
+            self.units.append(unt)
+
+    def remove(self, unt):
+        """Removes a unit, moving the last unit into its place"""
+        position = self.positions.pop(unt, None)
+        if position is None:
+            return
+
+        last = self.units.pop()
+        if last is not unt:
+            self.units[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        """Returns a unit chosen using _rng_, or None if the pool is empty"""
+        if not self.units:
+            return None
+        return self.units[rng.randrange(len(self.units))]
+
+
+class TargetPools:
+    """Class for keeping the target pools of a combat's units"""
+
+    def __init__(self, units):
+        """Starts keeping pools of _units_, and gives them to each unit"""
+        log.debug('Keeping target pools for %d units', len(units))
+
+        self.units = list(units)
+        self.pools = {}
+
+        for unt in self.units:
+            unt.targetPools = self
+            unt.hpListeners.append(self.unitChanged)
+
+    def detach(self):
+        """Stops keeping pools of the units"""
+        for unt in self.units:
+            unt.targetPools = None
+            unt.hpListeners.remove(self.unitChanged)
+
+    def _pool(self, allies, offensive):
+        """Returns the pool for _allies_, creating it from the live units"""
+        key = (frozenset(allies), offensive)
+        pool = self.pools.get(key)
+        if pool is None:
+            log.debug('New %s target pool for allies %s',
+                      'offensive' if offensive else 'allied', allies)
+            pool = self.pools[key] = Pool()
+            for unt in self.units:
+                if self._member(key, unt) and unt.state() != unit.DEAD:
+                    pool.add(unt)
+        return pool
+
+    @staticmethod
+    def _member(key, unt):
+        """Returns whether a unit may be a target in the pool for _key_"""
+        (allies, offensive) = key
+        return (unt.team.teamId in allies) != offensive
+
+    def enemies(self, allies):
+        """Returns the pool of live units not allied to _allies_"""
+        return self._pool(allies, True)
+
+    def friends(self, allies):
+        """Returns the pool of live units allied to _allies_"""
+        return self._pool(allies, False)
+
+    def unitChanged(self, unt, alive):
+        """Listener for a unit dying or coming back to life"""
+        for (key, pool) in self.pools.items():
+            if self._member(key, unt):
+                if alive:
+                    pool.add(unt)
+                else:
+                    pool.remove(unt)
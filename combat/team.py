@@ -3,9 +3,9 @@
 #------------------------------------------------------------------------------
 """Contains team information, including allied forces"""
 
-# Python imports.
-import logging as log
-import configparser
+# Module imports.
+from utils.logs import combatLog as log
+import utils.registry as registry
 
 
 class Team:
@@ -13,20 +13,14 @@ class Team:
 
     def __init__(self, inputId):
         """Sets up a team object"""
-        log.debug('New Team Object, ID: %s' % inputId)
+        log.debug('New Team Object, ID: %s', inputId)
         self.teamId = inputId
 
-        config = configparser.ConfigParser()
-        config.read('custom/team.ini')
+        definition = registry.teams()[self.teamId]
 
-        def getConfig(field):
-            return config.get(self.teamId, field)
-
-        self.allies = getConfig('allies').split(',')
-
-        # Implicitly, we must be allied with our own team.
-        if self.teamId not in self.allies:
-            self.allies.append(self.teamId)
+        # Implicitly, we must be allied with our own team; the registry
+        # includes the team itself in its allies.
+        self.allies = list(definition.allies)
 
         self.name = self.teamId
-        self.longName = getConfig('name')
+        self.longName = definition.name
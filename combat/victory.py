@@ -0,0 +1,196 @@
+#------------------------------------------------------------------------------
+# Module: victory
+#------------------------------------------------------------------------------
+"""Module for the victory conditions of combats.
+
+Conditions do not search the units of a combat for survivors.  Instead they
+listen to each unit for its hitpoints reaching, or leaving, zero and keep
+count of:
+   live units   - per team.
+   hostilities  - the number of ordered pairs of live teams (A, B) for
+                  which B is not an ally of A.
+so that checking for the end of a combat does not depend on the number of
+units or teams.
+
+A condition may only be checked while attached to a combat; _Combat_ attaches
+its condition to check it outside of a run.
+
+The conditions available are:
+   Deathmatch   - ends when no live team is hostile to another; the live
+                  teams are the victors.
+   LastStanding - ends when at most one unit is alive; its team is the
+                  victor.
+   Survive      - a team wins by having a unit alive after a number of ticks,
+                  and otherwise as in a deathmatch.
+   ProtectVip   - the teams hostile to a VIP unit win if it dies, and
+                  otherwise as in a deathmatch.
+
+"""
+
+# Module imports.
+from utils.exceptions import CombatException
+from utils.logs import combatLog as log
+import units.unit as unit
+
+
+class Deathmatch:
+    """Traditional match to the death.
+
+    Victory occurs when all teams have removed their oppositions.
+
+    """
+
+    # The combat the condition is attached to, if any.
+    combat = None
+
+    def validate(self, combat):
+        """Checks the condition can be met in _combat_"""
+        pass
+
+    def attach(self, combat):
+        """Starts tracking the units of _combat_"""
+        log.debug('Tracking victory condition %s', type(self).__name__)
+        self.validate(combat)
+
+        self.combat = combat
+        self.units = list(combat.units)
+
+        self.teams = []
+        self.allies = {}
+        self.liveUnits = {}
+        self.liveTotal = 0
+        self.hostilities = 0
+
+        for unt in self.units:
+            teamId = unt.team.teamId
+            if teamId not in self.allies:
+                self.teams.append(teamId)
+                self.allies[teamId] = frozenset(unt.team.allies)
+                self.liveUnits[teamId] = 0
+
+            if unt.state() != unit.DEAD:
+                self._changeLive(teamId, 1)
+            unt.hpListeners.append(self.unitChanged)
+
+    def detach(self):
+        """Stops tracking the units of the combat"""
+        for unt in self.units:
+            unt.hpListeners.remove(self.unitChanged)
+        self.combat = None
+
+    def _hostility(self, teamId):
+        """Returns the hostilities between a team and other live teams"""
+        allies = self.allies[teamId]
+        return sum((other not in allies) + (teamId not in self.allies[other])
+                   for other in self.teams
+                   if other != teamId and self.liveUnits[other])
+
+    def _changeLive(self, teamId, change):
+        """Changes the number of live units of a team"""
+        wasLive = self.liveUnits[teamId] > 0
+        self.liveUnits[teamId] += change
+        self.liveTotal += change
+        isLive = self.liveUnits[teamId] > 0
+
+        if isLive != wasLive:
+            # Teams coming to life or dying change the hostilities between
+            # live teams; units of teams already alive do not.
+            log.debug('Team %s is %s', teamId, 'live' if isLive else 'dead')
+            if isLive:
+                self.hostilities += self._hostility(teamId)
+            else:
+                self.hostilities -= self._hostility(teamId)
+
+    def unitChanged(self, unt, alive):
+        """Listener for a unit dying or coming back to life"""
+        self._changeLive(unt.team.teamId, 1 if alive else -1)
+
+    def victors(self):
+        """Returns the IDs of the live teams, in order of their first live
+        unit
+
+        The stat store of a mass combat finds them from its arrays.
+
+        """
+        if self.combat.statStore is not None:
+            return self.combat.statStore.liveTeams()
+
+        victors = []
+        for unt in self.units:
+            teamId = unt.team.teamId
+            if unt.state() != unit.DEAD and teamId not in victors:
+                victors.append(teamId)
+        return victors
+
+    def check(self):
+        """Returns the victors, or None if the combat has not ended"""
+        if self.combat is None:
+            raise CombatException('Victory condition %s is not attached to '
+                                  'a combat' % type(self).__name__)
+        return self._check()
+
+    def _check(self):
+        """Checks for victory, once attached to a combat"""
+        if self.hostilities:
+            return None
+        log.debug('Battle finished')
+        return self.victors()
+
+
+class LastStanding(Deathmatch):
+    """Match to the death of all but one unit, whatever their alliances"""
+
+    def _check(self):
+        """Checks for victory, once attached to a combat"""
+        if self.liveTotal > 1:
+            return None
+        log.debug('Last unit standing')
+        return self.victors()
+
+
+class Survive(Deathmatch):
+    """Match for a team to survive a number of ticks"""
+
+    def __init__(self, teamId, ticks):
+        """Sets up a condition for _teamId_ to survive _ticks_ ticks"""
+        self.teamId = teamId
+        self.ticks = ticks
+
+    def validate(self, combat):
+        """Checks the team to survive is in _combat_"""
+        if self.teamId not in [unt.team.teamId for unt in combat.units]:
+            raise CombatException('Team %s is not in the combat' %
+                                  self.teamId)
+
+    def _check(self):
+        """Checks for victory, once attached to a combat"""
+        if (self.liveUnits[self.teamId] and
+                self.combat.scheduler.lap >= self.ticks):
+            log.debug('Team %s survived %d ticks', self.teamId, self.ticks)
+            allies = self.allies[self.teamId]
+            return [teamId for teamId in self.victors() if teamId in allies]
+
+        return Deathmatch._check(self)
+
+
+class ProtectVip(Deathmatch):
+    """Match to protect, or to kill, a single unit"""
+
+    def __init__(self, vip):
+        """Sets up a condition to protect the unit _vip_"""
+        self.vip = vip
+
+    def validate(self, combat):
+        """Checks the VIP is in _combat_"""
+        if self.vip not in combat.units:
+            raise CombatException('VIP %s is not in the combat' % self.vip)
+
+    def _check(self):
+        """Checks for victory, once attached to a combat"""
+        if self.vip.state() == unit.DEAD:
+            log.debug('VIP %s has died', self.vip.name)
+            allies = self.allies[self.vip.team.teamId]
+            return [teamId for teamId in self.victors()
+                    if teamId not in allies]
+
+        return Deathmatch._check(self)
@@ -6,15 +6,42 @@
 This handles the output we recieve from Mine.  This means handling the
 formatting of the output in both form and colours.
 
-This will eventually support 8 and 256 colours, but for now only 256-colours
-have been implemented.
+Colour schemes for no colours, 8 colours and 256 colours are rendered on
+import into palettes of escape strings and line templates, so printing a line
+is a single format; the scheme in use may be switched with _setColours_.
+
+Lines printed between _startFrame_ and _endFrame_ make up a frame of the
+_screen_, which is drawn by its differences from the previous frame: only the
+changed span of each changed line is rewritten, after a cursor move, and the
+whole frame is sent to the terminal in a single write.
+
+All output is written through a sink, _sink_, which may be switched with
+_setSink_:
+   Screen       - the terminal, drawing frames by their differences; the
+                  default.
+   StdoutSink   - stdout, batching output until the end of each frame.
+   MemorySink   - memory, for tests and snapshots.
+   NullSink     - nowhere; lines are not even formatted, so headless runs
+                  pay nothing for display.
+
+Input may be read with _userInputAsync_ in place of _userInput_, which waits
+for the player without blocking the event loop it runs in.  Either chooses
+from an _OptionIndex_, by name, unique prefix or number.
 """
 
 # Python imports.
-import logging as log
+import asyncio
+import collections
+import functools
+import itertools
+import os
+import re
+import sys
 
 # Module imports.
 from utils.exceptions import InterfaceException
+from utils.logs import displayLog as log
+import utils.logs as logs
 
 
 class InvalidColours(InterfaceException):
@@ -22,11 +49,11 @@ class InvalidColours(InterfaceException):
 
 INVALID_COLOUR_VALUE = 'Attempted to set colour %d, only %d available.'
 
-# What colours to use for what.
-#
-# Set the appropriate colour function.  This should select the appropriate
-# scheme in the future, but for now hardcode the choice here.
-clrs = 0
+# What colours to use for what: a colour scheme per number of colours
+# available, giving the colour function and the colours used.
+Scheme = collections.namedtuple('Scheme',
+                                ['colour', 'backNorm', 'backHighlight',
+                                 'foreNorm', 'foreSubdued', 'foreHighlight'])
 
 
 def colour_0(value, back):
@@ -56,27 +83,9 @@ def colour_256(value, back):
         key = 38
     return('\033[%d;05;%dm' % (key, value))
 
-if clrs == 256:
-    colour = colour_256
-    BACK_NORM = 234
-    BACK_HIGHLIGHT = 244
-    FORE_NORM = 251
-    FORE_SUBDUED = 242
-    FORE_HIGHLIGHT = 255
-elif clrs == 8:
-    colour = colour_8
-    BACK_NORM = 0
-    BACK_HIGHLIGHT = 4
-    FORE_NORM = 6
-    FORE_SUBDUED = 2
-    FORE_HIGHLIGHT = 7
-else:
-    colour = colour_0
-    BACK_NORM = 0
-    BACK_HIGHLIGHT = 0
-    FORE_NORM = 0
-    FORE_SUBDUED = 0
-    FORE_HIGHLIGHT = 0
+SCHEMES = {0: Scheme(colour_0, 0, 0, 0, 0, 0),
+           8: Scheme(colour_8, 0, 4, 6, 2, 7),
+           256: Scheme(colour_256, 234, 244, 251, 242, 255)}
 
 # What symbols to use for what.
 PROMPT = '>>  '
@@ -84,6 +93,18 @@ EDGE = '|'
 SEPERATOR = '-'
 BLANK = ' '
 
+# Widths of a line within its edges, of padded text, and of each of two
+# columns of text.
+LINEWIDTH = 78
+TEXTWIDTH = 74
+COLUMNWIDTH = 35
+
+# The escape strings and line templates of a colour scheme, rendered once.
+Palette = collections.namedtuple('Palette',
+                                 ['reset', 'subdued', 'highlight',
+                                  'lineStart', 'lineEnd', 'padded', 'text',
+                                  'columns', 'spacer', 'blank'])
+
 
 # Colour application.
 #
@@ -105,128 +126,632 @@ def applyColours(fore_col, back_col):
     return(applyColour(fore_col, False) + applyColour(back_col, True))
 
 
-def hightlitColours(fore_col=FORE_HIGHLIGHT, back_col=BACK_NORM):
-    """Sets text and background colours and applies a bold font."""
+def hightlitColours(fore_col=None, back_col=None):
+    """Sets text and background colours and applies a bold font.
+
+    The colours default to those of the scheme in use.
+
+    """
+    if fore_col is None and back_col is None:
+        return(palette.highlight)
+    if fore_col is None:
+        fore_col = FORE_HIGHLIGHT
+    if back_col is None:
+        back_col = BACK_NORM
     return(bold() + applyColours(fore_col, back_col))
 
 
 def subduedColours():
     """Resets the text and background colours to subdued."""
-    return(applyColours(FORE_SUBDUED, BACK_NORM))
+    return(palette.subdued)
 
 
 def resetColours():
     """Resets the text and background colours to default."""
-    return(applyColours(FORE_NORM, BACK_NORM))
+    return(palette.reset)
 
 
 def cleanColours():
     """Removes all formatting."""
     return('\033[0m')
 
-# Format definitions.
-INTLINESTART = (subduedColours() + EDGE + resetColours())
-INTLINEEND = (subduedColours() + EDGE)
+
+def _compile(scheme):
+    """Renders the escape strings and line templates of a colour scheme"""
+    def escapes(fore_col, back_col):
+        return(scheme.colour(fore_col, False) + scheme.colour(back_col, True))
+
+    reset = escapes(scheme.foreNorm, scheme.backNorm)
+    subdued = escapes(scheme.foreSubdued, scheme.backNorm)
+    lineStart = subdued + EDGE + reset
+    lineEnd = subdued + EDGE
+
+    def template(*fields):
+        """Returns a padded line template of _fields_, four spaces apart"""
+        return(lineStart + 2 * BLANK + (4 * BLANK).join(fields) +
+               2 * BLANK + lineEnd)
+
+    return Palette(
+        reset=reset,
+        subdued=subdued,
+        highlight=bold() + escapes(scheme.foreHighlight, scheme.backNorm),
+        lineStart=lineStart,
+        lineEnd=lineEnd,
+        padded=template('{}'),
+        text=template('{:%s<%d}' % (BLANK, TEXTWIDTH)),
+        columns=template(*['{:%s<%d}' % (BLANK, COLUMNWIDTH)] * 2),
+        spacer=lineStart + subdued + SEPERATOR * LINEWIDTH + lineEnd,
+        blank=template(BLANK * TEXTWIDTH))
+
+# Palettes of every colour scheme.
+PALETTES = {count: _compile(scheme) for (count, scheme) in SCHEMES.items()}
+
+
+def setColours(count):
+    """Switches to the colour scheme for _count_ colours"""
+    global clrs, colour, palette, INTLINESTART, INTLINEEND
+    global BACK_NORM, BACK_HIGHLIGHT, FORE_NORM, FORE_SUBDUED, FORE_HIGHLIGHT
+
+    if count not in SCHEMES:
+        log.error('No colour scheme for %s colours', count)
+        raise InvalidColours('No colour scheme for %s colours' % count)
+
+    log.debug('Using %d colours', count)
+    clrs = count
+    (colour, BACK_NORM, BACK_HIGHLIGHT, FORE_NORM, FORE_SUBDUED,
+     FORE_HIGHLIGHT) = SCHEMES[count]
+
+    # Format definitions.
+    palette = PALETTES[count]
+    INTLINESTART = palette.lineStart
+    INTLINEEND = palette.lineEnd
+
+# Set the appropriate colour scheme.  This should select the appropriate
+# scheme in the future, but for now hardcode the choice here; it may be
+# switched at any time with _setColours_.
+setColours(0)
+
+
+# Terminal control sequences.
+ESCAPE = re.compile(r'\033\[[0-9;]*[A-Za-z]')
+CLEAR_SCREEN = '\033[2J'
+CLEAR_LINE = '\033[K'
+CLEAR_BELOW = '\033[J'
+MOVE_CURSOR = '\033[%d;%dH'
+
+
+@functools.lru_cache(maxsize=256)
+def _cells(line):
+    """Splits a line into (style, character) cells.
+
+    The style of a cell is every escape sequence before it in the line.
+    Lines are split only when they change, and the lines of recent frames
+    are remembered.
+
+    """
+    cells = []
+    style = ''
+    start = 0
+    for match in ESCAPE.finditer(line):
+        cells.extend((style, char) for char in line[start:match.start()])
+        style += match.group()
+        start = match.end()
+    cells.extend((style, char) for char in line[start:])
+    return tuple(cells)
+
+
+class Sink:
+    """Base class of the sinks output is written through"""
+
+    # Whether output is wanted at all; lines are formatted only if it is.
+    enabled = True
+
+    def write(self, text):
+        """Writes _text_ as it is"""
+        raise NotImplementedError
+
+    def writeLine(self, line):
+        """Writes a line of output"""
+        self.write(line + '\n')
+
+    def startFrame(self):
+        """Starts a frame of output"""
+        pass
+
+    def endFrame(self):
+        """Ends a frame of output"""
+        self.flush()
+
+    def invalidate(self):
+        """Forgets what has been drawn, so the next frame is drawn in full"""
+        pass
+
+    def flush(self):
+        """Sends on any output held back"""
+        pass
+
+
+class NullSink(Sink):
+    """A sink discarding all output"""
+
+    enabled = False
+
+    def write(self, text):
+        """Discards _text_"""
+        pass
+
+    def writeLine(self, line):
+        """Discards _line_"""
+        pass
+
+    def endFrame(self):
+        """Ends a frame, which was never drawn"""
+        pass
+
+
+class MemorySink(Sink):
+    """A sink keeping all output in memory, and each frame separately"""
+
+    def __init__(self):
+        """Sets up an empty sink"""
+        self.clear()
+
+    def clear(self):
+        """Forgets all output so far"""
+        self.parts = []
+        self.frames = []
+        self._frameStart = None
+
+    def write(self, text):
+        """Keeps _text_"""
+        self.parts.append(text)
+
+    def startFrame(self):
+        """Starts a frame of output"""
+        self._frameStart = len(self.parts)
+
+    def endFrame(self):
+        """Keeps the output of the frame as one of _frames_"""
+        if self._frameStart is not None:
+            self.frames.append(''.join(self.parts[self._frameStart:]))
+        self._frameStart = None
+
+    def getvalue(self):
+        """Returns all output so far"""
+        return ''.join(self.parts)
+
+    def lines(self):
+        """Returns all output so far as a list of lines"""
+        return self.getvalue().splitlines()
+
+
+class StdoutSink(Sink):
+    """A sink writing to _stream_, or to stdout, in batches
+
+    Output is held until the end of each frame, or until input is asked
+    for, and is then sent in a single write.
+
+    """
+
+    def __init__(self, stream=None):
+        """Sets up a sink writing to _stream_, or to stdout"""
+        self.stream = stream
+        self.parts = []
+
+    def write(self, text):
+        """Holds _text_ until the next flush"""
+        self.parts.append(text)
+
+    def flush(self):
+        """Writes all output held, in a single write"""
+        if not self.parts:
+            return
+        (output, self.parts) = (''.join(self.parts), [])
+
+        stream = self.stream or sys.stdout
+        stream.write(output)
+        stream.flush()
+
+
+class Screen(Sink):
+    """A terminal screen, drawn by the differences between frames
+
+    Output outside of frames is written straight to the terminal.
+
+    """
+
+    def __init__(self, stream=None):
+        """Sets up a screen writing to _stream_, or to stdout"""
+        self.stream = stream
+        self.lines = None
+        self.frame = None
+
+    def invalidate(self):
+        """Forgets the previous frame, so the next is drawn in full"""
+        self.lines = None
+
+    def startFrame(self):
+        """Starts collecting the lines of a frame"""
+        self.frame = []
+
+    def addLine(self, line):
+        """Adds a line to the frame being collected"""
+        self.frame.extend(line.split('\n'))
+
+    def write(self, text):
+        """Writes _text_ to the terminal"""
+        (self.stream or sys.stdout).write(text)
+
+    def writeLine(self, line):
+        """Writes a line, to the frame being collected if there is one"""
+        if self.frame is not None:
+            self.addLine(line)
+        else:
+            self.write(line + '\n')
+
+    def flush(self):
+        """Flushes the terminal"""
+        (self.stream or sys.stdout).flush()
+
+    def render(self, frame):
+        """Returns the output drawing _frame_ over the previous frame"""
+        output = []
+        previous = self.lines
+        if previous is None:
+            output.append(CLEAR_SCREEN)
+            previous = []
+
+        for (row, line) in enumerate(frame):
+            oldLine = previous[row] if row < len(previous) else ''
+            if line == oldLine:
+                continue
+
+            cells = _cells(line)
+            old = _cells(oldLine)
+
+            first = 0
+            limit = min(len(cells), len(old))
+            while first < limit and cells[first] == old[first]:
+                first += 1
+            last = len(cells)
+            if len(cells) == len(old):
+                while last > first and cells[last - 1] == old[last - 1]:
+                    last -= 1
+
+            output.append(MOVE_CURSOR % (row + 1, first + 1))
+            style = ''
+            for (cellStyle, char) in cells[first:last]:
+                if cellStyle != style:
+                    if not cellStyle.startswith(style):
+                        output.append(cleanColours())
+                        style = ''
+                    output.append(cellStyle[len(style):])
+                    style = cellStyle
+                output.append(char)
+            if style:
+                output.append(cleanColours())
+            if len(cells) < len(old):
+                output.append(CLEAR_LINE)
+
+        # Leave the cursor below the frame, clearing anything printed there.
+        output.append(MOVE_CURSOR % (len(frame) + 1, 1) + CLEAR_BELOW)
+        return ''.join(output)
+
+    def endFrame(self):
+        """Draws the frame collected, in a single write"""
+        (frame, self.frame) = (self.frame, None)
+        output = self.render(frame)
+        self.lines = frame
+        log.debug('Drawing frame of %d lines in %d characters',
+                  len(frame), len(output))
+
+        stream = self.stream or sys.stdout
+        stream.write(output)
+        stream.flush()
+
+
+# The screen combats are drawn to, and the sink all output is written through.
+screen = Screen()
+sink = screen
+
+
+def setSink(newSink):
+    """Writes all output through _newSink_, returning the sink replaced"""
+    global sink
+    log.debug('Writing output through %s', type(newSink).__name__)
+    (previous, sink) = (sink, newSink)
+    return previous
+
+
+def startFrame():
+    """Starts a frame of output; lines are collected until _endFrame_"""
+    log.debug('Starting frame')
+    sink.startFrame()
+
+
+def endFrame():
+    """Ends the frame of output, drawing it"""
+    sink.endFrame()
+
+
+def _output(line):
+    """Outputs a line through the sink"""
+    sink.writeLine(line)
 
 
 def printLine(line, padding=True):
     """Prints the line and handles edge formatting."""
-    log.debug('Print line: "{0}"'.format(line))
+    if not sink.enabled:
+        return
+    if log.isEnabledFor(logs.DEBUG):
+        log.debug('Print line: "%s"', line)
     if padding:
-        log.debug('Add padding')
-        print(INTLINESTART + 2 * BLANK + line + 2 * BLANK + INTLINEEND)
+        _output(palette.padded.format(line))
     else:
-        log.debug('No padding')
-        print(INTLINESTART + line + INTLINEEND)
+        _output(palette.lineStart + line + palette.lineEnd)
 
 
 def printRefresh():
     """Print to clear the screen and reset cursor."""
+    if not sink.enabled:
+        return
     log.debug('Clearing screen')
-    print('\033[2J\033[h')
+    sink.invalidate()
+    sink.write('\033[2J\033[h\n')
 
 
 def printSpacer():
     """Prints a single spacer line"""
-    log.debug('Printing spacer line')
-    printLine((subduedColours() + ('{:%s^78}' % SEPERATOR).format('')),
-              padding=False)
+    if not sink.enabled:
+        return
+    if log.isEnabledFor(logs.DEBUG):
+        log.debug('Printing spacer line')
+    _output(palette.spacer)
 
 
 def printText(text):
     """Prints a single block of text"""
-    log.debug('Printing block of text')
+    if not sink.enabled:
+        return
+    if log.isEnabledFor(logs.DEBUG):
+        log.debug('Printing block of text')
+    template = palette.text
     for line in text.split('\n'):
-        log.debug('Printing line: "{0}"'.format(line))
-        printLine(('{:%s<74}' % BLANK).format(line))
+        _output(template.format(line))
 
 
 def printBlank():
     """Prints a blank line"""
-    log.debug('Printing blank line')
-    printLine(('{:%s^74}' % BLANK).format(''))
+    if not sink.enabled:
+        return
+    if log.isEnabledFor(logs.DEBUG):
+        log.debug('Printing blank line')
+    _output(palette.blank)
 
 
 def printTwoColumns(text1, text2):
     """Prints two columns of text side-by-side"""
-    log.debug('Printing double columns of text')
-    lines1 = text1.split('\n')
-    lines2 = text2.split('\n')
-    max1 = len(lines1)
-    max2 = len(lines2)
-
-    for num in range(max([max1, max2])):
-        log.debug('Printing line {0}'.format(num))
-        if num < max1:
-            log.debug('Column 1 occupied')
-            string1 = lines1[num]
-        else:
-            log.debug('Colummn 1 empty')
-            string1 = ''
-        if num < max2:
-            log.debug('Column 2 occupied')
-            string2 = lines2[num]
-        else:
-            log.debug('Column 2 empty')
-            string2 = ''
+    if not sink.enabled:
+        return
+    if log.isEnabledFor(logs.DEBUG):
+        log.debug('Printing double columns of text')
+    template = palette.columns
+    for (string1, string2) in itertools.zip_longest(text1.split('\n'),
+                                                    text2.split('\n'),
+                                                    fillvalue=''):
+        _output(template.format(string1, string2))
+
+
+class _PrefixNode:
+    """A node of the prefix trie of an option index"""
+
+    __slots__ = ('children', 'option')
+
+    def __init__(self):
+        self.children = {}
+        # The only option under the node, or None if there are several.
+        self.option = None
+
+
+class OptionIndex:
+    """An index of the options of a prompt
+
+    An option may be chosen by its name, ignoring case, by any prefix of its
+    name which no other option shares, or by its number as listed, from 1.
+    The index is built once for a set of options, however many times they
+    are prompted for.
+
+    """
+
+    def __init__(self, options):
+        """Indexes _options_, each of which has a _name_"""
+        self.options = list(options)
+        self.names = {}
+        self.trie = _PrefixNode()
+
+        for option in self.options:
+            name = option.name.lower()
+            self.names.setdefault(name, option)
+
+            node = self.trie
+            for char in name:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _PrefixNode()
+                    child.option = option
+                elif child.option is not option:
+                    child.option = None
+                node = child
+
+        self.listing = ', '.join(['%d %s' % (number, option.name)
+                                  for (number, option)
+                                  in enumerate(self.options, 1)])
+
+    def __len__(self):
+        return len(self.options)
+
+    def match(self, choice):
+        """Returns the option chosen by _choice_, or None"""
+        key = choice.lower()
+        if key in self.names:
+            return self.names[key]
+
+        if key.isdigit():
+            number = int(key)
+            if 1 <= number <= len(self.options):
+                return self.options[number - 1]
+            return None
+
+        node = self.trie
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node.option if key else None
+
 
-        printLine(('{:%s<35}' % BLANK).format(string1) + 4 * BLANK +
-                  ('{:%s<35}' % BLANK).format(string2))
+def _printOptions(promptText, index):
+    """Prints a prompt for a choice from the options of _index_"""
+    printText('\n'.join([promptText, '  ' + index.listing]))
+
+
+def _optionIndex(options):
+    """Returns an index of _options_, which may be an index already"""
+    if isinstance(options, OptionIndex):
+        return options
+    return OptionIndex(options)
 
 
 def userInput(promptText, options):
-    """Gets a users choice for an action"""
+    """Gets a users choice for an action
+
+    _options_ may be a list or an _OptionIndex_ of them; one which is
+    prompted for repeatedly should be indexed once and kept.
+
+    """
     log.debug('Get choice for action')
+    index = _optionIndex(options)
 
-    choice = None
-    while not choice:
+    while True:
         # Get user choice.
-        printText('\n'.join([promptText,
-                            '  ' + ', '.join([o.name for o in options])]))
+        _printOptions(promptText, index)
         choice = _getInput()
+        option = index.match(choice)
+        if option is not None:
+            log.debug('Option matches: %s', option.name)
+            return option
+        log.debug("Invalid response: '%s'", choice)
+
+
+async def userInputAsync(promptText, options):
+    """Gets a users choice for an action, as _userInput_, without blocking
+    the event loop while waiting for it
+
+    """
+    log.debug('Get choice for action, asynchronously')
+    index = _optionIndex(options)
 
-        for option in options:
-            # Case insensitive matching.
-            log.debug('Check option: {0}'.format(option.name))
-            if choice.lower() == option.name.lower():
-                log.debug('Option matches')
-                return option
+    while True:
+        _printOptions(promptText, index)
+        choice = await _getInputAsync()
+        option = index.match(choice)
+        if option is not None:
+            log.debug('Option matches: %s', option.name)
+            return option
+        log.debug("Invalid response: '%s'", choice)
 
-        log.debug('Invalid response: \'%s\'' % choice)
-        choice = None
 
-    log.error('No valid option returned from user input: %s' % choice)
-    raise InterfaceException
+def _promptText():
+    """Returns the prompt shown for input"""
+    return (INTLINESTART +
+            2*BLANK +
+            subduedColours() +
+            PROMPT +
+            resetColours())
 
 
 def _getInput():
     """Gets input"""
     log.debug('Getting user input')
-    response = input(INTLINESTART +
-                     2*BLANK +
-                     subduedColours() +
-                     PROMPT +
-                     resetColours())
+    sink.flush()
+    response = input(_promptText())
     response = response.strip()
-    log.debug('Got user input: \'%s\'' % response)
+    log.debug("Got user input: '%s'", response)
     return response
+
+
+async def _getInputAsync():
+    """Gets input, as _getInput_, without blocking the event loop.
+
+    Where stdin can be watched by the event loop, it is read as input
+    arrives; otherwise, as for a file, a line is read on a worker thread.
+
+    """
+    log.debug('Getting user input, asynchronously')
+    sink.flush()
+    sys.stdout.write(_promptText())
+    sys.stdout.flush()
+
+    stdin = sys.stdin
+    loop = asyncio.get_running_loop()
+    fileno = _watchable(loop, stdin)
+    if fileno is None:
+        log.debug('Reading input on a worker thread')
+        line = await loop.run_in_executor(None, stdin.readline)
+    else:
+        line = await _readLine(loop, fileno,
+                               getattr(stdin, 'encoding', None) or 'utf-8')
+
+    if not line:
+        log.error('End of input reached')
+        raise EOFError
+
+    response = line.strip()
+    log.debug("Got user input: '%s'", response)
+    return response
+
+
+def _watchable(loop, stream):
+    """Returns the file descriptor of _stream_ if _loop_ can watch it, or
+    None
+
+    """
+    try:
+        fileno = stream.fileno()
+        loop.add_reader(fileno, lambda: None)
+    except (AttributeError, NotImplementedError, OSError, ValueError):
+        return None
+    loop.remove_reader(fileno)
+    return fileno
+
+
+# Input read from stdin ahead of the line asked for, by _readLine_.
+_readAhead = bytearray()
+
+
+async def _readLine(loop, fileno, encoding):
+    """Returns the next line read from _fileno_ as it arrives, or an empty
+    string at the end of input
+
+    Input is read unbuffered, as it is waiting, so any beyond the line is
+    kept for the next.
+
+    """
+    while b'\n' not in _readAhead:
+        ready = loop.create_future()
+        loop.add_reader(fileno,
+                        lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fileno)
+
+        data = os.read(fileno, 4096)
+        if not data:
+            break
+        _readAhead.extend(data)
+
+    end = _readAhead.find(b'\n') + 1 or len(_readAhead)
+    line = bytes(_readAhead[:end])
+    del _readAhead[:end]
+    return line.decode(encoding)
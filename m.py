@@ -1,13 +1,11 @@
-import logging as log
-
+import utils.logs as logs
 import maps.field as fi
 import combat.combat as co
 import units.unit as un
 
-log.basicConfig(filename='logs/mine.log',
-                level=log.DEBUG,
-                filemode='w',
-                format='%(levelname)s >> %(message)s')
+# Log to logs/mine.log; set MINE_LOGLEVEL (e.g. 'DEBUG' or 'combat=DEBUG') to
+# log more than warnings.
+logs.setup()
 
 
 def printExit():
@@ -0,0 +1,158 @@
+#-----------------------------------------------------------------------------
+# Module: compiled
+#-----------------------------------------------------------------------------
+"""Binary format for precompiled maps.
+
+A compiled map is laid out as:
+   header       - magic, version, tile type count, height, width, and the
+                  number of items and hostiles.
+   strings      - the map ID, the map name and each tile type ID, as
+                  length-prefixed UTF-8.
+   tile plane   - one tile code per tile, row by row; codes index the tile
+                  type IDs above.
+   item table   - (row, col, object letter) for each item.
+   hostile table - (row, col, hostile letter) for each hostile.
+
+Compiled maps are opened with _mmap_ so that the tile plane is never copied.
+The mapping is copy-on-write; changes to a loaded field are not written back
+to the file.
+
+Maps are compiled with:
+   python -m maps.compiled <map ID> <output file>
+
+"""
+
+# Python imports.
+import argparse
+import collections
+import mmap
+import struct
+
+# Module imports.
+from utils.exceptions import MapException
+from utils.logs import mapsLog as log
+
+MAGIC = b'MINE'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIII')
+LENGTH = struct.Struct('<H')
+ENTRY = struct.Struct('<IIc')
+
+CompiledMap = collections.namedtuple('CompiledMap',
+                                     ['mapId', 'name', 'height', 'width',
+                                      'tileIds', 'codes', 'items',
+                                      'hostiles'])
+
+
+def _packString(text):
+    """Packs a length-prefixed string"""
+    data = text.encode('utf-8')
+    return LENGTH.pack(len(data)) + data
+
+
+def _unpackString(buf, offset):
+    """Unpacks a length-prefixed string, returning it and the next offset"""
+    (length,) = LENGTH.unpack_from(buf, offset)
+    offset += LENGTH.size
+    return (bytes(buf[offset:offset + length]).decode('utf-8'),
+            offset + length)
+
+
+def _packTable(entries):
+    """Packs a table of (row, col, letter) entries"""
+    return b''.join(ENTRY.pack(row, col, letter.encode('ascii'))
+                    for (row, col, letter) in entries)
+
+
+def _unpackTable(buf, offset, count):
+    """Unpacks a table of entries, returning it and the next offset"""
+    end = offset + count * ENTRY.size
+    table = [(row, col, letter.decode('ascii'))
+             for (row, col, letter) in ENTRY.iter_unpack(buf[offset:end])]
+    return (table, end)
+
+
+def writeMap(path, mapId, name, height, width, tileIds, codes, items,
+             hostiles):
+    """Writes a compiled map to _path_"""
+    log.debug('Writing compiled map %s to %s', mapId, path)
+
+    if len(codes) != height * width:
+        raise MapException('Tile plane of %d codes does not fit %dx%d map' %
+                           (len(codes), width, height))
+
+    with open(path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(tileIds), height, width,
+                                 len(items), len(hostiles)))
+        output.write(_packString(mapId))
+        output.write(_packString(name))
+        for tileId in tileIds:
+            output.write(_packString(tileId))
+        output.write(codes)
+        output.write(_packTable(items))
+        output.write(_packTable(hostiles))
+
+
+def openMap(path):
+    """Opens a compiled map, mapping its tile plane from the file"""
+    log.debug('Opening compiled map %s', path)
+
+    with open(path, 'rb') as source:
+        try:
+            mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_COPY)
+        except ValueError:
+            raise MapException('Compiled map %s is empty' % path)
+
+    buf = memoryview(mapping)
+
+    try:
+        (magic, version, tileCount, height, width,
+         itemCount, hostileCount) = HEADER.unpack_from(buf, 0)
+    except struct.error:
+        raise MapException('Compiled map %s is truncated' % path)
+
+    if magic != MAGIC or version != VERSION:
+        log.error('Unrecognised compiled map %s', path)
+        raise MapException('Unrecognised compiled map format in %s' % path)
+
+    offset = HEADER.size
+    (mapId, offset) = _unpackString(buf, offset)
+    (name, offset) = _unpackString(buf, offset)
+
+    tileIds = []
+    for num in range(tileCount):
+        (tileId, offset) = _unpackString(buf, offset)
+        tileIds.append(tileId)
+
+    codes = buf[offset:offset + height * width]
+    offset += height * width
+
+    (items, offset) = _unpackTable(buf, offset, itemCount)
+    (hostiles, offset) = _unpackTable(buf, offset, hostileCount)
+
+    if len(codes) != height * width or offset != len(buf):
+        log.error('Compiled map %s has an invalid size', path)
+        raise MapException('Compiled map %s has an invalid size' % path)
+
+    return CompiledMap(mapId, name, height, width, tileIds, codes, items,
+                       hostiles)
+
+
+def main():
+    """Compile-map entry point"""
+    # Imported here as the field module itself loads compiled maps.
+    import maps.field as field
+
+    parser = argparse.ArgumentParser(
+        description='Compile a map from custom/map.ini to a binary file.')
+    parser.add_argument('mapId', help='ID of the map to compile')
+    parser.add_argument('output', help='File to write the compiled map to')
+    parser.add_argument('--mapfile', default=field.MAPFILE,
+                        help='Map config file (default: %(default)s)')
+    args = parser.parse_args()
+
+    field.Field(args.mapId, mapFile=args.mapfile).compile(args.output)
+
+if __name__ == '__main__':
+    main()
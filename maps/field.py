@@ -4,132 +4,477 @@
 """Contains class for manipulating gameplay fields"""
 
 # Python imports.
+import array
 import configparser
+import functools
 import random
-import logging as log
+import re
 
 # Modules imports.
+from utils.exceptions import MapException
+from utils.logs import mapsLog as log
+import utils.registry as registry
+import maps.compiled as compiled
+import maps.loader as loader
+import maps.region as region
+import maps.spatial as spatial
 import maps.tile as tile
+import display.interface as intface
+
+MAPFILE = 'custom/map.ini'
+
+# Left margin of a printed map.
+SPACER = '  '
+
+# Tile codes are stored as unsigned bytes.
+MAXTILETYPES = 256
+
+# Any non-whitespace character that is not an upper-case tile letter is an
+# occupier of the preceding tile.
+_OCCUPIER = re.compile('[^A-Z]')
 
 
 class Field:
-    """Class for handling and manipulating game maps"""
+    """Class for handling and manipulating game maps
+
+    The grid is held compactly: one shared tile type per tile ID, and a flat
+    array of type codes indexed by (row, col).  Items and hostiles are sparse
+    and are held in dictionaries keyed by their (row, col) position.
+
+    Items and hostiles are also held in spatial indexes for position queries,
+    so they should only be placed, moved or removed through the field (or
+    its tiles) rather than by editing the dictionaries directly.
+
+    """
+
+    def __init__(self, inputId=None, mapFile=MAPFILE, sink=None):
+        """Initialises a new field object from the maps in _mapFile_.
+
+        The map is printed through _sink_ if given, and otherwise through
+        the sink of the interface (see _display.interface_).
 
-    def __init__(self, inputId=None):
-        """Initialises a new field object"""
-        log.debug('New Field, ID: %s' % inputId)
+        """
+        log.debug('New Field, ID: %s', inputId)
 
         self.mapId = inputId
+        self.sink = sink
 
         config = configparser.ConfigParser()
-        config.read('custom/map.ini')
+        config.read(mapFile)
 
         allIds = config.sections()
 
         if self.mapId is None:
             self.mapId = random.choice(allIds)
-            log.debug('Random choice selected %s' % self.mapId)
+            log.debug('Random choice selected %s', self.mapId)
 
         if self.mapId not in allIds:
-            log.error('Unrecognised map ID: %s' % self.mapId)
-            raise Exception
+            log.error('Unrecognised map ID: %s', self.mapId)
+            raise MapException('Unrecognised map ID: %s' % self.mapId)
 
         self.name = config.get(self.mapId, 'name')
-        mapString = config.get(self.mapId, 'mapstring')
 
-        self.__generateField(mapString)
+        with loader.openMap(config, self.mapId) as stream:
+            self.__generateField(loader.iterRows(stream))
 
-    def __generateField(self, mapString):
-        """Generates a grid of tiles from a mapstring"""
+    def __generateField(self, rows):
+        """Generates a grid of tiles from an iterable of map rows"""
         log.debug('Generating new field')
-        log.info('Generating new map; %s' % self.name)
+        log.info('Generating new map; %s', self.name)
 
-        self.grid = []
-        newTile = None
+        self._initGrid()
 
-        for line in mapString.split('\\'):
-            log.debug('Parsing new map-line')
-            newLine = []
+        for line in rows:
+            self._addRow(line)
 
-            #------------------------------------------------------------------
-            # Upper-case letters refer to tiles, the following lower-case
-            # letters refer to occupiers of that tile.
-            #
-            # Whitespace is ignored.
-            #------------------------------------------------------------------
-            for elem in line:
+        if self.height == 0:
+            log.error('Grid for field %s is invalid!', self.mapId)
+            raise MapException('No tiles found for field %s' % self.mapId)
 
-                if elem == ' ':
-                    log.debug('Ignoring whitespace')
-                    continue
+        log.info('Generated %dx%d map', self.width, self.height)
 
-                if elem.isupper():
-                    log.debug('Found new tile: %s' % elem)
-                    newTile = tile.Tile(elem)
-                    newLine.append(newTile)
+    def _initGrid(self, codes=None, height=0, width=0):
+        """Sets up empty grid tables, optionally over existing tile _codes_"""
+        self.tileTypes = []
+        self._tileCodes = {}
+        self._translation = bytearray(256)
+        self.items = {}
+        self.hostiles = {}
+        self.itemIndex = spatial.SpatialIndex()
+        self.hostileIndex = spatial.SpatialIndex()
+        self.tileListeners = []
+        self._regions = None
+        self.height = height
+        self.width = width
 
-                else:
-                    log.debug('Found thing: %s' % elem)
-                    newTile.addObject(elem)
+        if codes is None:
+            codes = array.array('B')
+        self.codes = codes
 
-            if len(newLine) > 0:
-                self.grid.append(newLine)
+    @classmethod
+    def fromCompiled(cls, path, sink=None):
+        """Loads a field from a map compiled by _compile_.
 
-        #----------------------------------------------------------------------
-        # Verify that we have a rectangular grid.
-        #----------------------------------------------------------------------
-        try:
-            assert(len(self.grid) > 0) and (len(self.grid[0]) > 0)
+        The tile codes are mapped from the file rather than copied, so load
+        time does not depend on the size of the map.  The field is printed
+        through _sink_, as for a new field.
 
-            validLen = len(self.grid[0])
+        """
+        log.debug('Loading compiled field from %s', path)
 
-            for line in self.grid:
-                assert(len(line) is validLen)
+        compiledMap = compiled.openMap(path)
 
-        except:
-            log.error('Grid for field %s is invalid!' % self.mapId)
-            lengths = [len(length) for length in self.grid]
-            log.error('Line lengths: ')
-            log.error(lengths)
-            raise Exception
+        newField = cls.__new__(cls)
+        newField.mapId = compiledMap.mapId
+        newField.sink = sink
+        newField.name = compiledMap.name
+        newField._initGrid(compiledMap.codes,
+                           compiledMap.height,
+                           compiledMap.width)
 
-    def printMap(self):
-        """Print the grid contained by the field object"""
-        log.info('Printing map for %s', self.name)
+        for tileId in compiledMap.tileIds:
+            newField._tileCode(tileId)
 
-        if not self.grid:
-            log.error('Loaded field %s has no containing data' % self.name)
-            raise Exception
+        for (row, col, objType) in compiledMap.items + compiledMap.hostiles:
+            newField.addObject(row, col, objType)
 
-        spacer = '  '
-        lineCount = 0
-        for line in self.grid:
+        log.info('Loaded compiled %dx%d map; %s',
+                 newField.width, newField.height, newField.name)
+        return newField
 
-            print(spacer, end='')
+    def compile(self, path):
+        """Writes the field to _path_ in the compiled map format"""
+        log.info('Compiling map %s to %s', self.mapId, path)
 
-            for tile in line:
-                if tile.hostile:
-                    elem = tile.hostile.display
-                elif tile.item:
-                    elem = tile.item.display
-                else:
-                    elem = tile.display
+        def table(entries):
+            return [(row, col, entry.type)
+                    for ((row, col), entry) in sorted(entries.items())]
 
-                print(elem, end='')
+        compiled.writeMap(path, self.mapId, self.name, self.height,
+                          self.width, [tt.tileId for tt in self.tileTypes],
+                          self.codes, table(self.items), table(self.hostiles))
 
-            if (lineCount % 5) is 0 or lineCount is 0:
-                print(' < %d' % lineCount, end='')
+    def _addRow(self, line):
+        """Parses a single map row onto the bottom of the grid.
 
-            lineCount += 1
-            print('')
+        Upper-case letters refer to tiles, the following lower-case letters
+        refer to occupiers of that tile.  Whitespace is ignored.
 
-        totalUnits = int(len(self.grid[0]) / 5) + 1
-        print(spacer, end='')
-        for unit in range(0, totalUnits):
-            print('^    ', end='')
-        print('\n' + spacer, end='')
-        for unit in range(0, totalUnits):
-            print('%-5d' % (unit * 5), end='')
-        print('')
+        """
+        line = line.replace(' ', '')
+        if not line:
+            return
+
+        row = self.height
+        occupiers = []
+
+        if _OCCUPIER.search(line):
+            tiles = []
+            for elem in line:
+                if elem.isupper():
+                    tiles.append(elem)
+                elif tiles:
+                    occupiers.append((len(tiles) - 1, elem))
+                else:
+                    log.error('Object %s precedes any tile on row %d',
+                              elem, row)
+                    raise MapException('Object %s precedes any tile on row '
+                                       '%d of field %s' %
+                                       (elem, row, self.mapId))
+            line = ''.join(tiles)
+
+        #----------------------------------------------------------------------
+        # Verify that we have a rectangular grid.
+        #----------------------------------------------------------------------
+        if row == 0:
+            self.width = len(line)
+        elif len(line) != self.width:
+            log.error('Grid for field %s is invalid!', self.mapId)
+            log.error('Row %d has length %d, expected %d',
+                      row, len(line), self.width)
+            raise MapException('Row %d of field %s has length %d, expected '
+                               '%d' % (row, self.mapId, len(line),
+                                       self.width))
+
+        for tileId in set(line).difference(self._tileCodes):
+            self._tileCode(tileId)
+
+        try:
+            self.codes.frombytes(line.encode('ascii').translate(
+                self._translation))
+        except UnicodeEncodeError:
+            log.error('Non-ASCII tile on row %d', row)
+            raise MapException('Non-ASCII tile on row %d of field %s' %
+                               (row, self.mapId))
+
+        self.height += 1
+
+        for (col, elem) in occupiers:
+            self.addObject(row, col, elem)
+
+    def _tileCode(self, tileId):
+        """Returns the grid code for a tile type, registering it if new"""
+        code = self._tileCodes.get(tileId)
+        if code is None:
+            if len(self.tileTypes) >= MAXTILETYPES:
+                log.error('Too many tile types in field %s', self.mapId)
+                raise MapException('Too many tile types in field %s' %
+                                   self.mapId)
+
+            code = len(self.tileTypes)
+            self.tileTypes.append(registry.tileTypes()[tileId])
+            self._tileCodes[tileId] = code
+            if len(tileId) == 1 and ord(tileId) < 128:
+                self._translation[ord(tileId)] = code
+
+        return code
+
+    def tileTypeAt(self, row, col):
+        """Returns the shared tile type at a position"""
+        return self.tileTypes[self.codes[row * self.width + col]]
+
+    def isAccessible(self, row, col):
+        """Returns whether the tile at a position can be entered"""
+        return self.tileTypeAt(row, col).accessible
+
+    @property
+    def regions(self):
+        """The connected regions of accessible tiles.
+
+        Regions are labelled on first use (so that loading a compiled map
+        stays independent of its size) and kept up to date from then on.
+
+        """
+        if self._regions is None:
+            self._regions = region.Regions(self)
+        return self._regions
+
+    def isReachable(self, first, second):
+        """Returns whether one (row, col) position can reach another"""
+        return self.regions.connected(first, second)
+
+    def accessibility(self):
+        """Returns whether each tile code can be entered, indexed by code"""
+        return [tileType.accessible for tileType in self.tileTypes]
+
+    def setTile(self, row, col, tileId):
+        """Changes the type of the tile at a position.
+
+        Callables in _tileListeners_ are called with the row, column and new
+        accessibility whenever a change alters whether a tile can be entered.
+
+        """
+        log.debug('Setting tile (%d, %d) to %s', row, col, tileId)
+
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            raise IndexError('Position (%d, %d) outside of field %s' %
+                             (row, col, self.mapId))
+
+        wasAccessible = self.isAccessible(row, col)
+        self.codes[row * self.width + col] = self._tileCode(tileId)
+        accessible = self.isAccessible(row, col)
+
+        if accessible != wasAccessible:
+            for listener in self.tileListeners:
+                listener(row, col, accessible)
+
+    def tile(self, row, col):
+        """Returns a tile view of a position"""
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            raise IndexError('Position (%d, %d) outside of field %s' %
+                             (row, col, self.mapId))
+        return tile.FieldTile(self, row, col)
+
+    def addObject(self, row, col, objType):
+        """Adds an item or hostile to the tile at a position"""
+        tile.FieldTile(self, row, col).addObject(objType)
+
+    #--------------------------------------------------------------------------
+    # Occupier placement.
+    #--------------------------------------------------------------------------
+    def _place(self, table, index, row, col, occupier):
+        """Sets, replaces or clears (with None) the occupier of a position"""
+        position = (row, col)
+
+        previous = table.pop(position, None)
+        if previous is not None:
+            index.remove(previous)
+
+        if occupier is not None:
+            table[position] = occupier
+            index.insert(occupier, row, col, occupier.type)
+
+    def _move(self, table, index, source, dest):
+        """Moves the occupier of _source_ to the empty position _dest_"""
+        if source not in table:
+            raise MapException('No occupier at %s to move' % (source,))
+        if dest in table:
+            raise MapException('Position %s is already occupied' % (dest,))
+        if not (0 <= dest[0] < self.height and 0 <= dest[1] < self.width):
+            raise IndexError('Position %s outside of field %s' %
+                             (dest, self.mapId))
+
+        occupier = table.pop(source)
+        table[dest] = occupier
+        index.move(occupier, dest[0], dest[1])
+
+    def placeItem(self, row, col, item):
+        """Sets or clears (with None) the item at a position"""
+        self._place(self.items, self.itemIndex, row, col, item)
+
+    def placeHostile(self, row, col, hostile):
+        """Sets or clears (with None) the hostile at a position"""
+        self._place(self.hostiles, self.hostileIndex, row, col, hostile)
+
+    def moveItem(self, source, dest):
+        """Moves an item between (row, col) positions"""
+        self._move(self.items, self.itemIndex, source, dest)
+
+    def moveHostile(self, source, dest):
+        """Moves a hostile between (row, col) positions"""
+        self._move(self.hostiles, self.hostileIndex, source, dest)
+
+    #--------------------------------------------------------------------------
+    # Occupier queries.
+    #
+    # These return lists of ((row, col), occupier) pairs.
+    #--------------------------------------------------------------------------
+    def _located(self, index, occupiers):
+        """Pairs occupiers with their positions"""
+        return [(index.position(occupier), occupier)
+                for occupier in occupiers]
+
+    def hostilesInRadius(self, row, col, radius):
+        """Returns hostiles within _radius_ tiles of a position, nearest
+        first
+
+        """
+        return self._located(self.hostileIndex,
+                             self.hostileIndex.radius(row, col, radius))
+
+    def itemsInRadius(self, row, col, radius):
+        """Returns items within _radius_ tiles of a position, nearest first"""
+        return self._located(self.itemIndex,
+                             self.itemIndex.radius(row, col, radius))
+
+    def hostilesInRect(self, top, left, bottom, right):
+        """Returns hostiles within an inclusive rectangle"""
+        return self._located(self.hostileIndex,
+                             self.hostileIndex.rect(top, left, bottom, right))
+
+    def itemsInRect(self, top, left, bottom, right):
+        """Returns items within an inclusive rectangle"""
+        return self._located(self.itemIndex,
+                             self.itemIndex.rect(top, left, bottom, right))
+
+    def nearestHostile(self, row, col, hostType=None, maxRadius=None):
+        """Returns the nearest hostile (of _hostType_, if given), or None"""
+        found = self.hostileIndex.nearest(row, col, maxRadius, hostType)
+        if found is None:
+            return None
+        return (self.hostileIndex.position(found), found)
+
+    def nearestItem(self, row, col, objType=None, maxRadius=None):
+        """Returns the nearest item (of _objType_, if given), or None"""
+        found = self.itemIndex.nearest(row, col, maxRadius, objType)
+        if found is None:
+            return None
+        return (self.itemIndex.position(found), found)
+
+    def findHostiles(self, hostType):
+        """Returns the positions of all hostiles of a type"""
+        return sorted(self.hostileIndex.position(hst)
+                      for hst in self.hostileIndex.group(hostType))
+
+    def findItems(self, objType):
+        """Returns the positions of all items of a type"""
+        return sorted(self.itemIndex.position(itm)
+                      for itm in self.itemIndex.group(objType))
+
+    def renderMap(self, top=0, left=0, rows=None, cols=None):
+        """Renders the grid, or a viewport of it, as a single string.
+
+        The viewport starts at row _top_ and column _left_, and spans _rows_
+        rows and _cols_ columns (by default, up to the edge of the grid).
+
+        """
+        log.debug('Rendering map for %s', self.name)
+
+        if not self.codes:
+            log.error('Loaded field %s has no containing data', self.name)
+            raise MapException('Field %s has no containing data' %
+                               self.name)
+
+        bottom = self.height if rows is None else min(top + rows, self.height)
+        right = self.width if cols is None else min(left + cols, self.width)
+        if not (0 <= top < bottom and 0 <= left < right):
+            raise IndexError('Viewport outside of field %s' % self.mapId)
+
+        overlays = self._overlays(top, bottom, left, right)
+        displays = [tt.display for tt in self.tileTypes]
+
+        lines = []
+        for row in range(top, bottom):
+            start = row * self.width
+            line = [displays[code]
+                    for code in self.codes[start + left:start + right]]
+
+            for (col, display) in overlays.get(row, ()):
+                line[col - left] = display
+
+            if (row % 5) == 0:
+                line.append(' < %d' % row)
+
+            lines.append(SPACER + ''.join(line))
+
+        lines.append(_ruler(left, right - left))
+        return '\n'.join(lines) + '\n'
+
+    def _overlays(self, top, bottom, left, right):
+        """Returns the occupiers to display within a viewport, by row.
+
+        Hostiles are listed after items so they are drawn over them.  Only
+        the occupiers within the viewport are visited, through the spatial
+        indexes.
+
+        """
+        overlays = {}
+        for query in (self.itemsInRect, self.hostilesInRect):
+            for ((row, col), occupier) in query(top, left,
+                                                bottom - 1, right - 1):
+                overlays.setdefault(row, []).append((col, occupier.display))
+        return overlays
+
+    def printMap(self, top=0, left=0, rows=None, cols=None):
+        """Print the grid contained by the field object.
+
+        The whole frame is written to the field's sink at once, and is not
+        rendered at all for a null sink.  See _renderMap_ for the viewport
+        arguments.
+
+        """
+        log.info('Printing map for %s', self.name)
+
+        sink = self.sink or intface.sink
+        if sink.enabled:
+            sink.write(self.renderMap(top, left, rows, cols))
+            sink.flush()
 
         return True
+
+
+@functools.lru_cache(maxsize=64)
+def _ruler(left, width):
+    """Returns the column ruler for a viewport.
+
+    Marks are placed every fifth column, counted from the left of the field
+    rather than of the viewport.
+
+    """
+    offset = (-left) % 5
+    totalUnits = (width - offset) // 5 + 1
+    marks = ''.join('^    ' for unit in range(totalUnits))
+    labels = ''.join('%-5d' % (left + offset + unit * 5)
+                     for unit in range(totalUnits))
+    pad = SPACER + ' ' * offset
+    return pad + marks + '\n' + pad + labels
@@ -3,9 +3,9 @@
 #------------------------------------------------------------------------------
 """Class for generating and accessing hostile information"""
 
-# Python imports.
-import logging as log
-import configparser
+# Module imports.
+from utils.logs import mapsLog as log
+import utils.registry as registry
 
 
 class Hostile():
@@ -13,10 +13,10 @@ class Hostile():
 
     def __init__(self, hostType):
         """Initisalises a new hostile object"""
-        log.debug('New hostile, type: %s' % hostType)
+        log.debug('New hostile, type: %s', hostType)
 
-        config = configparser.ConfigParser()
-        config.read('custom/hostile.ini')
+        definition = registry.hostileTypes()[hostType]
 
-        self.name = config.get(hostType, 'name')
-        self.display = config.get(hostType, 'display')
+        self.type = hostType
+        self.name = definition.name
+        self.display = definition.display
@@ -0,0 +1,51 @@
+#-----------------------------------------------------------------------------
+# Module: loader
+#-----------------------------------------------------------------------------
+"""Incremental reading of map rows.
+
+Maps are read as rows of tile and object letters.  Rows are seperated either
+by a backslash (as in the _mapstring_ entries of custom/map.ini) or by a
+newline (as in seperate map files).  Streams are read in fixed-size chunks so
+that only the current row need ever be held in memory.
+
+"""
+
+# Python imports.
+import io
+import re
+
+# Number of characters read from a stream at a time.
+CHUNKSIZE = 65536
+
+_SEPARATOR = re.compile(r'[\\\n]')
+
+
+def iterRows(stream, chunkSize=CHUNKSIZE):
+    """Yields each raw row of a map from a text stream"""
+    pending = ''
+
+    while True:
+        chunk = stream.read(chunkSize)
+        if not chunk:
+            break
+
+        rows = _SEPARATOR.split(pending + chunk)
+        pending = rows.pop()
+
+        for row in rows:
+            yield row.rstrip('\r')
+
+    yield pending.rstrip('\r')
+
+
+def openMap(config, mapId):
+    """Returns a text stream for the rows of the map _mapId_
+
+    Maps are either given inline with a _mapstring_ entry, or stored in a
+    seperate file referenced by a _mapfile_ entry.
+
+    """
+    if config.has_option(mapId, 'mapfile'):
+        return open(config.get(mapId, 'mapfile'))
+
+    return io.StringIO(config.get(mapId, 'mapstring'))
@@ -3,9 +3,9 @@
 #-----------------------------------------------------------------------------
 """Class for generating and accessing object information"""
 
-# Python imports.
-import configparser
-import logging as log
+# Module imports.
+from utils.logs import mapsLog as log
+import utils.registry as registry
 
 
 class Object:
@@ -13,11 +13,11 @@ class Object:
 
     def __init__(self, objType=None):
         """Initializes a new object"""
-        log.debug('New Object, type: %s' % objType)
+        log.debug('New Object, type: %s', objType)
 
-        config = configparser.ConfigParser()
-        config.read('custom/object.ini')
+        definition = registry.objectTypes()[objType]
 
-        self.name = config.get(objType, 'name')
-        self.isDecorative = config.get(objType, 'decorative')
-        self.display = config.get(objType, 'display')
+        self.type = objType
+        self.name = definition.name
+        self.isDecorative = definition.decorative
+        self.display = definition.display
@@ -0,0 +1,292 @@
+#-----------------------------------------------------------------------------
+# Module: path
+#-----------------------------------------------------------------------------
+"""Pathfinding over the accessible tiles of a field.
+
+Movement is between orthogonally adjacent accessible tiles.  Two approaches
+are provided:
+   A*           - a single shortest path between two positions.
+   Flow fields  - the distance of every tile from one target, so that any
+                  number of hostiles chasing the same target can each find
+                  their next step without a search of their own.
+
+Both are cached by the _Pathfinder_, which watches the field for tiles
+changing accessibility and only discards the results such a change could
+affect.
+
+"""
+
+# Python imports.
+import array
+import heapq
+
+# Module imports.
+from utils.logs import mapsLog as log
+
+# Maximum number of cached paths and flow fields.
+MAXPATHS = 4096
+MAXFLOWFIELDS = 64
+
+# Distance of tiles unreachable from a flow field's target.
+UNREACHABLE = -1
+
+
+def _neighbours(index, height, width):
+    """Yields the grid indexes orthogonally adjacent to _index_"""
+    (row, col) = divmod(index, width)
+    if row > 0:
+        yield index - width
+    if row < height - 1:
+        yield index + width
+    if col > 0:
+        yield index - 1
+    if col < width - 1:
+        yield index + 1
+
+
+def _manhattan(first, second):
+    """Returns the Manhattan distance between two positions"""
+    return abs(first[0] - second[0]) + abs(first[1] - second[1])
+
+
+class FlowField:
+    """Distances of every tile of a field from a single target"""
+
+    def __init__(self, field, target):
+        """Builds the flow field for _target_ by breadth-first search"""
+        log.debug('Building flow field to (%d, %d)', *target)
+
+        self.target = target
+        self.height = field.height
+        self.width = field.width
+
+        size = self.height * self.width
+        self.distances = array.array('l', [UNREACHABLE]) * size
+
+        access = field.accessibility()
+        codes = field.codes
+        start = target[0] * self.width + target[1]
+        if not access[codes[start]]:
+            return
+
+        self.distances[start] = 0
+        frontier = [start]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for index in frontier:
+                for adjacent in _neighbours(index, self.height, self.width):
+                    if (self.distances[adjacent] == UNREACHABLE and
+                            access[codes[adjacent]]):
+                        self.distances[adjacent] = distance
+                        nextFrontier.append(adjacent)
+            frontier = nextFrontier
+
+    def distance(self, row, col):
+        """Returns the number of steps from a position to the target, or
+        _UNREACHABLE_
+
+        """
+        return self.distances[row * self.width + col]
+
+    def nextStep(self, row, col):
+        """Returns the next position towards the target.
+
+        Returns None if the position is the target or cannot reach it.
+
+        """
+        current = self.distance(row, col)
+        if current <= 0:
+            return None
+
+        for adjacent in _neighbours(row * self.width + col,
+                                    self.height, self.width):
+            if self.distances[adjacent] == current - 1:
+                return divmod(adjacent, self.width)
+
+
+class Pathfinder:
+    """Class for finding and caching paths across a field"""
+
+    def __init__(self, field, maxPaths=MAXPATHS, maxFlowFields=MAXFLOWFIELDS):
+        """Sets up pathfinding for _field_"""
+        log.debug('New pathfinder for field %s', field.mapId)
+
+        self.field = field
+        self.maxPaths = maxPaths
+        self.maxFlowFields = maxFlowFields
+
+        # (start, goal) -> path tuple, or None if unreachable.
+        self.paths = {}
+        # Grid index -> keys of cached paths crossing it.
+        self._through = {}
+        # Target -> flow field.
+        self.flowFields = {}
+
+        # Region labels must be updated before this pathfinder is told of a
+        # change, so ensure they are listening first.
+        self.regions = field.regions
+        field.tileListeners.append(self.tileChanged)
+
+    #--------------------------------------------------------------------------
+    # Single paths.
+    #--------------------------------------------------------------------------
+    def findPath(self, start, goal):
+        """Returns the shortest path from _start_ to _goal_.
+
+        The path is a tuple of (row, col) positions including both ends, or
+        None if no path exists.
+
+        """
+        key = (start, goal)
+        if key in self.paths:
+            log.debug('Cached path from %s to %s', *key)
+            return self.paths[key]
+
+        path = self._search(start, goal)
+        self._cachePath(key, path)
+        return path
+
+    def _search(self, start, goal):
+        """A* search between two positions"""
+        log.debug('Searching for path from %s to %s', start, goal)
+
+        if not self.regions.connected(start, goal):
+            log.debug('Positions are not connected')
+            return None
+
+        (height, width) = (self.field.height, self.field.width)
+        access = self.field.accessibility()
+        codes = self.field.codes
+
+        startIndex = start[0] * width + start[1]
+        goalIndex = goal[0] * width + goal[1]
+
+        def heuristic(index):
+            (row, col) = divmod(index, width)
+            return abs(row - goal[0]) + abs(col - goal[1])
+
+        cost = {startIndex: 0}
+        cameFrom = {}
+        openList = [(heuristic(startIndex), 0, startIndex)]
+
+        while openList:
+            (estimate, steps, index) = heapq.heappop(openList)
+            if index == goalIndex:
+                break
+            if steps > cost[index]:
+                continue
+
+            for adjacent in _neighbours(index, height, width):
+                if not access[codes[adjacent]]:
+                    continue
+                newCost = steps + 1
+                if newCost < cost.get(adjacent, newCost + 1):
+                    cost[adjacent] = newCost
+                    cameFrom[adjacent] = index
+                    heapq.heappush(openList,
+                                   (newCost + heuristic(adjacent),
+                                    newCost, adjacent))
+        else:
+            log.debug('No path found')
+            return None
+
+        path = [goalIndex]
+        while path[-1] != startIndex:
+            path.append(cameFrom[path[-1]])
+
+        return tuple(divmod(index, width) for index in reversed(path))
+
+    def _cachePath(self, key, path):
+        """Stores a search result, evicting the oldest if the cache is full"""
+        if len(self.paths) >= self.maxPaths:
+            self._forgetPath(next(iter(self.paths)))
+
+        self.paths[key] = path
+        if path:
+            for (row, col) in path:
+                index = row * self.field.width + col
+                self._through.setdefault(index, set()).add(key)
+
+    def _forgetPath(self, key):
+        """Removes a cached search result"""
+        path = self.paths.pop(key)
+        if path:
+            for (row, col) in path:
+                index = row * self.field.width + col
+                keys = self._through[index]
+                keys.discard(key)
+                if not keys:
+                    del self._through[index]
+
+    #--------------------------------------------------------------------------
+    # Flow fields.
+    #--------------------------------------------------------------------------
+    def flowField(self, target):
+        """Returns the (cached) flow field towards _target_"""
+        if target in self.flowFields:
+            return self.flowFields[target]
+
+        if len(self.flowFields) >= self.maxFlowFields:
+            del self.flowFields[next(iter(self.flowFields))]
+
+        newField = FlowField(self.field, target)
+        self.flowFields[target] = newField
+        return newField
+
+    def stepTowards(self, positions, target):
+        """Returns the next step towards _target_ from each position.
+
+        Positions which are at, or cannot reach, the target map to None.
+
+        """
+        flow = self.flowField(target)
+        return {position: flow.nextStep(*position) for position in positions}
+
+    #--------------------------------------------------------------------------
+    # Invalidation.
+    #--------------------------------------------------------------------------
+    def tileChanged(self, row, col, accessible):
+        """Discards cached results affected by a change of accessibility"""
+        log.debug('Tile (%d, %d) changed accessibility to %s',
+                  row, col, accessible)
+
+        position = (row, col)
+        index = row * self.field.width + col
+
+        if accessible:
+            #------------------------------------------------------------------
+            # A newly opened tile can connect unreachable positions, or
+            # shorten any path which is longer than a route via the tile.
+            #------------------------------------------------------------------
+            def shortened(key, path):
+                if path is None:
+                    return self.regions.connected(*key)
+                via = (_manhattan(key[0], position) +
+                       _manhattan(position, key[1]))
+                return via < len(path) - 1
+
+            stale = [key for (key, path) in self.paths.items()
+                     if shortened(key, path)]
+
+            staleFlows = [target for (target, flow) in self.flowFields.items()
+                          if target == position or
+                          any(flow.distances[adjacent] != UNREACHABLE
+                              for adjacent in _neighbours(index,
+                                                          flow.height,
+                                                          flow.width))]
+        else:
+            # Only paths and fields which used the tile are affected.
+            stale = list(self._through.get(index, ()))
+
+            staleFlows = [target for (target, flow) in self.flowFields.items()
+                          if flow.distances[index] != UNREACHABLE]
+
+        log.debug('Discarding %d paths and %d flow fields',
+                  len(stale), len(staleFlows))
+
+        for key in stale:
+            self._forgetPath(key)
+        for target in staleFlows:
+            del self.flowFields[target]
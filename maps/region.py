@@ -0,0 +1,156 @@
+#-----------------------------------------------------------------------------
+# Module: region
+#-----------------------------------------------------------------------------
+"""Connected regions of accessible tiles.
+
+Each accessible tile of a field is labelled with the ID of the region of
+tiles it can reach by orthogonal moves, so that whether one position can
+reach another is a comparison of two labels.
+
+Labels are kept up to date as tiles change accessibility:
+   opening a tile  - joins the regions around it, relabelling all but the
+                     largest of them.
+   blocking a tile - relabels only the region it belonged to, which may
+                     split in two or more.
+
+"""
+
+# Python imports.
+import array
+
+# Module imports.
+from utils.logs import mapsLog as log
+
+# Label of inaccessible tiles.
+NOREGION = -1
+
+
+class Regions:
+    """Class for labelling and tracking the connected regions of a field"""
+
+    def __init__(self, field):
+        """Labels every accessible tile of _field_"""
+        log.debug('Labelling regions of field %s', field.mapId)
+
+        self.field = field
+        self.height = field.height
+        self.width = field.width
+        self.labels = array.array('i', [NOREGION]) * (self.height *
+                                                       self.width)
+        self.sizes = {}
+        self._nextId = 0
+
+        access = field.accessibility()
+        codes = field.codes
+        for index in range(len(self.labels)):
+            if self.labels[index] == NOREGION and access[codes[index]]:
+                self._fill(index, self._newId())
+
+        log.info('Field %s has %d regions', field.mapId, len(self.sizes))
+
+        field.tileListeners.append(self.tileChanged)
+
+    def _newId(self):
+        """Returns an unused region ID"""
+        regionId = self._nextId
+        self._nextId += 1
+        self.sizes[regionId] = 0
+        return regionId
+
+    def _neighbours(self, index):
+        """Returns the grid indexes orthogonally adjacent to _index_"""
+        (row, col) = divmod(index, self.width)
+        adjacent = []
+        if row > 0:
+            adjacent.append(index - self.width)
+        if row < self.height - 1:
+            adjacent.append(index + self.width)
+        if col > 0:
+            adjacent.append(index - 1)
+        if col < self.width - 1:
+            adjacent.append(index + 1)
+        return adjacent
+
+    def _fill(self, start, regionId):
+        """Labels the accessible tiles connected to _start_ with _regionId_
+
+        Tiles already carrying _regionId_ are not crossed.
+
+        """
+        labels = self.labels
+        access = self.field.accessibility()
+        codes = self.field.codes
+
+        if labels[start] != NOREGION:
+            self._shrink(labels[start])
+        labels[start] = regionId
+        filled = 1
+
+        frontier = [start]
+        while frontier:
+            index = frontier.pop()
+            for adjacent in self._neighbours(index):
+                label = labels[adjacent]
+                if label == regionId or not access[codes[adjacent]]:
+                    continue
+                if label != NOREGION:
+                    self._shrink(label)
+                labels[adjacent] = regionId
+                filled += 1
+                frontier.append(adjacent)
+
+        self.sizes[regionId] += filled
+
+    def _shrink(self, regionId):
+        """Removes a tile from a region, dropping the region if empty"""
+        self.sizes[regionId] -= 1
+        if not self.sizes[regionId]:
+            del self.sizes[regionId]
+
+    def region(self, row, col):
+        """Returns the region ID of a position, or _NOREGION_"""
+        return self.labels[row * self.width + col]
+
+    def connected(self, first, second):
+        """Returns whether one (row, col) position can reach another"""
+        for (row, col) in (first, second):
+            if not (0 <= row < self.height and 0 <= col < self.width):
+                return False
+
+        label = self.region(*first)
+        return label != NOREGION and label == self.region(*second)
+
+    def tileChanged(self, row, col, accessible):
+        """Updates region labels after a change of accessibility"""
+        index = row * self.width + col
+        around = [self.labels[adjacent]
+                  for adjacent in self._neighbours(index)
+                  if self.labels[adjacent] != NOREGION]
+
+        if accessible:
+            log.debug('Joining regions around (%d, %d)', row, col)
+
+            if not around:
+                self._fill(index, self._newId())
+                return
+
+            # Relabel the smaller regions into the largest.
+            largest = max(set(around),
+                          key=lambda rid: (self.sizes[rid], -rid))
+            self._fill(index, largest)
+            return
+
+        log.debug('Splitting region around (%d, %d)', row, col)
+
+        regionId = self.labels[index]
+        self.labels[index] = NOREGION
+        self._shrink(regionId)
+        if regionId not in self.sizes:
+            return
+
+        #----------------------------------------------------------------------
+        # Each neighbour not reached by an earlier fill starts a new region.
+        #----------------------------------------------------------------------
+        for adjacent in self._neighbours(index):
+            if self.labels[adjacent] == regionId:
+                self._fill(adjacent, self._newId())
@@ -0,0 +1,215 @@
+#-----------------------------------------------------------------------------
+# Module: spatial
+#-----------------------------------------------------------------------------
+"""Spatial indexing of map occupiers.
+
+Positions are bucketed on a uniform grid so that radius, rectangle and
+nearest-neighbour queries only visit the buckets covering the area of
+interest, rather than every position of a map.
+
+"""
+
+# Module imports.
+from utils.logs import mapsLog as log
+
+# Width and height of a bucket, in tiles.
+BUCKETSIZE = 8
+
+
+class SpatialIndex:
+    """Class for indexing keys by (row, col) position
+
+    Each key may also be given a group (eg. its object type) so that all keys
+    of a group can be listed directly.
+
+    """
+
+    def __init__(self, bucketSize=BUCKETSIZE):
+        """Initialises an empty index"""
+        log.debug('New spatial index, bucket size: %d', bucketSize)
+
+        self.bucketSize = bucketSize
+        self.buckets = {}
+        self.positions = {}
+        self.groups = {}
+        self._groupOf = {}
+
+        # Bucket rows and columns, (top, bottom, left, right), which have
+        # held a key since the index was last empty.  They only grow, so
+        # they bound the occupied buckets loosely, without a rescan.
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _bucket(self, row, col):
+        """Returns the bucket holding a position"""
+        return (row // self.bucketSize, col // self.bucketSize)
+
+    def insert(self, key, row, col, group=None):
+        """Adds _key_ at a position"""
+        if key in self.positions:
+            raise KeyError('Key %s already indexed' % key)
+
+        self.positions[key] = (row, col)
+        (brow, bcol) = bucketId = self._bucket(row, col)
+        self.buckets.setdefault(bucketId, set()).add(key)
+
+        if self._bounds is None:
+            self._bounds = (brow, brow, bcol, bcol)
+        else:
+            (top, bottom, left, right) = self._bounds
+            if not (top <= brow <= bottom and left <= bcol <= right):
+                self._bounds = (min(top, brow), max(bottom, brow),
+                                min(left, bcol), max(right, bcol))
+
+        self._groupOf[key] = group
+        self.groups.setdefault(group, set()).add(key)
+
+    def remove(self, key):
+        """Removes _key_ from the index"""
+        (row, col) = self.positions.pop(key)
+
+        bucketId = self._bucket(row, col)
+        bucket = self.buckets[bucketId]
+        bucket.discard(key)
+        if not bucket:
+            del self.buckets[bucketId]
+
+        group = self._groupOf.pop(key)
+        members = self.groups[group]
+        members.discard(key)
+        if not members:
+            del self.groups[group]
+
+        if not self.positions:
+            self._bounds = None
+
+    def move(self, key, row, col):
+        """Moves _key_ to a new position"""
+        group = self._groupOf[key]
+        self.remove(key)
+        self.insert(key, row, col, group)
+
+    def position(self, key):
+        """Returns the position of _key_"""
+        return self.positions[key]
+
+    def group(self, group):
+        """Returns all keys in _group_"""
+        return set(self.groups.get(group, ()))
+
+    def _candidates(self, top, left, bottom, right):
+        """Yields keys in the buckets overlapping an inclusive rectangle"""
+        (topBucket, leftBucket) = self._bucket(top, left)
+        (bottomBucket, rightBucket) = self._bucket(bottom, right)
+
+        # For large areas it is cheaper to walk the occupied buckets.
+        area = ((bottomBucket - topBucket + 1) *
+                (rightBucket - leftBucket + 1))
+        if area > len(self.buckets):
+            for ((brow, bcol), bucket) in self.buckets.items():
+                if (topBucket <= brow <= bottomBucket and
+                        leftBucket <= bcol <= rightBucket):
+                    yield from bucket
+            return
+
+        for brow in range(topBucket, bottomBucket + 1):
+            for bcol in range(leftBucket, rightBucket + 1):
+                yield from self.buckets.get((brow, bcol), ())
+
+    def rect(self, top, left, bottom, right):
+        """Returns keys within the inclusive rectangle of rows _top_ to
+        _bottom_ and columns _left_ to _right_
+
+        """
+        result = []
+        for key in self._candidates(top, left, bottom, right):
+            (row, col) = self.positions[key]
+            if top <= row <= bottom and left <= col <= right:
+                result.append(key)
+        return result
+
+    def radius(self, row, col, radius):
+        """Returns keys within _radius_ tiles of a position, nearest first"""
+        found = []
+        limit = radius * radius
+        for key in self._candidates(row - radius, col - radius,
+                                    row + radius, col + radius):
+            distance = _distance(self.positions[key], row, col)
+            if distance <= limit:
+                found.append((distance, self.positions[key], key))
+
+        found.sort(key=lambda entry: entry[:2])
+        return [key for (distance, position, key) in found]
+
+    def nearest(self, row, col, maxRadius=None, group=None):
+        """Returns the key nearest a position, or None if there is none.
+
+        If _group_ is given only keys of that group are considered.  Ties are
+        broken by position, top-left first.
+
+        """
+        if group is not None:
+            if group not in self.groups:
+                return None
+            keys = self.groups[group]
+        else:
+            keys = self.positions
+
+        if not keys:
+            return None
+
+        best = None
+        (centreRow, centreCol) = self._bucket(row, col)
+        (top, bottom, left, right) = self._bounds
+        maxRing = max(abs(centreRow - top), abs(centreRow - bottom),
+                      abs(centreCol - left), abs(centreCol - right))
+
+        for ring in range(maxRing + 1):
+            #------------------------------------------------------------------
+            # Anything in this ring or beyond is at least (ring - 1) buckets
+            # away, so stop once the best match is closer than that.
+            #------------------------------------------------------------------
+            edge = max(0, ring - 1) * self.bucketSize
+            if best is not None and best[0] < edge * edge:
+                break
+            if maxRadius is not None and edge > maxRadius:
+                break
+
+            for bucketId in _ring(centreRow, centreCol, ring):
+                for key in self.buckets.get(bucketId, ()):
+                    if key not in keys:
+                        continue
+                    position = self.positions[key]
+                    candidate = (_distance(position, row, col), position, key)
+                    if best is None or candidate[:2] < best[:2]:
+                        best = candidate
+
+        if best is None:
+            return None
+        if maxRadius is not None and best[0] > maxRadius * maxRadius:
+            return None
+        return best[2]
+
+
+def _distance(position, row, col):
+    """Returns the squared distance between two positions"""
+    return (position[0] - row) ** 2 + (position[1] - col) ** 2
+
+
+def _ring(centreRow, centreCol, ring):
+    """Yields the buckets on the square ring _ring_ buckets from a centre"""
+    if ring == 0:
+        yield (centreRow, centreCol)
+        return
+
+    for bcol in range(centreCol - ring, centreCol + ring + 1):
+        yield (centreRow - ring, bcol)
+        yield (centreRow + ring, bcol)
+    for brow in range(centreRow - ring + 1, centreRow + ring):
+        yield (brow, centreCol - ring)
+        yield (brow, centreCol + ring)
@@ -3,69 +3,103 @@
 #-----------------------------------------------------------------------------
 """Class for manipulating gameplay tiles"""
 
-# Python imports
-import logging as log
-import configparser
-
 # Module imports.
+from utils.exceptions import MapException
+from utils.logs import mapsLog as log
+import utils.registry as registry
 import maps.object as tileObj
 import maps.hostile as hostile
 
 
 class Tile:
-    """Class for handling and manipulating game tiles"""
+    """Class for handling and manipulating game tiles
+
+    The type information of a tile (display, accessibility) is held by a
+    shared, immutable tile type from the registry rather than per tile.
+
+    """
 
     def __init__(self, tileType='I'):
         """Initialises a new tile object"""
-        log.debug('New tile, type: %s' % tileType)
+        log.debug('New tile, type: %s', tileType)
 
-        self.type = tileType
-        self.display = '?'
+        self.tileType = registry.tileTypes()[tileType]
         self.item = None
         self.hostile = None
-        self.accessible = False
-
-        self.__populate()
-
-    def __populate(self):
-        """Sets the default values for the tile"""
-        log.debug('Populating tile with default values')
 
-        config = configparser.ConfigParser()
-        config.read('custom/tile.ini')
+    @property
+    def type(self):
+        """The tile type ID"""
+        return self.tileType.tileId
 
-        self.display = config.get(self.type, 'display')
+    @property
+    def display(self):
+        """The display character of the tile type"""
+        return self.tileType.display
 
-        access = config.get(self.type, 'access')
-        if access.lower() == 'true' or access.lower() == 'yes':
-            self.accessible = True
-        else:
-            self.accessible = False
+    @property
+    def accessible(self):
+        """Whether the tile type can be entered"""
+        return self.tileType.accessible
 
     def addObject(self, objType):
         """Add an item or enemy that the tile contains"""
-        log.debug(('Adding object %s to %s tile' % (objType, self.type)))
+        log.debug('Adding object %s to %s tile', objType, self.type)
 
-        config = configparser.ConfigParser()
-        config.read('custom/object.ini')
-
-        if objType in config.sections():
+        if objType in registry.objectTypes():
             log.debug('New object is an... object')
             if self.item:
-                log.warning('New object %s overwrites previous tile item %s' %
-                            (objType, self.item.type))
+                log.warning('New object %s overwrites previous tile item %s',
+                            objType, self.item.type)
             self.item = tileObj.Object(objType)
             return
 
-        config.read('custom/hostile.ini')
-
-        if objType in config.sections():
+        if objType in registry.hostileTypes():
             log.debug('New object is a hostile')
             if self.hostile:
                 log.error('Cannot set multiple hostiles on same tile!')
-                raise Exception
+                raise MapException('Tile already holds hostile %s' %
+                                   self.hostile.type)
             self.hostile = hostile.Hostile(objType)
             return
 
-        log.error('Unrecognised object: %s' % objType)
-        raise Exception
+        log.error('Unrecognised object: %s', objType)
+        raise MapException('Unrecognised object: %s' % objType)
+
+
+class FieldTile(Tile):
+    """A view of a single position within a field.
+
+    Field tiles hold no state of their own: the tile type is read from the
+    field's grid, and items and hostiles from its sparse position tables.
+
+    """
+
+    def __init__(self, field, row, col):
+        """Initialises a view of the tile at _row_, _col_ of _field_"""
+        self.field = field
+        self.row = row
+        self.col = col
+
+    @property
+    def tileType(self):
+        """The shared tile type at this position"""
+        return self.field.tileTypeAt(self.row, self.col)
+
+    @property
+    def item(self):
+        """The item on this position, if any"""
+        return self.field.items.get((self.row, self.col))
+
+    @item.setter
+    def item(self, value):
+        self.field.placeItem(self.row, self.col, value)
+
+    @property
+    def hostile(self):
+        """The hostile on this position, if any"""
+        return self.field.hostiles.get((self.row, self.col))
+
+    @hostile.setter
+    def hostile(self, value):
+        self.field.placeHostile(self.row, self.col, value)
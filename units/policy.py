@@ -0,0 +1,176 @@
+#------------------------------------------------------------------------------
+# Module: policy
+#------------------------------------------------------------------------------
+"""Module for the policies of automated units.
+
+A policy chooses the command, and its target, for each turn of an automated
+unit.  Each unit type is given a policy by the _policy_ entry of
+custom/unit.ini, from:
+   random          - any command on any valid target.
+   greedy-damage   - the attack doing the most damage per tick, on any
+                     valid target.
+   focus-fire      - the attack doing the most damage per tick, on the live
+                     enemy with fewest hitpoints.
+   buff-when-hurt  - a buff while below half hitpoints, and otherwise as
+                     greedy-damage.
+
+A policy is set up once per unit type, working out its decision table from
+the unit template and command definitions, and is shared by every unit of
+that type.  Policies weighing up the hitpoints of other units read them from
+the team summaries of the combat (see _combat.summary_) rather than
+searching its units.
+
+"""
+
+# Module imports.
+from utils.exceptions import UnitException
+from utils.logs import unitsLog as log
+import utils.registry as registry
+import combat.action as action
+import units.unit as unit
+
+RANDOM = 'random'
+GREEDY = 'greedy-damage'
+FOCUS = 'focus-fire'
+BUFF = 'buff-when-hurt'
+
+# Fraction of its hitpoints below which a unit is hurt.
+HURT = 0.5
+
+
+def _commandIds(template):
+    """Returns the IDs of a unit type's commands, in the order of a unit's
+    _commands_
+
+    """
+    return ['attack'] + list(template.commands) + ['pass']
+
+
+class Policy:
+    """Chooses any command on any valid target"""
+
+    # Whether the policy reads the team summaries of a combat.
+    summaries = False
+
+    def __init__(self, template):
+        """Sets up the policy for the unit type of _template_"""
+        log.debug('Setting up %s policy for %s',
+                  type(self).__name__, template.unitId)
+        self.template = template
+
+    def plan(self, unt, targets):
+        """Returns the command and target, from _targets_, for a turn of
+        _unt_; the target is None if there is none to choose from
+
+        """
+        choice = unt.rng.choice(unt.commands)
+        return (choice, self.target(unt, choice, targets))
+
+    def target(self, unt, choice, targets):
+        """Returns a random valid target for _choice_"""
+        if choice.selfOnly:
+            return unt
+        return choice.getTarget(targets, unt.team.allies, auto=True,
+                                rng=unt.rng, pools=unt.targetPools)
+
+
+class GreedyDamage(Policy):
+    """Chooses the attack doing the most damage per tick"""
+
+    def __init__(self, template):
+        """Sets up the policy for the unit type of _template_.
+
+        Attacks are ranked by their expected damage over the ticks they
+        take, at the type's own stats.
+
+        """
+        Policy.__init__(self, template)
+
+        commands = registry.commands()
+        self.best = 0
+        bestRate = None
+        for (index, commandId) in enumerate(_commandIds(template)):
+            definition = commands[commandId]
+            if (definition.selfOnly or not definition.offensive or
+                    definition.actionType not in action.ATTACKTYPES):
+                continue
+
+            rate = ((definition.amount +
+                     template.stats.get(definition.actionType, 0)) /
+                    (max(template.stats[unit.SPE], 1) + definition.delay))
+            if bestRate is None or rate > bestRate:
+                (self.best, bestRate) = (index, rate)
+
+    def plan(self, unt, targets):
+        """Returns the best attack and its target for a turn of _unt_"""
+        choice = unt.commands[self.best]
+        return (choice, self.target(unt, choice, targets))
+
+
+class FocusFire(GreedyDamage):
+    """Chooses the attack doing the most damage per tick, on the live enemy
+    with fewest hitpoints
+
+    """
+
+    summaries = True
+
+    def target(self, unt, choice, targets):
+        """Returns the weakest live enemy, or a random target outside of a
+        combat
+
+        """
+        if unt.teamSummaries is not None and choice.offensive:
+            weakest = unt.teamSummaries.lowestEnemy(unt.team.allies)
+            if weakest is not None:
+                return weakest
+        return GreedyDamage.target(self, unt, choice, targets)
+
+
+class BuffWhenHurt(GreedyDamage):
+    """Chooses a buff when hurt, and otherwise the best attack"""
+
+    def __init__(self, template):
+        """Sets up the policy for the unit type of _template_"""
+        GreedyDamage.__init__(self, template)
+
+        commands = registry.commands()
+        self.buffs = [index for (index, commandId)
+                      in enumerate(_commandIds(template))
+                      if commands[commandId].actionType == action.BUFF]
+
+    def plan(self, unt, targets):
+        """Returns a command and its target for a turn of _unt_"""
+        hitpoints = unt.attributes[unit.HP]
+        if self.buffs and hitpoints.value < HURT * hitpoints.maximum:
+            choice = unt.commands[unt.rng.choice(self.buffs)]
+            return (choice, self.target(unt, choice, targets))
+        return GreedyDamage.plan(self, unt, targets)
+
+
+POLICIES = {RANDOM: Policy,
+            GREEDY: GreedyDamage,
+            FOCUS: FocusFire,
+            BUFF: BuffWhenHurt}
+
+# Policies set up so far, by (policy name, unit ID).
+_policies = {}
+
+
+def getPolicy(name, template):
+    """Returns the policy _name_ for the unit type of _template_.
+
+    Policies are shared by all units of a type, and set up again only if
+    the type's template is reloaded.
+
+    """
+    key = (name, template.unitId)
+    policy = _policies.get(key)
+    if policy is None or policy.template is not template:
+        if name not in POLICIES:
+            log.error('Unknown policy %s for unit %s', name, template.unitId)
+            raise UnitException('Unknown policy \'%s\' for unit %s; expected '
+                                'one of %s' % (name, template.unitId,
+                                               ', '.join(sorted(POLICIES))))
+        policy = _policies[key] = POLICIES[name](template)
+    return policy
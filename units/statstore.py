@@ -0,0 +1,294 @@
+#------------------------------------------------------------------------------
+# Module: statstore
+#------------------------------------------------------------------------------
+"""Struct-of-arrays storage for the stats of many units.
+
+A stat store holds the stats of a fixed set of units in contiguous arrays,
+one for each field (value, maximum, minimum and default) of each stat,
+indexed by the slot of the unit.  The counters of a unit joining a store are
+replaced by views onto its slot, which behave as fast counters (see
+_utils.counter_), so the unit's own methods are unchanged and stay on the
+fast path.
+
+Stats may also be changed in bulk, for a list of units or a whole team:
+   damage       - as _Unit.damage_ on each live unit, e.g. area damage.
+   buff         - as _Unit.buff_ on each unit, e.g. a team-wide buff.
+   liveTeams    - the teams with a live unit, the victors of a mass combat.
+With NumPy installed, these are single vectorised passes over views of the
+arrays; without, they fall back to the methods of each unit.  Units are told
+of changes to their hitpoints afterwards, in slot order, so that listeners on
+them see the same changes as they would unit by unit.  No command yet hits or
+buffs many units at once, so only _liveTeams_ is used by combats.
+
+"""
+
+# Python imports.
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Module imports.
+from utils.exceptions import CounterException, UnitException
+from utils.logs import unitsLog as log
+import combat.action as action
+import units.unit as unit
+
+# Stats held for each unit; attack types are held under _unit.ATT_ by units.
+STATS = [unit.HP] + unit.SIMATTR + action.ATTACKTYPES
+
+# Fields held for each stat.
+FIELDS = ('value', 'maximum', 'minimum', 'default')
+
+# Array type code, matching NumPy's int64.
+TYPECODE = 'q'
+
+
+def _field(name):
+    """Returns a property for one field of a stat view"""
+    def getField(self):
+        return getattr(self, name)[self._slot]
+
+    def setField(self, value):
+        getattr(self, name)[self._slot] = value
+
+    return property(getField, setField)
+
+
+class StatView:
+    """A counter whose fields are held in a stat store
+
+    Behaves as _utils.counter.FastCounter_, reading and writing the arrays
+    of the store directly.
+
+    """
+
+    __slots__ = ('_values', '_maxima', '_minima', '_defaults', '_slot')
+
+    def __init__(self, arrays, slot):
+        """Sets up a view of _slot_ in the _arrays_ of one stat"""
+        self._values = arrays['value']
+        self._maxima = arrays['maximum']
+        self._minima = arrays['minimum']
+        self._defaults = arrays['default']
+        self._slot = slot
+
+    value = _field('_values')
+    maximum = _field('_maxima')
+    minimum = _field('_minima')
+    default = _field('_defaults')
+
+    def getValue(self):
+        """Returns the counter value"""
+        return self._values[self._slot]
+
+    def reduce(self, amount, default=False):
+        """Decrease the counter
+
+        If the default flag is active then the default value is decremented.
+
+        """
+        return self.increase(-amount, default)
+
+    def increase(self, amount, default=False):
+        """Increase a counter.
+
+        If the default flag is active then the default value is incremented.
+
+        """
+        amount = int(amount)
+        slot = self._slot
+
+        if default:
+            newDefault = self._defaults[slot] + amount
+            if not self._minima[slot] <= newDefault <= self._maxima[slot]:
+                log.error('Default out of range')
+                raise CounterException('Default incremented to {0}, over '
+                                       'maximum of counter ({1})'.format(
+                                           newDefault, self._maxima[slot]))
+            self._defaults[slot] = newDefault
+            return 0
+
+        values = self._values
+        initial = values[slot]
+        value = initial + amount
+        if value > self._maxima[slot]:
+            value = self._maxima[slot]
+        elif value < self._minima[slot]:
+            value = self._minima[slot]
+        values[slot] = value
+        return value - initial
+
+    def tick(self):
+        """Reduces the counter by one, returning whether it is now zero"""
+        slot = self._slot
+        value = self._values[slot] - 1
+        if value < self._minima[slot]:
+            value = self._minima[slot]
+        self._values[slot] = value
+        return value == 0
+
+    def min(self):
+        """Minimise the counter"""
+        slot = self._slot
+        initial = self._values[slot]
+        self._values[slot] = self._minima[slot]
+        return self._values[slot] - initial
+
+    def reset(self):
+        """Reset the counter"""
+        slot = self._slot
+        initial = self._values[slot]
+        self._values[slot] = self._defaults[slot]
+        return self._values[slot] - initial
+
+    def reduceFraction(self, fraction):
+        """Reduce the amount by a fraction"""
+        slot = self._slot
+        initial = self._values[slot]
+        self._values[slot] = int(initial * (1 - fraction))
+        return self._values[slot] - initial
+
+    def increaseFraction(self, fraction):
+        """Increase the amount by a fraction"""
+        slot = self._slot
+        initial = self._values[slot]
+        self._values[slot] = int(initial * (1 + fraction))
+        return self._values[slot] - initial
+
+
+class StatStore:
+    """Class for holding the stats of units in arrays"""
+
+    def __init__(self, units):
+        """Moves the stats of _units_ into the store"""
+        log.debug('Storing stats of %d units', len(units))
+
+        self.units = list(units)
+        self.slots = {unt: slot for (slot, unt) in enumerate(self.units)}
+        if len(self.slots) != len(self.units):
+            raise UnitException('Units may only be stored once')
+
+        self.arrays = {}
+        for stat in STATS:
+            counters = [self._counter(unt, stat) for unt in self.units]
+            self.arrays[stat] = {
+                name: array.array(TYPECODE, [getattr(count, name)
+                                             for count in counters])
+                for name in FIELDS}
+
+        for (slot, unt) in enumerate(self.units):
+            for stat in STATS:
+                view = StatView(self.arrays[stat], slot)
+                if stat in action.ATTACKTYPES:
+                    unt.attributes[unit.ATT][stat] = view
+                else:
+                    unt.attributes[stat] = view
+
+        self.teams = {}
+        for (slot, unt) in enumerate(self.units):
+            self.teams.setdefault(unt.team.teamId, []).append(slot)
+
+        self.views = None
+        if numpy is not None:
+            self.views = {stat: {name: numpy.frombuffer(fields[name],
+                                                        dtype=numpy.int64)
+                                 for name in FIELDS}
+                          for (stat, fields) in self.arrays.items()}
+            codes = {teamId: code
+                     for (code, teamId) in enumerate(self.teams)}
+            self.teamCodes = numpy.array([codes[unt.team.teamId]
+                                          for unt in self.units],
+                                         dtype=numpy.intp)
+
+    @staticmethod
+    def _counter(unt, stat):
+        """Returns the counter of a unit for _stat_"""
+        if stat in action.ATTACKTYPES:
+            return unt.attributes[unit.ATT][stat]
+        return unt.attributes[stat]
+
+    def _select(self, units=None, teamId=None):
+        """Returns the units, and their slots, given either as _units_ or as
+        the team _teamId_
+
+        """
+        if teamId is not None:
+            slots = self.teams.get(teamId, [])
+        else:
+            slots = [self.slots[unt] for unt in units]
+        return ([self.units[slot] for slot in slots], slots)
+
+    def _notify(self, slots, before, changed):
+        """Tells the units in _slots_ for which _changed_ is set of a change
+        from hitpoints _before_, as their own methods would
+
+        """
+        for index in numpy.flatnonzero(changed):
+            self.units[slots[index]]._hpChanged(bool(before[index]))
+
+    def damage(self, amount, units=None, teamId=None):
+        """Damages each live unit of _units_, or of the team _teamId_, by
+        _amount_
+
+        """
+        (targets, slots) = self._select(units, teamId)
+        log.debug('Damaging %d units by %d', len(slots), amount)
+
+        if self.views is None:
+            for unt in targets:
+                unt.damage(amount)
+            return
+
+        slots = numpy.asarray(slots, dtype=numpy.intp)
+        hitpoints = self.views[unit.HP]
+        before = hitpoints['value'][slots]
+        after = numpy.clip(before - int(amount),
+                           hitpoints['minimum'][slots],
+                           hitpoints['maximum'][slots])
+        live = before != 0
+        hitpoints['value'][slots] = numpy.where(live, after, before)
+        self._notify(slots, before, live)
+
+    def buff(self, attr, amount, units=None, teamId=None):
+        """Buffs _attr_ of each of _units_, or of the team _teamId_, by
+        _amount_
+
+        Returns the actual change in the attribute of each unit.
+
+        """
+        (targets, slots) = self._select(units, teamId)
+        log.debug('Buffing %s of %d units by %d', attr, len(slots), amount)
+
+        if self.views is None or attr not in self.views:
+            return [unt.buff(attr, amount) for unt in targets]
+
+        slots = numpy.asarray(slots, dtype=numpy.intp)
+        stat = self.views[attr]
+        before = stat['value'][slots]
+        stat['value'][slots] = numpy.clip(before + int(amount),
+                                          stat['minimum'][slots],
+                                          stat['maximum'][slots])
+        if attr == unit.HP:
+            self._notify(slots, before, numpy.ones(len(slots), dtype=bool))
+        return (stat['value'][slots] - before).tolist()
+
+    def liveTeams(self):
+        """Returns the IDs of the teams with a live unit, in order of their
+        first live unit
+
+        """
+        if self.views is None:
+            teamIds = []
+            for unt in self.units:
+                teamId = unt.team.teamId
+                if unt.state() != unit.DEAD and teamId not in teamIds:
+                    teamIds.append(teamId)
+            return teamIds
+
+        live = self.teamCodes[self.views[unit.HP]['value'] != 0]
+        (codes, first) = numpy.unique(live, return_index=True)
+        teamIds = list(self.teams)
+        return [teamIds[code] for code in codes[numpy.argsort(first)]]
@@ -4,18 +4,20 @@
 """Contains class information on combat units"""
 
 # Python imports
-import logging as log
-import configparser
 import random
 
 # Modules imports
 from utils.exceptions import UnitException
-from display.interface import userInput
+from utils.logs import unitsLog as log
+import utils.logs as logs
+from display.interface import userInput, userInputAsync, OptionIndex
 import utils.counter as counter
+import utils.registry as registry
 import combat.event as event
 import combat.action as action
 import combat.command as command
 import combat.team as team
+import units.policy as policy
 
 # Status.
 OK = 'OK'
@@ -28,6 +30,9 @@ EVA = 'evasion'
 SPE = 'speed'
 ATT = 'attack'
 
+# Prompt for a player's choice of command.
+COMMANDPROMPT = 'Commands available to %s:'
+
 # Maximum stat for non-HP attributes
 MAXSTAT = 100
 
@@ -40,24 +45,17 @@ class Unit(event.Event):
 
     def __init__(self, inputId, unitTeam, auto=True):
         """Initialises a new combat unit"""
-        log.debug('New Combat Unit, ID: %s' % inputId)
+        log.debug('New Combat Unit, ID: %s', inputId)
 
         self.unitId = inputId
         if not unitTeam:
             raise UnitException('Unit %s initialised without team' % inputId)
 
-        config = None
-
-        def getConfig(field):
-            """Get a value from the current config file"""
-            return config.get(self.unitId, field)
-
-        unitfile = 'custom/unit.ini'
-        config = configparser.ConfigParser()
-        config.read(unitfile)
-        if self.unitId not in config.sections():
+        templates = registry.unitTemplates()
+        if self.unitId not in templates:
             raise UnitException('Invalid value; key \'%s\' not in %s' %
-                                (self.unitId, unitfile))
+                                (self.unitId, registry.UNITFILE))
+        template = templates[self.unitId]
 
         # Name usage:
         # .name       - short-term name storage, preserved for length of a
@@ -66,27 +64,47 @@ class Unit(event.Event):
         # .longName   - permanant storage of a full unit-type name
         self.name = None
         self.uniqueName = None
-        self.longName = getConfig('name')
+        self.longName = template.name
 
         self.team = team.Team(unitTeam)
 
         # Attribute intitialization
-        self._setupAttr(getConfig)
+        self._setupAttr(template.stats)
 
         # Event initialisation.
         event.Event.__init__(self,
                              self.attributes[SPE].value,
                              recurring=True)
 
-        # Whether the unit is automatic, or user-controlled.
+        # Whether the unit is automatic, or user-controlled, and the policy
+        # choosing its actions if automatic.
         self.auto = auto
+        self.policy = policy.getPolicy(template.policy, template)
+
+        # Random stream for automated choices; replaced by that of any combat
+        # the unit joins.
+        self.rng = random
+
+        # Recorder for the actions of the unit; set by any combat it joins.
+        self.recorder = None
+
+        # Listeners called as (unit, alive) when the unit dies or comes back
+        # to life, and watchers called as (unit) whenever its hitpoints
+        # change.
+        self.hpListeners = []
+        self.hpWatchers = []
+
+        # Target pools of a mass combat, and team summaries for its policy;
+        # set by any combat it joins which needs them.
+        self.targetPools = None
+        self.teamSummaries = None
 
         # Setup a list of commands the unit can use.
-        self._generate_commands(getConfig('commands').split(','))
+        self._generate_commands(template.commands)
 
-    def _setupAttr(self, configGetter):
+    def _setupAttr(self, stats):
         """Sets the default attributes for the unit, as outlaid in the config
-        file.
+        file and provided as _stats_ by the unit template.
 
         """
         log.debug('Setting default attributes')
@@ -100,29 +118,30 @@ class Unit(event.Event):
 
             """
             log.debug('Setting stat')
-            stat = counter.Counter(MAXSTAT)
+            stat = counter.FastCounter(MAXSTAT)
             stat.default = value
             stat.reset()
             return stat
 
         # Setup HP, which does not obey _MAXSTAT_.
-        self.attributes[HP] = counter.Counter(int(configGetter(HP)))
+        self.attributes[HP] = counter.FastCounter(stats[HP])
 
         # Setup simple attributes
         for attr in SIMATTR:
-            log.debug('Setup attribute: {0}'.format(attr))
-            self.attributes[attr] = setStat(int(configGetter(attr)))
+            log.debug('Setup attribute: %s', attr)
+            self.attributes[attr] = setStat(stats[attr])
 
         # Setup all the attack attributes
         self.attributes[ATT] = {}
         for attattr in action.ATTACKTYPES:
-            log.debug('Setup attack attribute: {0}'.format(attr))
-            self.attributes[ATT][attattr] = setStat(int(configGetter(attattr)))
+            log.debug('Setup attack attribute: %s', attr)
+            self.attributes[ATT][attattr] = setStat(stats[attattr])
 
     def _generate_commands(self, entries):
         """Generate the command objects for this unit"""
-        log.debug('Adding commands to unit %s' % self)
+        log.debug('Adding commands to unit %s', self)
         self.commands = []
+        self._commandIndex = None
 
         self.commands.append(command.Command('attack'))
 
@@ -145,7 +164,7 @@ class Unit(event.Event):
 
     def setName(self, name):
         """Sets a unique name for a unit."""
-        log.debug('Setting unique name {0}'.format(name))
+        log.debug('Setting unique name %s', name)
         self.uniqueName = name
 
     def turn(self, targets):
@@ -154,7 +173,17 @@ class Unit(event.Event):
         This will return an event to add to the combatlist if required.
 
         """
-        log.debug('Turn from %s next' % self.name)
+        log.debug('Turn from %s next', self.name)
+        return self.act(*self.plan(targets))
+
+    def plan(self, targets):
+        """Chooses a command and its target, from _targets_, for a turn
+
+        The target is None if there is none to choose from.
+
+        """
+        if self.auto:
+            return self.policy.plan(self, targets)
 
         choice = self.getChoice()
         targetChoice = self
@@ -163,20 +192,51 @@ class Unit(event.Event):
             log.debug('Prompting for a target')
             targetChoice = choice.getTarget(targets,
                                             self.team.allies,
-                                            auto=self.auto)
+                                            auto=self.auto,
+                                            rng=self.rng,
+                                            pools=self.targetPools)
+
+        return (choice, targetChoice)
+
+    async def planAsync(self, targets):
+        """Chooses a command and its target, as _plan_, without blocking the
+        event loop while the player decides
+
+        """
+        if self.auto:
+            return self.plan(targets)
+
+        log.debug('Getting an action, asynchronously')
+        choice = await userInputAsync(COMMANDPROMPT % self.name,
+                                      self.commandIndex())
+        targetChoice = self
+
+        if not choice.selfOnly:
+            log.debug('Prompting for a target')
+            targetChoice = await choice.getTargetAsync(targets)
+
+        return (choice, targetChoice)
+
+    def act(self, choice, targetChoice):
+        """Performs a command chosen by _plan_
+
+        This will return an event to add to the combatlist if required.
+
+        """
+        if targetChoice is None:
+            log.debug('%s has no target for %s', self.name, choice.name)
+            return None
 
         # Do action.
-        log.debug('%s uses %s on %s' % (self.name,
-                                        choice.name,
-                                        targetChoice.name))
+        log.debug('%s uses %s on %s',
+                  self.name, choice.name, targetChoice.name)
         return choice.activate(self, targetChoice)
 
     def state(self):
         """Returns the state of the unit"""
-        log.debug('Getting state for unit %s' % self.name)
-
         if self.attributes[HP].value == 0:
-            log.debug('Unit is dead')
+            if log.isEnabledFor(logs.DEBUG):
+                log.debug('Unit %s is dead', self.name)
             return DEAD
 
         return OK
@@ -184,34 +244,54 @@ class Unit(event.Event):
     def canHeal(self):
         """Determines if unit is in a healable state"""
         result = (self.state() != DEAD)
-        log.debug('Checking if can heal, result: %s' % result)
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Checking if can heal, result: %s', result)
         return result
 
     def canDamage(self):
         """Determines if unit can be damaged"""
         result = (self.state() != DEAD)
-        log.debug('Checking if can damage, result: %s' % result)
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Checking if can damage, result: %s', result)
         return result
 
+    def _hpChanged(self, wasAlive):
+        """Tells the HP watchers of a change in hitpoints, and the HP
+        listeners if the unit has died or come to life
+
+        """
+        for watcher in self.hpWatchers:
+            watcher(self)
+
+        alive = self.attributes[HP].value != 0
+        if alive != wasAlive:
+            log.debug('Unit %s is now %s', self.name, self.state())
+            for listener in self.hpListeners:
+                listener(self, alive)
+
     def kill(self):
         """Kill a unit"""
-        log.debug('Killing unit %s' % self.name)
+        log.debug('Killing unit %s', self.name)
 
+        wasAlive = self.state() != DEAD
         self.attributes[HP].min()
+        self._hpChanged(wasAlive)
 
     def reset(self):
         """Reset a unit"""
-        log.debug('Resetting unit %s' % self.name)
+        log.debug('Resetting unit %s', self.name)
 
-        log.debug('Reset {0}'.format(HP))
+        log.debug('Reset %s', HP)
+        wasAlive = self.state() != DEAD
         self.attributes[HP].reset()
+        self._hpChanged(wasAlive)
 
         for attr in SIMATTR:
-            log.debug('Reset {0}'.format(attr))
+            log.debug('Reset %s', attr)
             self.attributes[attr].reset()
 
         for attAttr in action.ATTACKTYPES:
-            log.debug('Reset attack-{0}'.format(attAttr))
+            log.debug('Reset attack-%s', attAttr)
             self.attributes[ATT][attAttr].reset()
 
     def buff(self, attr, amount):
@@ -220,7 +300,7 @@ class Unit(event.Event):
         Returns the actual change in the attribute.
 
         """
-        log.debug('Buffing {0} by {1}'.format(attr, amount))
+        log.debug('Buffing %s by %s', attr, amount)
 
         if attr in action.ATTACKTYPES:
             log.debug('Attribute is an attack type')
@@ -233,48 +313,64 @@ class Unit(event.Event):
             log.debug('Attribute is a base type')
             attrLoc = self.attributes[attr]
 
-        return attrLoc.increase(amount)
+        wasAlive = self.state() != DEAD
+        change = attrLoc.increase(amount)
+        if attr == HP:
+            self._hpChanged(wasAlive)
+        return change
 
     def damage(self, amount):
         """Take set amount of damage"""
-        log.debug('Unit %s takes %d damage' % (self.name, amount))
+        log.debug('Unit %s takes %d damage', self.name, amount)
 
         if self.canDamage():
             self.attributes[HP].reduce(amount)
+            self._hpChanged(True)
 
     def damageFraction(self, fraction):
         """Take fractional damage"""
-        log.debug('Unit %s takes %d fractional damage' % (self.name, fraction))
+        log.debug('Unit %s takes %d fractional damage', self.name, fraction)
 
         if self.canDamage():
             self.attributes[HP].reduceFraction(fraction)
+            self._hpChanged(True)
 
     def heal(self, amount):
         """Heal a set amount"""
-        log.debug('Unit %s heals %d' % (self.name, amount))
+        log.debug('Unit %s heals %d', self.name, amount)
 
         if self.canHeal():
             self.attributes[HP].increase(amount)
+            self._hpChanged(True)
 
     def healFraction(self, fraction):
         """Heal a fractional amount"""
-        log.debug('Unit %s heals by fraction %d' % (self.name, fraction))
+        log.debug('Unit %s heals by fraction %d', self.name, fraction)
 
         if self.canHeal():
             self.attributes[HP].increaseFraction(fraction)
+            self._hpChanged(True)
 
     def listCommands(self):
         """Returns commands available for a unit"""
-        log.debug('Getting commands for %s' % self.name)
+        log.debug('Getting commands for %s', self.name)
         return ', '.join([command.name for command in self.commands])
 
+    def commandIndex(self):
+        """Returns the index of the unit's commands for prompts, built the
+        first time the unit is prompted for one
+
+        """
+        if self._commandIndex is None:
+            self._commandIndex = OptionIndex(self.commands)
+        return self._commandIndex
+
     def getChoice(self):
         """Gets an action for a turn"""
         log.debug('Getting an action')
 
         if self.auto:
             log.debug('Unit is automated')
-            return random.choice(self.commands)
+            return self.rng.choice(self.commands)
 
-        return userInput('Commands available to %s:' % self.name,
-                         [cmd for cmd in self.commands])
+        return userInput(COMMANDPROMPT % self.name, self.commandIndex())
@@ -4,21 +4,36 @@
 """Unittest script for combat functions"""
 
 # Python imports.
+import asyncio
+import io
 import logging as log
+import random
 import unittest
 import sys
 
 sys.path.append('.')
 
 # Module imports.
+from utils.exceptions import CombatException, RecordException
 import units.unit as unit
 import combat.action as action
 import combat.combat as combat
+import combat.combatlist as combatlist
 import combat.command as command
+import combat.estimate as estimate
 import combat.event as event
+import combat.record as record
+import combat.scheduler as scheduler
+import combat.simulate as simulate
+import combat.summary as summary
+import combat.targets as targets
 import combat.team as team
-from unittests.testutils.testutils import (soh, getKeys,
-                                           getTestUnit, getTestCombat)
+import combat.victory as victory
+import display.interface as intface
+import units.policy as policy
+import utils.registry as registry
+from unittests.testutils.testutils import (getKeys, getTestUnit,
+                                           getTestCombat)
 
 log.basicConfig(filename='logs/combattests.log',
                 level=log.DEBUG,
@@ -135,11 +150,19 @@ class TestCombatModule(unittest.TestCase):
         newUnit = getTestUnit()
         newCombat = getTestCombat()
 
-        soh.hideStdOut()
-        newCombat.printStatus()
-        newCombat.printOrder()
-        newCombat.printCommands(newUnit)
-        soh.restoreStdOut()
+        memory = intface.MemorySink()
+        previous = intface.setSink(memory)
+        try:
+            newCombat.printStatus()
+            newCombat.printOrder()
+            newCombat.printCommands(newUnit)
+        finally:
+            intface.setSink(previous)
+
+        output = memory.getvalue()
+        for unt in newCombat.units:
+            self.assertIn(unt.name, output, 'Unit missing from display')
+        self.assertIn('Available actions for %s:' % newUnit.name, output)
 
     def testCombatVictories(self):
         """Test of combat victory conditions.
@@ -166,7 +189,8 @@ class TestCombatModule(unittest.TestCase):
                 self.assertEqual(unt.state(), unit.OK,
                                  'Unit not reset correctly during test')
 
-            newCombat = combat.Combat([loser, winner])
+            newCombat = combat.Combat([loser, winner],
+                                      sink=intface.NullSink())
 
             if isinstance(actions, (list, tuple)):
                 for actn in actions:
@@ -174,24 +198,127 @@ class TestCombatModule(unittest.TestCase):
             else:
                 actions()
 
-            soh.hideStdOut()
             result = newCombat.run()
-            soh.restoreStdOut()
 
             self.assertEqual(victors, result,
                              ('Deathmatch victor returned "{0}"; expected '
                               '"{1}').format(result, victors))
 
+    def testCombatSeed(self):
+        """Test a seeded combat replays exactly, without global random state"""
+        log.info('Starting combat seed unit-test')
+
+        def replay(seed):
+            units = [unit.Unit('mech', 'rebels'),
+                     unit.Unit('drone', 'autoarmy')]
+            newCombat = combat.Combat(units, headless=True, seed=seed)
+            for unt in units:
+                self.assertIs(unt.rng, newCombat.rng,
+                              'Unit does not share the combat stream')
+
+            history = []
+            for num in range(30):
+                actor = newCombat.spin()
+                actor.turn(newCombat.units)
+                history.append((actor.name,
+                                [unt.attributes[unit.HP].value
+                                 for unt in units]))
+            return history
+
+        state = random.getstate()
+        first = replay(5)
+        self.assertEqual(random.getstate(), state,
+                         'Seeded combat used the global random stream')
+
+        random.seed(99)
+        self.assertEqual(first, replay(5), 'Seeded combat did not replay')
+
     def testCombatComplete(self):
         """Run a test combat an ensure that it completes"""
         log.info('Starting complete combat unit-test')
 
-        soh.hideStdOut()
+        newCombat = getTestCombat(sink=intface.NullSink())
+        self.assertTrue(newCombat.run(), 'Combat had no victor')
+
+
+    def testCombatAsync(self):
+        """Test a player's combat runs with background tasks, and without"""
+        log.info('Starting asynchronous combat unit-test')
+
+        def playerCombat():
+            units = [unit.Unit('mech', 'rebels', auto=False),
+                     unit.Unit('drone', 'autoarmy')]
+            return combat.Combat(units, seed=3, sink=intface.NullSink())
+
+        turns = []
+
+        async def background(newCombat):
+            while True:
+                turns.append(newCombat.turns)
+                await asyncio.sleep(0)
+
+        stdin = sys.stdin
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            sys.stdin = io.StringIO('attack\ndrone0\n' * 100)
+            first = playerCombat()
+            victors = asyncio.run(first.runAsync(background=[background]))
+
+            sys.stdin = io.StringIO('attack\ndrone0\n' * 100)
+            second = playerCombat()
+            self.assertEqual(second.run(), victors)
+        finally:
+            sys.stdin = stdin
+            sys.stdout = stdout
+
+        self.assertEqual(victors, ['rebels'])
+        self.assertEqual(first.turns, second.turns)
+        self.assertEqual(len(set(turns)), first.turns,
+                         'Background task not run between every turn')
 
-        newCombat = getTestCombat()
-        newCombat.run()
 
-        soh.restoreStdOut()
+    def testListenersDetached(self):
+        """Test combats only listen to their units while running"""
+        log.info('Starting combat listeners unit-test')
+
+        units = [unit.Unit('drone', 'rebels'),
+                 unit.Unit('drone', 'autoarmy')]
+        for unt in units:
+            unt.policy = policy.getPolicy(policy.FOCUS,
+                                          registry.unitTemplates()['drone'])
+
+        def listening():
+            return [(unt.hpListeners, unt.hpWatchers, unt.targetPools,
+                     unt.teamSummaries) for unt in units]
+
+        idle = listening()
+        combat.Combat(units, headless=True, mass=True)
+        self.assertEqual(listening(), idle, 'Unrun combat left listeners')
+
+        failing = combat.Combat(units, headless=True, mass=True)
+
+        def fail(batch):
+            self.assertIsNotNone(units[0].targetPools)
+            raise CombatException('Failed turn')
+        failing._takeBatch = fail
+        self.assertRaises(CombatException, failing.run)
+        self.assertEqual(listening(), idle, 'Failed run left listeners')
+
+        async def cancelled():
+            task = asyncio.ensure_future(
+                combat.Combat(units, headless=True).runAsync(
+                    background=[lambda newCombat: asyncio.sleep(10)]))
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        asyncio.run(cancelled())
+        self.assertEqual(listening(), idle, 'Cancelled run left listeners')
+
+        for unt in units:
+            unt.reset()
+        self.assertTrue(combat.Combat(units, headless=True, seed=2).run())
+        self.assertEqual(listening(), idle, 'Finished run left listeners')
 
 
 class TestEventModule(unittest.TestCase):
@@ -234,6 +361,635 @@ class TestEventModule(unittest.TestCase):
                          'Timer did not pop and die when it should have')
 
 
+class TestSchedulerModule(unittest.TestCase):
+    """Unit tests for the scheduler module"""
+
+    def testMatchesTickPolling(self):
+        """Test the scheduler fires entries as round-robin polling does.
+
+        The reference checks every entry's timer in turn, resuming after the
+        last entry to fire, as combats have always done.
+
+        """
+        log.info('Starting scheduler order unit-test')
+
+        rand = random.Random(11)
+
+        refList = []
+        refNext = [0]
+
+        def refSpin():
+            while True:
+                active = refList[refNext[0]:] + refList[:refNext[0]]
+                for entry in active:
+                    result = entry.checkValid()
+                    if result is event.SILENT:
+                        continue
+                    index = refList.index(entry)
+                    if result is event.POP_DIE:
+                        refList.remove(entry)
+                        refNext[0] = index
+                    else:
+                        refNext[0] = index + 1
+                    if refNext[0] > len(refList):
+                        refNext[0] = 0
+                    return entry
+
+        def refRemove(entry):
+            index = refList.index(entry)
+            refList.remove(entry)
+            if index < refNext[0]:
+                refNext[0] -= 1
+
+        sched = scheduler.Scheduler()
+        pairs = {}
+
+        def addPair():
+            count = rand.randrange(0, 12)
+            recurring = rand.random() < 0.7
+            refEvent = event.Event(count, recurring)
+            schedEvent = event.Event(count, recurring)
+            pairs[schedEvent] = refEvent
+            refList.append(refEvent)
+            sched.add(schedEvent)
+
+        for num in range(8):
+            addPair()
+
+        for step in range(2000):
+            (fired, result) = sched.pop()
+            self.assertIs(pairs[fired], refSpin())
+
+            if result is event.POP_DIE:
+                del pairs[fired]
+            elif rand.random() < 0.2:
+                # Entries may restart their own timer while acting.
+                count = rand.randrange(0, 12)
+                event.Event.__init__(fired, count, rand.random() < 0.5)
+                event.Event.__init__(pairs[fired], count,
+                                     fired.recurring)
+
+            if rand.random() < 0.3 or len(pairs) < 2:
+                addPair()
+            if rand.random() < 0.1 and len(pairs) > 2:
+                entry = rand.choice(list(pairs))
+                sched.remove(entry)
+                refRemove(pairs.pop(entry))
+
+
+class TestSimulateModule(unittest.TestCase):
+    """Unit tests for the simulate module"""
+
+    roster = simulate.parseRoster('mech:rebels,drone:autoarmy')
+
+    def testDeterministicSeeds(self):
+        """Test a seed always gives the same combat"""
+        log.info('Starting simulate determinism unit-test')
+
+        for seed in range(5):
+            self.assertEqual(simulate.runCombat(self.roster, seed),
+                             simulate.runCombat(self.roster, seed),
+                             'Seed %d gave different combats' % seed)
+
+    def testWorkersAgree(self):
+        """Test a batch gives the same results over any number of workers"""
+        log.info('Starting simulate workers unit-test')
+
+        seeds = range(40)
+        single = simulate.simulate(self.roster, seeds, workers=1)
+        pooled = simulate.simulate(self.roster, seeds, workers=2)
+
+        self.assertEqual(single, pooled,
+                         'Batch results depend on the number of workers')
+        self.assertEqual(single['combats'], len(seeds))
+        self.assertAlmostEqual(sum(single['winRates'].values()), 1)
+
+    def testHeadlessCombat(self):
+        """Test a headless combat displays nothing and may time out"""
+        log.info('Starting headless combat unit-test')
+
+        oldStdout = sys.stdout
+        sys.stdout = output = io.StringIO()
+        try:
+            result = simulate.runCombat(self.roster, 0)
+            undecided = simulate.runCombat(self.roster, 0, maxTurns=1)
+        finally:
+            sys.stdout = oldStdout
+
+        self.assertEqual(output.getvalue(), '', 'Headless combat printed')
+        self.assertTrue(result['victors'], 'Combat had no victor')
+        self.assertIsNone(undecided['victors'],
+                          'Combat decided within one turn')
+        self.assertEqual(undecided['turns'], 1)
+
+        self.assertRaises(CombatException, combat.Combat,
+                          [unit.Unit('mech', 'rebels', auto=False)],
+                          headless=True)
+
+    def testPercentiles(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(simulate.percentiles(values, (5, 50, 100)),
+                         {5: 5, 50: 50, 100: 100})
+        self.assertEqual(simulate.percentiles([7], (5, 95)), {5: 7, 95: 7})
+
+    def testEmptyBatches(self):
+        """Test empty seed ranges are refused, and empty batches summarised"""
+        self.assertEqual(simulate.parseSeeds('5:8'), range(5, 8))
+        for text in ('5:5', '10:0', '5', 'a:b'):
+            self.assertRaises(CombatException, simulate.parseSeeds, text)
+
+        self.assertEqual(simulate.aggregate([]),
+                         {'combats': 0, 'winRates': {}, 'turns': None,
+                          'damage': {}})
+        self.assertEqual(simulate.simulate(self.roster, range(0))['combats'],
+                         0)
+
+    def testBadArguments(self):
+        """Test invalid rosters and seeds are reported as usage errors"""
+        argv = sys.argv
+        stderr = sys.stderr
+        try:
+            for args in (['drone:autoarmy', '--seeds', '5:5'],
+                         ['drone:autoarmy', '--seeds', '10:0'],
+                         ['drone:autoarmy:x'],
+                         ['drone']):
+                sys.argv = ['simulate'] + args
+                sys.stderr = errors = io.StringIO()
+                with self.assertRaises(SystemExit) as context:
+                    simulate.main()
+                self.assertEqual(context.exception.code, 2,
+                                 'Arguments %s not a usage error' % args)
+                self.assertIn('error: argument', errors.getvalue())
+        finally:
+            sys.argv = argv
+            sys.stderr = stderr
+
+
+@unittest.skipIf(estimate.numpy is None, 'NumPy is not installed')
+class TestEstimateModule(unittest.TestCase):
+    """Unit tests for the estimate module"""
+
+    class FixedRolls:
+        """Random stream returning set damage scalers"""
+
+        def __init__(self, scalers):
+            self.scalers = iter(scalers)
+
+        def randint(self, low, high):
+            return next(self.scalers)
+
+    def testMatchesAction(self):
+        """Test estimated damage rolls match those made by actions"""
+        log.info('Starting estimate damage unit-test')
+
+        scalers = list(range(estimate.SCALERMIN, estimate.SCALERMAX + 1))
+        attack = command.Command('attack')
+
+        for (unitId, buffs) in [('mech', ()),
+                                ('drone', ()),
+                                ('mech', ('psyche-up',)),
+                                ('mech', ('armour', 'armour'))]:
+            caller = unit.Unit(unitId, 'rebels')
+            target = unit.Unit('drone', 'autoarmy')
+            for buffId in buffs:
+                definition = command.Command(buffId)
+                for attr in definition.buffAttrs:
+                    caller.buff(attr, definition.amount)
+
+            caller.rng = self.FixedRolls(scalers)
+            expected = []
+            for scaler in scalers:
+                target.attributes[unit.HP].reset()
+                expected.append(action.Action(attack, caller, target).impact)
+
+            stats = estimate.buffedStats(unitId, buffs)
+            rolls = estimate.damageRolls(attack.amount, stats[action.MELEE],
+                                         stats[unit.DEF],
+                                         estimate.numpy.array(scalers))
+
+            self.assertEqual(expected, rolls.tolist(),
+                             'Estimated damage differs from actions for %s '
+                             'with buffs %s' % (unitId, buffs))
+
+    def testTimeToKill(self):
+        """Test the time to kill lies within the bounds of single rolls"""
+        log.info('Starting estimate time to kill unit-test')
+
+        result = estimate.timeToKill('attack', 'drone', 'mech', trials=5000,
+                                     seed=3)
+        damage = estimate.damageDistribution('attack', 'drone', rolls=5000,
+                                             seed=3)
+
+        hitpoints = estimate.buffedStats('mech')[unit.HP]
+        self.assertGreaterEqual(result['hits']['min'],
+                                -(-hitpoints // damage['max']))
+        self.assertLessEqual(result['hits']['max'],
+                             -(-hitpoints // damage['min']))
+        self.assertEqual(result['ticks']['min'],
+                         result['hits']['min'] *
+                         estimate.buffedStats('drone')[unit.SPE])
+
+        self.assertEqual(result, estimate.timeToKill('attack', 'drone',
+                                                     'mech', trials=5000,
+                                                     seed=3),
+                         'Seeded estimate did not repeat')
+
+    def testNoDamage(self):
+        """Test attacks which can never kill count as infinite"""
+        result = estimate.timeToKill('attack', 'mech', 'mech',
+                                     buffs=('armour', 'armour'), trials=10)
+        self.assertEqual(result['hits']['min'], float('inf'))
+
+
+class TestRecordModule(unittest.TestCase):
+    """Unit tests for the record module"""
+
+    def testReplay(self):
+        """Test replayed combats end as the combats themselves did"""
+        log.info('Starting combat record replay unit-test')
+
+        stream = io.BytesIO()
+        record.writeHeader(stream)
+        recorder = record.Recorder(stream)
+
+        played = []
+        for seed in range(20):
+            units = [unit.Unit('mech', 'rebels'),
+                     unit.Unit('drone', 'autoarmy'),
+                     unit.Unit('drone', 'autoarmy')]
+            newCombat = combat.Combat(units, headless=True, seed=seed,
+                                      recorder=recorder)
+            victors = newCombat.run(maxTurns=None if seed % 5 else 10)
+            played.append((seed, victors, newCombat.turns,
+                           [(unt.name, unt.attributes[unit.HP].value,
+                             unt.getDefence(), unt.getAttack(action.MELEE))
+                            for unt in units]))
+
+        replayed = list(record.replay(stream.getvalue()))
+        self.assertEqual(len(replayed), len(played))
+
+        kinds = set()
+        for (replay, (seed, victors, turns, states)) in zip(replayed, played):
+            self.assertEqual(replay.seed, seed)
+            self.assertEqual(replay.victors,
+                             None if victors is None else tuple(victors))
+            self.assertEqual(replay.turns, turns)
+            self.assertEqual([(unt.name, unt.hitpoints,
+                               unt.stats[unit.DEF], unt.stats[action.MELEE])
+                              for unt in replay.units], states,
+                             'Replay of seed %d differs from combat' % seed)
+            kinds.update(rec.kind for rec in replay.records)
+
+        for kind in [record.ATTACK, record.BUFF, record.EXPIRE,
+                     record.INACTIVE]:
+            self.assertIn(kind, kinds, 'No records of kind %d' % kind)
+
+    def testInvalidLog(self):
+        """Test invalid and truncated logs are rejected"""
+        recorder = record.Recorder()
+        combat.Combat([unit.Unit('drone', 'rebels'),
+                       unit.Unit('drone', 'autoarmy')], headless=True,
+                      seed=1, recorder=recorder).run()
+        data = recorder.getvalue()
+
+        header = record.HEADER.pack(record.MAGIC, record.VERSION)
+        for invalid in [b'', b'XXXX\x01\x00' + data, header + data[:-3],
+                        header + data + data[:-3], header + b'\x63' + data]:
+            with self.assertRaises(RecordException):
+                list(record.replay(invalid))
+
+
+class TestVictoryModule(unittest.TestCase):
+    """Unit tests for the victory module"""
+
+    def _scanDeathmatch(self, units):
+        """Reference deathmatch check, scanning every unit"""
+        liveTeams = {}
+        for unt in units:
+            if unt.state() != unit.DEAD and unt.team.teamId not in liveTeams:
+                liveTeams[unt.team.teamId] = unt.team.allies
+
+        for (teamId, allies) in liveTeams.items():
+            for otherTeam in liveTeams:
+                if otherTeam not in allies:
+                    return None
+        return list(liveTeams)
+
+    def testMatchesScan(self):
+        """Test tracked deathmatches end as a full scan of units would,
+        in ordinary and mass combats
+
+        """
+        log.info('Starting victory tracking unit-test')
+
+        rand = random.Random(4)
+
+        # 'north' counts 'south' as an ally, but not the other way round.
+        alliances = {'north': ('north', 'south'),
+                     'south': ('south',),
+                     'east': ('east', 'west'),
+                     'west': ('west', 'east')}
+
+        for mass in (False, True):
+            units = []
+            for teamId in sorted(alliances) * 2:
+                unt = unit.Unit('drone', 'rebels')
+                unt.team = team.Team('rebels')
+                unt.team.teamId = teamId
+                unt.team.allies = alliances[teamId]
+                units.append(unt)
+
+            condition = victory.Deathmatch()
+            newCombat = combat.Combat(units, victory=condition, mass=mass)
+            newCombat.attach()
+
+            for step in range(500):
+                unt = rand.choice(units)
+                rand.choice([unt.kill, unt.reset,
+                             lambda: unt.damage(rand.randrange(12)),
+                             lambda: unt.buff(unit.HP,
+                                              rand.randrange(-5, 5))])()
+
+                self.assertEqual(condition.check(),
+                                 self._scanDeathmatch(units),
+                                 'Tracked victory differs at step %d' % step)
+
+            newCombat.detach()
+            for unt in units:
+                self.assertNotIn(condition.unitChanged, unt.hpListeners)
+
+    def testConditions(self):
+        """Test the last-standing, survival and VIP conditions"""
+        log.info('Starting victory conditions unit-test')
+
+        def newUnits():
+            return [unit.Unit('drone', 'rebels'),
+                    unit.Unit('drone', 'rebels'),
+                    unit.Unit('drone', 'autoarmy')]
+
+        units = newUnits()
+        newCombat = combat.Combat(units, victory=combat.LASTSTANDING,
+                                  headless=True)
+        newCombat.attach()
+        units[2].kill()
+        self.assertIsNone(newCombat.checkCombatEnd(),
+                          'Last standing ended with two units alive')
+        units[1].kill()
+        self.assertEqual(newCombat.checkCombatEnd(), ['rebels'])
+        newCombat.detach()
+
+        units = newUnits()
+        newCombat = combat.Combat(units, headless=True, seed=2,
+                                  victory=victory.Survive('autoarmy', 3))
+        newCombat.attach()
+        self.assertIsNone(newCombat.checkCombatEnd())
+        self.assertEqual(newCombat.run(), ['autoarmy'])
+        self.assertGreaterEqual(newCombat.scheduler.lap, 3)
+
+        units = newUnits()
+        newCombat = combat.Combat(units, headless=True,
+                                  victory=victory.ProtectVip(units[0]))
+        newCombat.attach()
+        units[2].kill()
+        self.assertEqual(newCombat.checkCombatEnd(), ['rebels'])
+        units[2].reset()
+        units[0].kill()
+        self.assertEqual(newCombat.checkCombatEnd(), ['autoarmy'])
+        newCombat.detach()
+
+        self.assertRaises(CombatException, combat.Combat, newUnits(),
+                          victory=victory.ProtectVip(units[0]))
+        self.assertRaises(CombatException, combat.Combat, newUnits(),
+                          victory=victory.Survive('nobody', 3))
+        self.assertRaises(CombatException, combat.Combat, newUnits(),
+                          victory=99)
+
+    def testUnattachedChecks(self):
+        """Test combats check for victory outside of a run"""
+        log.info('Starting unattached victory unit-test')
+
+        units = [unit.Unit('drone', 'rebels'),
+                 unit.Unit('drone', 'autoarmy')]
+        newCombat = combat.Combat(units, headless=True)
+        self.assertRaises(CombatException, newCombat.victory.check)
+
+        self.assertIsNone(newCombat.checkCombatEnd())
+        self.assertIsNone(newCombat.conditionDeathmatch())
+        units[1].kill()
+        self.assertEqual(newCombat.checkCombatEnd(), ['rebels'])
+        self.assertEqual(newCombat.conditionDeathmatch(), ['rebels'])
+
+        for unt in units:
+            self.assertEqual(unt.hpListeners, [],
+                             'Check left listeners on %s' % unt.name)
+
+
+class TestCombatListModule(unittest.TestCase):
+    """Unit tests for the combatlist module"""
+
+    def testMatchesList(self):
+        """Test the combat list orders entries as a plain list would.
+
+        The reference keeps the index of the next entry to act in a list,
+        as combats used to.
+
+        """
+        log.info('Starting combat list order unit-test')
+
+        rand = random.Random(8)
+
+        refList = []
+        refNext = [0]
+
+        def refActed(entry, dies):
+            index = refList.index(entry)
+            if dies:
+                refList.remove(entry)
+                refNext[0] = index
+            else:
+                refNext[0] = index + 1
+            if refNext[0] > len(refList):
+                refNext[0] = 0
+
+        def refRemove(entry):
+            index = refList.index(entry)
+            refList.remove(entry)
+            if index < refNext[0]:
+                refNext[0] -= 1
+
+        entries = combatlist.CombatList()
+        names = iter(range(10 ** 6))
+
+        for step in range(3000):
+            choice = rand.random()
+            if choice < 0.3 or len(refList) < 2:
+                entry = next(names)
+                refList.append(entry)
+                entries.append(entry)
+            elif choice < 0.5:
+                entry = rand.choice(refList)
+                refRemove(entry)
+                entries.remove(entry)
+            else:
+                entry = rand.choice(refList)
+                dies = rand.random() < 0.3
+                refActed(entry, dies)
+                entries.acted(entry)
+                if dies:
+                    entries.remove(entry)
+
+            self.assertEqual(entries.active(),
+                             refList[refNext[0]:] + refList[:refNext[0]],
+                             'Combat list order differs at step %d' % step)
+            self.assertEqual(entries.active(3), entries.active()[:3])
+            self.assertEqual(list(entries), refList)
+
+        self.assertLess(len(entries.slots),
+                        2 * len(refList) + combatlist.MINCOMPACT + 1,
+                        'Combat list was not compacted')
+
+    def testCleanAdjacentDeaths(self):
+        """Test units dying together are all removed in one clean-up"""
+        units = [unit.Unit('drone', 'rebels'),
+                 unit.Unit('drone', 'autoarmy'),
+                 unit.Unit('drone', 'autoarmy'),
+                 unit.Unit('drone', 'autoarmy')]
+        newCombat = combat.Combat(units, headless=True)
+        newCombat.attach()
+
+        units[1].kill()
+        units[2].kill()
+        newCombat._cleanUnits()
+        newCombat.detach()
+
+        self.assertEqual(list(newCombat.combatList), [units[0], units[3]])
+        self.assertNotIn(units[2], newCombat.scheduler)
+
+
+class TestTargetsModule(unittest.TestCase):
+    """Unit tests for the targets module"""
+
+    def testMatchesFilter(self):
+        """Test target pools hold the live units a filter would give"""
+        log.info('Starting target pools unit-test')
+
+        rand = random.Random(5)
+
+        units = [unit.Unit(unitId, teamId)
+                 for unitId in ('drone', 'mech') * 3
+                 for teamId in ('rebels', 'autoarmy')]
+        pools = targets.TargetPools(units)
+
+        for step in range(500):
+            unt = rand.choice(units)
+            rand.choice([unt.kill, unt.reset,
+                         lambda: unt.damage(rand.randrange(12))])()
+
+            for allies in (['rebels'], ['autoarmy'], ['rebels', 'autoarmy']):
+                for offensive in (True, False):
+                    pool = pools._pool(allies, offensive)
+                    expected = [other for other in units
+                                if other.state() != unit.DEAD and
+                                (other.team.teamId in allies) != offensive]
+                    self.assertEqual(sorted(pool.units, key=id),
+                                     sorted(expected, key=id),
+                                     'Target pool differs at step %d' % step)
+
+        self.assertIs(units[0].targetPools, pools)
+        pools.detach()
+        for unt in units:
+            self.assertIsNone(unt.targetPools)
+            self.assertNotIn(pools.unitChanged, unt.hpListeners)
+
+    def testGetTarget(self):
+        """Test automated targets are taken from the pools if given"""
+        units = [unit.Unit('drone', 'rebels'),
+                 unit.Unit('drone', 'autoarmy'),
+                 unit.Unit('drone', 'autoarmy')]
+        pools = targets.TargetPools(units)
+        attack = command.Command('attack')
+
+        units[1].kill()
+        for seed in range(10):
+            self.assertIs(attack.getTarget(units, ['rebels'], auto=True,
+                                           rng=random.Random(seed),
+                                           pools=pools), units[2])
+
+        units[2].kill()
+        self.assertIsNone(attack.getTarget(units, ['rebels'], auto=True,
+                                           pools=pools))
+
+    def testMassCombat(self):
+        """Test mass combats are deterministic and batch their turns"""
+        log.info('Starting mass combat unit-test')
+
+        roster = simulate.parseRoster('drone:rebels:20,mech:autoarmy:10')
+        self.assertEqual(len(roster), 30)
+
+        result = simulate.runCombat(roster, 3, mass=True)
+        self.assertEqual(result, simulate.runCombat(roster, 3, mass=True),
+                         'Mass combat is not deterministic')
+        self.assertTrue(result['victors'], 'Mass combat had no victor')
+
+        units = [unit.Unit(unitId, teamId) for (unitId, teamId) in roster]
+        newCombat = combat.Combat(units, headless=True, seed=3, mass=True)
+        batch = newCombat.spinBatch()
+        self.assertGreater(len(batch), 1, 'Units due together not batched')
+        self.assertEqual(len(set(batch)), len(batch))
+        self.assertEqual(len(newCombat.spinBatch(2)), 2)
+
+        self.assertRaises(CombatException, simulate.parseRoster,
+                          'drone:rebels:0')
+
+
+class TestSummaryModule(unittest.TestCase):
+    """Unit tests for the summary module"""
+
+    def testMatchesScan(self):
+        """Test team summaries agree with a scan of the units"""
+        log.info('Starting team summaries unit-test')
+
+        rand = random.Random(6)
+
+        units = [unit.Unit(unitId, teamId)
+                 for unitId in ('drone', 'mech') * 4
+                 for teamId in ('rebels', 'autoarmy')]
+        summaries = summary.TeamSummaries(units)
+
+        for step in range(2000):
+            unt = rand.choice(units)
+            rand.choice([unt.kill, unt.reset,
+                         lambda: unt.damage(rand.randrange(12)),
+                         lambda: unt.heal(rand.randrange(12)),
+                         lambda: unt.buff(unit.HP, rand.randrange(-5, 5))])()
+
+            for (teamId, teamSummary) in summaries.teams.items():
+                live = [other for other in units
+                        if other.team.teamId == teamId and
+                        other.state() != unit.DEAD]
+                hitpoints = [other.attributes[unit.HP] for other in live]
+                self.assertEqual(
+                    (teamSummary.live, teamSummary.hitpoints,
+                     teamSummary.maxHitpoints),
+                    (len(live), sum(hp.value for hp in hitpoints),
+                     sum(hp.maximum for hp in hitpoints)),
+                    'Summary of %s differs at step %d' % (teamId, step))
+                self.assertIs(teamSummary.lowest(),
+                              min(live, default=None,
+                                  key=lambda other:
+                                  other.attributes[unit.HP].value))
+
+                self.assertLessEqual(len(teamSummary._heap),
+                                     2 * len(teamSummary.units) +
+                                     summary.MINREBUILD)
+
+        summaries.detach()
+        for unt in units:
+            self.assertIsNone(unt.teamSummaries)
+            self.assertEqual(unt.hpWatchers, [])
+
+
 class TestActionModule(unittest.TestCase):
     """Unit tests for the action module"""
 
@@ -328,6 +1084,14 @@ if __name__ == "__main__":
                       TestCommandModule,
                       TestActionModule,
                       TestTeamModule,
-                      TestEventModule]:
+                      TestEventModule,
+                      TestSchedulerModule,
+                      TestSimulateModule,
+                      TestEstimateModule,
+                      TestRecordModule,
+                      TestVictoryModule,
+                      TestCombatListModule,
+                      TestTargetsModule,
+                      TestSummaryModule]:
         suite = unittest.TestLoader().loadTestsFromTestCase(testClass)
         unittest.TextTestRunner(verbosity=3).run(suite)
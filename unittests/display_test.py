@@ -0,0 +1,419 @@
+#-----------------------------------------------------------------------------
+# Script: displaytests
+#-----------------------------------------------------------------------------
+"""Unittest script for display functions"""
+
+# Python imports.
+import asyncio
+import io
+import logging as log
+import os
+import random
+import re
+import unittest
+import sys
+
+sys.path.append('.')
+
+# Module imports.
+import display.interface as intface
+import combat.combat as combat
+import units.unit as unit
+
+log.basicConfig(filename='logs/displaytests.log',
+                level=log.DEBUG,
+                filemode='w',
+                format='%(levelname)s >> %(message)s')
+
+
+class Terminal:
+    """A minimal terminal, following the sequences the screen writes"""
+
+    SEQUENCE = re.compile(r'\033\[([0-9;]*)([A-Za-z])')
+
+    def __init__(self):
+        self.rows = {}
+        self.row = 0
+        self.col = 0
+        self.style = ''
+
+    def write(self, output):
+        """Applies _output_ to the terminal"""
+        start = 0
+        for match in self.SEQUENCE.finditer(output):
+            self._text(output[start:match.start()])
+            start = match.end()
+
+            (args, command) = match.groups()
+            if command == 'H':
+                (row, col) = args.split(';')
+                (self.row, self.col) = (int(row) - 1, int(col) - 1)
+            elif command == 'J' and args == '2':
+                self.rows = {}
+            elif command == 'J':
+                self.rows = {row: cells for (row, cells) in self.rows.items()
+                             if row < self.row}
+                self._line()[self.col:] = []
+            elif command == 'K':
+                self._line()[self.col:] = []
+            elif match.group() == intface.cleanColours():
+                self.style = ''
+            else:
+                self.style += match.group()
+        self._text(output[start:])
+
+    def _line(self):
+        return self.rows.setdefault(self.row, [])
+
+    def _text(self, text):
+        line = self._line()
+        for char in text:
+            line[self.col:self.col + 1] = [(self.style, char)]
+            self.col += 1
+
+    def lines(self):
+        """Returns the cells of each line"""
+        return [self.rows.get(row, []) for row in range(max(self.rows) + 1)]
+
+
+class TestScreen(unittest.TestCase):
+    """Unit tests for the screen of the interface module"""
+
+    def testMatchesFrames(self):
+        """Test drawing frame differences leaves each frame on screen"""
+        log.info('Starting screen differences unit-test')
+
+        rand = random.Random(2)
+        styles = ['', intface.bold(), intface.colour_8(3, False),
+                  intface.colour_256(200, True)]
+
+        def randomLine():
+            return ''.join(rand.choice(styles) + rand.choice('ab  ')
+                           for num in range(rand.randrange(12)))
+
+        output = io.StringIO()
+        screen = intface.Screen(output)
+        terminal = Terminal()
+        frame = [randomLine() for num in range(6)]
+
+        for step in range(300):
+            frame = [line if rand.random() < 0.7 else randomLine()
+                     for line in frame[:rand.randrange(4, 8)]]
+            frame += [randomLine() for num in range(4 - len(frame))]
+
+            screen.startFrame()
+            for line in frame:
+                screen.addLine(line)
+            screen.endFrame()
+
+            terminal.write(output.getvalue())
+            output.seek(0)
+            output.truncate()
+
+            expected = [list(intface._cells(line)) for line in frame]
+            self.assertEqual(terminal.lines()[:len(frame)], expected,
+                             'Screen differs at step %d' % step)
+            self.assertEqual(terminal.row, len(frame))
+
+    def testChangedCells(self):
+        """Test only changed cells are written"""
+        output = io.StringIO()
+        screen = intface.Screen(output)
+
+        for text in ('HP 10/10', 'HP  9/10', 'HP  9/10', 'HP 9'):
+            output.seek(0)
+            output.truncate()
+            screen.startFrame()
+            screen.addLine('Unit')
+            screen.addLine(text)
+            screen.endFrame()
+
+        self.assertEqual(output.getvalue(),
+                         (intface.MOVE_CURSOR % (2, 4)) + '9' +
+                         intface.CLEAR_LINE +
+                         (intface.MOVE_CURSOR % (3, 1)) + intface.CLEAR_BELOW)
+
+    def testCombatFrames(self):
+        """Test a displayed combat draws each turn in one write"""
+        log.info('Starting combat frames unit-test')
+
+        class Writes(io.StringIO):
+            count = 0
+
+            def write(self, text):
+                self.count += 1
+                return io.StringIO.write(self, text)
+
+        units = [unit.Unit('mech', 'rebels'), unit.Unit('drone', 'autoarmy')]
+        newCombat = combat.Combat(units, seed=4)
+
+        output = Writes()
+        intface.screen.stream = output
+        intface.screen.invalidate()
+        try:
+            newCombat.run()
+        finally:
+            intface.screen.stream = None
+
+        self.assertEqual(output.count, newCombat.turns)
+        self.assertLess(len(output.getvalue()),
+                        newCombat.turns * 1000,
+                        'Frames were not drawn by their differences')
+
+
+class TestSinks(unittest.TestCase):
+    """Unit tests for the output sinks of the interface module"""
+
+    def tearDown(self):
+        intface.setSink(intface.screen)
+
+    def testNullSink(self):
+        """Test a null sink writes nothing and formats nothing"""
+        log.info('Starting null sink unit-test')
+
+        previous = intface.setSink(intface.NullSink())
+        self.assertIs(previous, intface.screen)
+
+        # Text which cannot be formatted is never looked at.
+        intface.printText(None)
+        intface.printTwoColumns(None, None)
+        intface.printLine(None)
+
+        units = [unit.Unit('mech', 'rebels'), unit.Unit('drone', 'autoarmy')]
+        newCombat = combat.Combat(units, seed=4)
+        newCombat.printStatus()
+        self.assertTrue(newCombat.run())
+
+    def testMemorySink(self):
+        """Test a memory sink keeps lines and frames"""
+        log.info('Starting memory sink unit-test')
+
+        memory = intface.MemorySink()
+        intface.setSink(memory)
+
+        intface.printText('one\ntwo')
+        intface.startFrame()
+        intface.printBlank()
+        intface.endFrame()
+
+        self.assertEqual(memory.lines(),
+                         [intface.palette.text.format('one'),
+                          intface.palette.text.format('two'),
+                          intface.palette.blank])
+        self.assertEqual(memory.frames, [intface.palette.blank + '\n'])
+
+        memory.clear()
+        self.assertEqual(memory.getvalue(), '')
+
+    def testStdoutSink(self):
+        """Test a stdout sink writes each frame in one write"""
+        log.info('Starting stdout sink unit-test')
+
+        class Writes(io.StringIO):
+            count = 0
+
+            def write(self, text):
+                self.count += 1
+                return io.StringIO.write(self, text)
+
+        output = Writes()
+        intface.setSink(intface.StdoutSink(output))
+
+        intface.printText('Before')
+        intface.startFrame()
+        intface.printSpacer()
+        intface.printText('Inside\nframe')
+        intface.printSpacer()
+        self.assertEqual(output.count, 0, 'Frame written before it ended')
+        intface.endFrame()
+
+        self.assertEqual(output.count, 1)
+        self.assertEqual(output.getvalue().count('\n'), 5)
+
+    def testCombatSink(self):
+        """Test a combat writes through its own sink, only while running"""
+        log.info('Starting combat sink unit-test')
+
+        memory = intface.MemorySink()
+        units = [unit.Unit('mech', 'rebels'), unit.Unit('drone', 'autoarmy')]
+        newCombat = combat.Combat(units, seed=4, sink=memory)
+
+        stdout = sys.stdout
+        sys.stdout = output = io.StringIO()
+        try:
+            newCombat.run()
+        finally:
+            sys.stdout = stdout
+
+        self.assertEqual(output.getvalue(), '', 'Combat printed to stdout')
+        self.assertIs(intface.sink, intface.screen, 'Sink not restored')
+        self.assertEqual(len(memory.frames), newCombat.turns)
+        self.assertIn('Upcoming turns:', memory.frames[0])
+
+        headless = combat.Combat([unit.Unit('drone', 'autoarmy')],
+                                 headless=True)
+        self.assertFalse(headless.sink.enabled)
+
+
+class Option:
+    """An option of a prompt, as a command or unit would be"""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class TestOptionIndex(unittest.TestCase):
+    """Unit tests for the option index of prompts"""
+
+    def setUp(self):
+        self.options = [Option(name) for name in
+                        ('Attack', 'armour', 'pass', 'drone1', 'drone10')]
+        self.index = intface.OptionIndex(self.options)
+
+    def testMatches(self):
+        """Test options are matched by name, unique prefix and number"""
+        log.info('Starting option index unit-test')
+
+        (attack, armour, passing, drone1, drone10) = self.options
+        for (choice, option) in [('attack', attack),
+                                 ('ATTACK', attack),
+                                 ('at', attack),
+                                 ('arm', armour),
+                                 ('p', passing),
+                                 ('drone1', drone1),
+                                 ('drone10', drone10),
+                                 ('2', armour),
+                                 ('5', drone10),
+                                 ('a', None),
+                                 ('drone', None),
+                                 ('0', None),
+                                 ('6', None),
+                                 ('attacks', None),
+                                 ('', None)]:
+            self.assertIs(self.index.match(choice), option,
+                          'Wrong option for "%s"' % choice)
+
+        self.assertEqual(self.index.listing,
+                         '1 Attack, 2 armour, 3 pass, 4 drone1, 5 drone10')
+
+    def testUserInput(self):
+        """Test a prompt asks again until an option is chosen"""
+        stdin = sys.stdin
+        sys.stdin = io.StringIO('a\n9\ndr\ndrone10\n')
+        memory = intface.MemorySink()
+        previous = intface.setSink(memory)
+        try:
+            choice = intface.userInput('Choose:', self.index)
+        finally:
+            sys.stdin = stdin
+            intface.setSink(previous)
+
+        self.assertIs(choice, self.options[4])
+        self.assertEqual(memory.getvalue().count('Choose:'), 4)
+
+
+class TestAsyncInput(unittest.TestCase):
+    """Unit tests for reading input without blocking the event loop"""
+
+    def setUp(self):
+        self.stdin = sys.stdin
+        self.stdout = sys.stdout
+        sys.stdout = io.StringIO()
+
+    def tearDown(self):
+        sys.stdin = self.stdin
+        sys.stdout = self.stdout
+
+    def testWaitsWithoutBlocking(self):
+        """Test other tasks run while waiting for input from a pipe"""
+        log.info('Starting asynchronous input unit-test')
+
+        (readEnd, writeEnd) = os.pipe()
+        sys.stdin = os.fdopen(readEnd)
+        options = [Option('Attack'), Option('Pass')]
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(len(ticks))
+                if len(ticks) == 5:
+                    os.write(writeEnd, b'wait\npass\n')
+                await asyncio.sleep(0.001)
+
+        async def choose():
+            task = asyncio.ensure_future(ticker())
+            try:
+                return await intface.userInputAsync('Choose:', options)
+            finally:
+                task.cancel()
+
+        try:
+            choice = asyncio.run(choose())
+        finally:
+            sys.stdin.close()
+            os.close(writeEnd)
+
+        self.assertIs(choice, options[1])
+        self.assertGreaterEqual(len(ticks), 5,
+                                'Event loop blocked waiting for input')
+
+    def testReadsUnwatchableInput(self):
+        """Test input which cannot be watched is read on a worker thread"""
+        sys.stdin = io.StringIO('attack\n')
+        options = [Option('Attack')]
+
+        choice = asyncio.run(intface.userInputAsync('Choose:', options))
+        self.assertIs(choice, options[0])
+
+        self.assertRaises(EOFError, asyncio.run,
+                          intface.userInputAsync('Choose:', options))
+
+
+class TestColours(unittest.TestCase):
+    """Unit tests for the colour schemes of the interface module"""
+
+    def tearDown(self):
+        intface.setColours(0)
+
+    def testSchemes(self):
+        """Test precompiled schemes match colours applied on the fly"""
+        log.info('Starting colour schemes unit-test')
+
+        for count in sorted(intface.SCHEMES):
+            intface.setColours(count)
+            self.assertEqual(intface.clrs, count)
+
+            subdued = intface.applyColours(intface.FORE_SUBDUED,
+                                           intface.BACK_NORM)
+            reset = intface.applyColours(intface.FORE_NORM,
+                                         intface.BACK_NORM)
+            self.assertEqual(intface.subduedColours(), subdued)
+            self.assertEqual(intface.resetColours(), reset)
+            self.assertEqual(intface.hightlitColours(),
+                             intface.hightlitColours(intface.FORE_HIGHLIGHT,
+                                                     intface.BACK_NORM))
+            self.assertEqual(intface.INTLINESTART,
+                             subdued + intface.EDGE + reset)
+
+            palette = intface.palette
+            self.assertEqual(palette.text.format('text'),
+                             subdued + '|' + reset + '  text' + ' ' * 72 +
+                             subdued + '|')
+            self.assertEqual(palette.columns.format('a', 'b'),
+                             palette.text.format('a' + ' ' * 38 + 'b'))
+            self.assertEqual(palette.blank, palette.text.format(''))
+
+        self.assertIn(intface.colour_256(242, False),
+                      intface.PALETTES[256].spacer)
+        self.assertRaises(intface.InvalidColours, intface.setColours, 16)
+        self.assertEqual(intface.clrs, 256)
+
+
+if __name__ == "__main__":
+    for testClass in [TestScreen,
+                      TestSinks,
+                      TestOptionIndex,
+                      TestAsyncInput,
+                      TestColours]:
+        suite = unittest.TestLoader().loadTestsFromTestCase(testClass)
+        unittest.TextTestRunner(verbosity=3).run(suite)
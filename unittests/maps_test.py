@@ -4,7 +4,11 @@
 """Unittest script for map functions"""
 
 # Python imports.
+import io
 import logging as log
+import os
+import random
+import tempfile
 import unittest
 import sys
 
@@ -12,16 +16,20 @@ sys.path.append('.')
 
 # Module imports.
 import maps.field as field
+import maps.loader as loader
+import maps.path as path
+import maps.spatial as spatial
 import maps.hostile as hostile
 import maps.object as object
 import maps.tile as tile
+import display.interface as intface
 import unittests.testutils.testutils as testutils
+from utils.exceptions import MapException
 
 log.basicConfig(filename='logs/mine.log',
                 level=log.DEBUG,
                 filemode='w',
                 format='%(levelname)s >> %(message)s')
-soh = testutils.StdOutHandler()
 
 
 class TestFieldsModule(unittest.TestCase):
@@ -37,14 +45,179 @@ class TestFieldsModule(unittest.TestCase):
         """Unit test for printing a basic grid"""
         log.info('Starting grid-printing unit-test')
 
-        newField = field.Field('basic')
+        memory = intface.MemorySink()
+        newField = field.Field('basic', sink=memory)
 
         #----------------------------------------------------------------------
-        # Print the map to /dev/null, not the test.
+        # Print the map to memory, not the test.
         #----------------------------------------------------------------------
-        soh.hideStdOut()
         self.assertTrue(newField.printMap())
-        soh.restoreStdOut()
+        self.assertEqual(memory.getvalue(), newField.renderMap())
+
+    def testBufferedDisplay(self):
+        """Unit test that a map is printed with a single write"""
+        log.info('Starting buffered map display unit-test')
+
+        newField = field.Field('basic')
+
+        class CountingStream(io.StringIO):
+            writes = 0
+
+            def write(self, text):
+                CountingStream.writes += 1
+                return io.StringIO.write(self, text)
+
+        stream = CountingStream()
+        oldStdout = sys.stdout
+        sys.stdout = stream
+        try:
+            newField.printMap()
+        finally:
+            sys.stdout = oldStdout
+
+        self.assertEqual(CountingStream.writes, 1)
+        self.assertEqual(stream.getvalue(), newField.renderMap())
+
+    def testViewportDisplay(self):
+        """Unit test for rendering a window of a map"""
+        log.info('Starting map viewport unit-test')
+
+        newField = field.Field('basic')
+        lines = newField.renderMap(top=3, left=39, rows=3, cols=4).split('\n')
+
+        self.assertEqual(lines[0], '  ..s.')
+        self.assertEqual(lines[1], '  ....')
+        self.assertEqual(lines[2], '  |||| < 5')
+        self.assertEqual(lines[3], '   ^    ')
+        self.assertEqual(lines[4], '   40   ')
+
+        with self.assertRaises(IndexError):
+            newField.renderMap(top=newField.height)
+
+    def testViewportsMatchFullMap(self):
+        """Unit test that viewports show the occupiers of the full map"""
+        newField = field.Field('basic')
+        full = newField.renderMap().split('\n')
+        start = len(field.SPACER)
+
+        rand = random.Random(3)
+        for view in range(40):
+            top = rand.randrange(newField.height)
+            left = rand.randrange(newField.width)
+            rows = rand.randrange(1, newField.height - top + 1)
+            cols = rand.randrange(1, newField.width - left + 1)
+            lines = newField.renderMap(top, left, rows, cols).split('\n')
+
+            for offset in range(rows):
+                self.assertEqual(lines[offset][start:start + cols],
+                                 full[top + offset][start + left:
+                                                    start + left + cols],
+                                 'Viewport %d differs' % view)
+
+    def testCompactGrid(self):
+        """Unit test for the compact grid representation"""
+        log.info('Starting compact grid unit-test')
+
+        newField = field.Field('basic')
+        self.assertEqual(len(newField.codes),
+                         newField.height * newField.width)
+        self.assertEqual(len(newField.tileTypes), 2)
+
+        # Tile types are shared records, not copies.
+        self.assertIs(newField.tileTypeAt(0, 0), newField.tileTypeAt(0, 1))
+        self.assertFalse(newField.isAccessible(0, 0))
+        self.assertTrue(newField.isAccessible(1, 25))
+
+        # Items and hostiles are only held where present.
+        self.assertEqual(newField.hostiles[(3, 41)].name, 'Slime')
+        self.assertEqual(newField.items[(10, 46)].name, 'Pillar')
+        self.assertEqual(len(newField.hostiles), 4)
+        self.assertEqual(len(newField.items), 6)
+
+        # Tile views read and write the field tables.
+        view = newField.tile(1, 25)
+        self.assertIsNone(view.item)
+        view.addObject('p')
+        self.assertIs(newField.items[(1, 25)], view.item)
+        self.assertEqual(newField.tile(3, 41).hostile.display, 's')
+
+        with self.assertRaises(IndexError):
+            newField.tile(newField.height, 0)
+
+    def testMapFile(self):
+        """Unit test for loading a map stored in a seperate file"""
+        log.info('Starting map file unit-test')
+
+        newField = field.Field('tunnel')
+        self.assertEqual((newField.height, newField.width), (7, 25))
+        self.assertEqual(newField.hostiles[(2, 3)].name, 'Slime')
+        self.assertEqual(newField.items[(2, 20)].name, 'Pillar')
+
+    def testRaggedRow(self):
+        """Unit test that a ragged map fails on the first bad row"""
+        log.info('Starting ragged map unit-test')
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            mapFile = os.path.join(tmpDir, 'map.ini')
+            with open(mapFile, 'w') as configFile:
+                configFile.write('[ragged]\nname: Ragged\n'
+                                 'mapstring: IIII\\IOsOI\\IOI\\IIII\n')
+
+            with self.assertRaises(MapException) as context:
+                field.Field('ragged', mapFile=mapFile)
+            self.assertIn('Row 2', str(context.exception))
+
+    def testStreamedRows(self):
+        """Unit test for reading map rows in small chunks"""
+        log.info('Starting streamed rows unit-test')
+
+        stream = io.StringIO('IIII\\IOsOI\nIOOI\r\n\\IIII')
+        self.assertEqual(list(loader.iterRows(stream, chunkSize=3)),
+                         ['IIII', 'IOsOI', 'IOOI', '', 'IIII'])
+
+    def testCompiledMap(self):
+        """Unit test that compiled maps load the same grid as text maps"""
+        log.info('Starting compiled map unit-test')
+
+        for mapId in ['basic', 'tunnel']:
+            textField = field.Field(mapId)
+
+            with tempfile.TemporaryDirectory() as tmpDir:
+                path = os.path.join(tmpDir, '%s.mine' % mapId)
+                textField.compile(path)
+                binField = field.Field.fromCompiled(path)
+
+                self.assertEqual((binField.mapId, binField.name),
+                                 (textField.mapId, textField.name))
+                self.assertEqual((binField.height, binField.width),
+                                 (textField.height, textField.width))
+                self.assertEqual(binField.tileTypes, textField.tileTypes)
+                self.assertEqual(bytes(binField.codes),
+                                 bytes(textField.codes))
+
+                for table in ['items', 'hostiles']:
+                    self.assertEqual(
+                        {pos: obj.type
+                         for (pos, obj) in getattr(binField, table).items()},
+                        {pos: obj.type
+                         for (pos, obj) in getattr(textField, table).items()})
+
+                # The mapping is private to the loaded field.
+                binField.codes[0] = binField._tileCode('O')
+                self.assertTrue(binField.isAccessible(0, 0))
+                del binField
+
+    def testInvalidCompiledMap(self):
+        """Unit test that unrecognised compiled maps are rejected"""
+        log.info('Starting invalid compiled map unit-test')
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'bad.mine')
+            with open(path, 'wb') as badFile:
+                badFile.write(b'NOT A MAP' * 4)
+
+            with self.assertRaises(MapException):
+                field.Field.fromCompiled(path)
 
     def verifyGrids(self):
         """Unit test to verify custom maps"""
@@ -57,6 +230,254 @@ class TestFieldsModule(unittest.TestCase):
             self.assertTrue(field.Field(thisId))
 
 
+    def testOccupierQueries(self):
+        """Unit test for querying hostiles and items by position"""
+        log.info('Starting occupier query unit-test')
+
+        newField = field.Field('basic')
+
+        self.assertEqual(newField.findItems('p'),
+                         [(10, 46), (10, 50), (11, 24), (12, 29), (13, 16),
+                          (14, 21)])
+        self.assertEqual([pos for (pos, hst) in
+                          newField.hostilesInRadius(13, 20, 5)],
+                         [(13, 19), (14, 24)])
+        self.assertEqual([pos for (pos, itm) in
+                          newField.itemsInRect(10, 40, 12, 58)],
+                         [(10, 46), (10, 50)])
+        self.assertEqual(newField.nearestHostile(0, 58)[0], (3, 41))
+        self.assertIsNone(newField.nearestHostile(0, 58, maxRadius=5))
+
+        # Moving and adding keep the index up to date.
+        newField.moveHostile((3, 41), (4, 57))
+        self.assertEqual(newField.nearestHostile(0, 58)[0], (4, 57))
+        newField.tile(1, 57).addObject('s')
+        self.assertEqual(newField.nearestHostile(0, 58)[0], (1, 57))
+        self.assertEqual(len(newField.findHostiles('s')), 5)
+
+        with self.assertRaises(MapException):
+            newField.moveHostile((1, 57), (4, 57))
+
+
+class TestSpatialModule(unittest.TestCase):
+    """Unit tests for the spatial module"""
+
+    def testQueriesMatchScan(self):
+        """Unit test comparing index queries with a full scan"""
+        log.info('Starting spatial index unit-test')
+
+        rand = random.Random(7)
+        index = spatial.SpatialIndex(bucketSize=4)
+        positions = {}
+        for key in range(200):
+            positions[key] = (rand.randrange(60), rand.randrange(60))
+            index.insert(key, *positions[key], group=key % 3)
+
+        for key in range(0, 200, 7):
+            positions[key] = (rand.randrange(60), rand.randrange(60))
+            index.move(key, *positions[key])
+        for key in range(0, 200, 11):
+            del positions[key]
+            index.remove(key)
+
+        def distance(key, row, col):
+            return ((positions[key][0] - row) ** 2 +
+                    (positions[key][1] - col) ** 2)
+
+        for query in range(50):
+            (row, col) = (rand.randrange(-10, 70), rand.randrange(-10, 70))
+            radius = rand.randrange(15)
+
+            self.assertEqual(
+                sorted(index.radius(row, col, radius)),
+                sorted(key for key in positions
+                       if distance(key, row, col) <= radius * radius))
+
+            self.assertEqual(
+                sorted(index.rect(row, col, row + radius, col + 2 * radius)),
+                sorted(key for (key, (krow, kcol)) in positions.items()
+                       if row <= krow <= row + radius and
+                       col <= kcol <= col + 2 * radius))
+
+            nearest = index.nearest(row, col)
+            self.assertEqual(distance(nearest, row, col),
+                             min(distance(key, row, col)
+                                 for key in positions))
+
+            nearest = index.nearest(row, col, group=1)
+            self.assertEqual(distance(nearest, row, col),
+                             min(distance(key, row, col)
+                                 for key in positions if key % 3 == 1))
+
+        self.assertIsNone(spatial.SpatialIndex().nearest(0, 0))
+
+    def testNearestBounds(self):
+        """Unit test that nearest queries keep bounds as keys come and go"""
+        index = spatial.SpatialIndex(bucketSize=4)
+        index.insert('far', 100, 100)
+        index.insert('near', 2, 2)
+        index.remove('far')
+        self.assertEqual(index._bounds, (0, 25, 0, 25))
+        self.assertEqual(index.nearest(90, 90), 'near')
+
+        index.insert('other', 1, 1)
+        index.move('near', 50, -30)
+        self.assertEqual(index._bounds, (0, 25, -8, 25))
+        self.assertEqual(index.nearest(40, -40), 'near')
+        index.remove('other')
+
+        index.remove('near')
+        self.assertIsNone(index.nearest(0, 0))
+        self.assertIsNone(index._bounds)
+        index.insert('new', 9, 9)
+        self.assertEqual(index._bounds, (2, 2, 2, 2))
+        self.assertEqual(index.nearest(-50, 60), 'new')
+
+
+class TestPathModule(unittest.TestCase):
+    """Unit tests for the path module"""
+
+    def testPathsMatchFlowFields(self):
+        """Unit test that A* paths are as short as flow field distances"""
+        log.info('Starting pathfinding unit-test')
+
+        newField = field.Field('basic')
+        finder = path.Pathfinder(newField)
+        rand = random.Random(3)
+        openTiles = [(row, col) for row in range(newField.height)
+                 for col in range(newField.width)
+                 if newField.isAccessible(row, col)]
+
+        for query in range(30):
+            (start, goal) = rand.sample(openTiles, 2)
+            route = finder.findPath(start, goal)
+            distance = finder.flowField(goal).distance(*start)
+
+            if distance == path.UNREACHABLE:
+                self.assertIsNone(route)
+                continue
+
+            self.assertEqual(len(route) - 1, distance)
+            self.assertEqual((route[0], route[-1]), (start, goal))
+            for (step, nextStep) in zip(route, route[1:]):
+                self.assertEqual(path._manhattan(step, nextStep), 1)
+                self.assertTrue(newField.isAccessible(*nextStep))
+
+            self.assertIs(finder.findPath(start, goal), route)
+
+            # Following the flow field arrives at the goal.
+            position = start
+            for step in range(distance):
+                position = finder.flowField(goal).nextStep(*position)
+            self.assertEqual(position, goal)
+
+        self.assertIsNone(finder.findPath((0, 0), (4, 4)))
+
+    def testInvalidation(self):
+        """Unit test that tile changes discard only affected results"""
+        log.info('Starting path invalidation unit-test')
+
+        newField = field.Field('basic')
+        finder = path.Pathfinder(newField)
+
+        route = finder.findPath((4, 1), (4, 20))
+        other = finder.findPath((1, 30), (1, 40))
+        flow = finder.flowField((4, 20))
+        self.assertEqual(len(route), 20)
+
+        # Blocking a tile on the path discards it, but not unrelated paths.
+        newField.setTile(4, 10, 'I')
+        self.assertNotIn(((4, 1), (4, 20)), finder.paths)
+        self.assertIs(finder.findPath((1, 30), (1, 40)), other)
+        self.assertNotIn((4, 20), finder.flowFields)
+
+        detour = finder.findPath((4, 1), (4, 20))
+        self.assertNotIn((4, 10), detour)
+        self.assertEqual(len(detour), 22)
+        self.assertIsNot(finder.flowField((4, 20)), flow)
+
+        # Reopening the tile restores the shorter path.
+        newField.setTile(4, 10, 'O')
+        self.assertIs(finder.findPath((1, 30), (1, 40)), other)
+        self.assertEqual(finder.findPath((4, 1), (4, 20)), route)
+
+
+class TestRegionModule(unittest.TestCase):
+    """Unit tests for the region module"""
+
+    def _components(self, newField):
+        """Returns the accessible components of a field by flood fill"""
+        components = {}
+        for row in range(newField.height):
+            for col in range(newField.width):
+                if ((row, col) in components or
+                        not newField.isAccessible(row, col)):
+                    continue
+                components[(row, col)] = (row, col)
+                frontier = [(row, col)]
+                while frontier:
+                    (frow, fcol) = frontier.pop()
+                    for (arow, acol) in [(frow - 1, fcol), (frow + 1, fcol),
+                                         (frow, fcol - 1), (frow, fcol + 1)]:
+                        if (0 <= arow < newField.height and
+                                0 <= acol < newField.width and
+                                (arow, acol) not in components and
+                                newField.isAccessible(arow, acol)):
+                            components[(arow, acol)] = (row, col)
+                            frontier.append((arow, acol))
+        return components
+
+    def _assertRegionsMatch(self, newField):
+        """Asserts region labels partition tiles as a flood fill does"""
+        components = self._components(newField)
+        regions = newField.regions
+
+        pairs = {}
+        for (position, root) in components.items():
+            pairs.setdefault(regions.region(*position), set()).add(root)
+        self.assertTrue(all(len(roots) == 1 for roots in pairs.values()))
+        self.assertEqual(len(pairs), len(set(components.values())))
+        self.assertEqual(sorted(regions.sizes.values()),
+                         sorted(list(components.values()).count(root)
+                                for root in set(components.values())))
+
+    def testRegionLabels(self):
+        """Unit test for labelling and relabelling connected regions"""
+        log.info('Starting region labelling unit-test')
+
+        newField = field.Field('basic')
+        self._assertRegionsMatch(newField)
+        self.assertFalse(newField.isReachable((0, 0), (4, 4)))
+        self.assertTrue(newField.isReachable((4, 1), (1, 30)))
+
+        rand = random.Random(5)
+        for change in range(200):
+            (row, col) = (rand.randrange(1, newField.height - 1),
+                          rand.randrange(1, newField.width - 1))
+            newField.setTile(row, col, rand.choice('IO'))
+            if change % 20 == 0:
+                self._assertRegionsMatch(newField)
+        self._assertRegionsMatch(newField)
+
+    def testUnreachablePaths(self):
+        """Unit test that unreachable paths are rejected by region"""
+        log.info('Starting unreachable path unit-test')
+
+        newField = field.Field('basic')
+        finder = path.Pathfinder(newField)
+
+        # Wall off a pocket, then reopen it.
+        self.assertIsNotNone(finder.findPath((4, 1), (3, 2)))
+        for (row, col) in [(3, 2), (4, 2), (5, 1), (5, 2)]:
+            newField.setTile(row, col, 'I')
+        self.assertFalse(newField.isReachable((4, 1), (1, 30)))
+        self.assertIsNone(finder.findPath((4, 1), (1, 30)))
+
+        newField.setTile(4, 2, 'O')
+        self.assertTrue(newField.isReachable((4, 1), (1, 30)))
+        self.assertIsNotNone(finder.findPath((4, 1), (1, 30)))
+
+
 class TestTilesModule(unittest.TestCase):
     """Unit tests for the tiles module"""
 
@@ -70,9 +491,11 @@ class TestTilesModule(unittest.TestCase):
         testTile.addObject('p')
         testTile.addObject('s')
 
-        log.debug('Adding too many objects')
-        with self.assertRaises(Exception):
+        log.debug('Overwriting the tile item')
+        firstItem = testTile.item
+        with self.assertLogs('mine.maps', 'WARNING'):
             testTile.addObject('p')
+        self.assertIsNot(testTile.item, firstItem, 'Tile item not replaced')
 
         log.debug('Adding too many hostiles')
         with self.assertRaises(Exception):
@@ -92,6 +515,9 @@ class TestObjectModule(unittest.TestCase):
 
 if __name__ == "__main__":
     for testClass in [TestFieldsModule,
+                      TestSpatialModule,
+                      TestPathModule,
+                      TestRegionModule,
                       TestTilesModule,
                       TestHostileModule,
                       TestObjectModule]:
@@ -43,7 +43,7 @@ def getTestUnit():
     return unit.Unit('mech', 'rebels')
 
 
-def getTestCombat():
-    """Get a basic combat for testing"""
+def getTestCombat(sink=None):
+    """Get a basic combat for testing, writing through _sink_ if given"""
     return combat.Combat([unit.Unit('drone', 'rebels'),
-                          unit.Unit('drone', 'autoarmy')])
+                          unit.Unit('drone', 'autoarmy')], sink=sink)
@@ -4,14 +4,24 @@
 """Unittest script for unit functions"""
 
 # Python imports.
+import array
+import io
 import logging as log
+import random
 import unittest
 import sys
 
 sys.path.append('.')
 
 # Module imports.
+from utils.exceptions import CounterException, UnitException
+import utils.counter as counter
+import utils.registry as registry
+import units.policy as policy
+import units.statstore as statstore
 import units.unit as unit
+import combat.combat as combat
+import display.interface as intface
 from unittests.testutils.testutils import (soh, getKeys, getTestUnit)
 
 log.basicConfig(filename='logs/unitstests.log',
@@ -53,6 +63,26 @@ class TestUnitModule(unittest.TestCase):
         newUnit.getChoice()
         soh.restoreStdOut()
 
+    def testCommandIndex(self):
+        """Test a player's unit is prompted from an index kept between turns"""
+        log.info('Starting unit command index unit-test')
+
+        newUnit = unit.Unit('mech', 'rebels', auto=False)
+        index = newUnit.commandIndex()
+        self.assertIs(newUnit.commandIndex(), index,
+                      'Command index rebuilt between prompts')
+        self.assertEqual(index.options, newUnit.commands)
+
+        stdin = sys.stdin
+        sys.stdin = io.StringIO('ARM\n3\n')
+        previous = intface.setSink(intface.NullSink())
+        try:
+            self.assertEqual(newUnit.getChoice().name, 'armour')
+            self.assertEqual(newUnit.getChoice().name, 'pass')
+        finally:
+            sys.stdin = stdin
+            intface.setSink(previous)
+
     def testUnitMortality(self):
         """Unit test for testing unit mortality"""
         log.info('Starting unit mortality unit-test')
@@ -108,7 +138,237 @@ class TestUnitModule(unittest.TestCase):
             log.info('Testing unit, ID: %s' % thisId)
             self.assertTrue(unit.Unit(thisId, 'rebels'))
 
+class TestPolicyModule(unittest.TestCase):
+    """Unit tests for the policy module"""
+
+    def _policyUnit(self, name, teamId='rebels', commands=None):
+        """Returns a mech using the policy _name_"""
+        template = registry.unitTemplates()['mech']._replace(policy=name)
+        if commands is not None:
+            template = template._replace(commands=commands)
+        newUnit = unit.Unit('mech', teamId)
+        newUnit._generate_commands(template.commands)
+        newUnit.policy = policy.getPolicy(name, template)
+        return newUnit
+
+    def testRandomPolicy(self):
+        """Test the random policy chooses as units always have"""
+        log.info('Starting random policy unit-test')
+
+        units = [self._policyUnit(policy.RANDOM),
+                 unit.Unit('drone', 'autoarmy'),
+                 unit.Unit('drone', 'autoarmy')]
+        newUnit = units[0]
+
+        for seed in range(20):
+            newUnit.rng = random.Random(seed)
+            (choice, target) = newUnit.plan(units)
+
+            rand = random.Random(seed)
+            expected = rand.choice(newUnit.commands)
+            self.assertIs(choice, expected)
+            if expected.selfOnly:
+                self.assertIs(target, newUnit)
+            else:
+                self.assertIs(target, expected.getTarget(
+                    units, newUnit.team.allies, auto=True, rng=rand))
+
+    def testGreedyPolicies(self):
+        """Test the greedy, focus-fire and buff-when-hurt policies"""
+        log.info('Starting greedy policies unit-test')
+
+        greedy = self._policyUnit(policy.GREEDY,
+                                  commands=('armour', 'heavy-swing'))
+        self.assertEqual(greedy.commands[greedy.policy.best].name,
+                         'heavy-swing')
+
+        focus = self._policyUnit(policy.FOCUS)
+        hurt = self._policyUnit(policy.BUFF)
+        enemies = [unit.Unit('drone', 'autoarmy') for num in range(4)]
+        units = [focus, hurt] + enemies
+        newCombat = combat.Combat(units, headless=True, seed=1)
+        newCombat.attach()
+
+        enemies[2].damage(4)
+        enemies[3].damage(4)
+        enemies[1].kill()
+        self.assertEqual(focus.plan(units), (focus.commands[0], enemies[2]))
+        enemies[2].damage(2)
+        enemies[3].damage(3)
+        self.assertIs(focus.plan(units)[1], enemies[3])
+
+        self.assertEqual(hurt.plan(units)[0].name, 'attack')
+        hurt.damage(30)
+        self.assertEqual(hurt.plan(units), (hurt.commands[1], hurt))
+
+        self.assertEqual(newCombat.run(), ['rebels'])
+        self.assertIsNone(focus.teamSummaries)
+
+    def testPolicyTables(self):
+        """Test policies are shared per unit type, and checked"""
+        template = registry.unitTemplates()['mech']
+        self.assertIs(policy.getPolicy(policy.GREEDY, template),
+                      policy.getPolicy(policy.GREEDY, template))
+        self.assertIs(unit.Unit('mech', 'rebels').policy,
+                      unit.Unit('mech', 'autoarmy').policy)
+
+        replaced = template._replace(name='Reloaded Suit')
+        self.assertIsNot(policy.getPolicy(policy.GREEDY, replaced),
+                         policy.getPolicy(policy.GREEDY, template))
+
+        self.assertRaises(UnitException, policy.getPolicy, 'psychic',
+                          template)
+
+class TestStatStoreModule(unittest.TestCase):
+    """Unit tests for the statstore module"""
+
+    def _newUnits(self):
+        """Returns units of two teams, and the changes seen by listeners"""
+        units = [unit.Unit(unitId, teamId)
+                 for unitId in ('drone', 'mech') * 3
+                 for teamId in ('rebels', 'autoarmy')]
+        changes = []
+        for (index, unt) in enumerate(units):
+            unt.hpListeners.append(
+                lambda unt, alive, index=index: changes.append((index, alive)))
+            unt.hpWatchers.append(
+                lambda unt, index=index: changes.append(index))
+        return (units, changes)
+
+    def _stats(self, units):
+        """Returns every field of every stat of _units_"""
+        return [[tuple(getattr(statstore.StatStore._counter(unt, stat), name)
+                       for name in statstore.FIELDS)
+                 for stat in statstore.STATS] for unt in units]
+
+    def testMatchesCounters(self):
+        """Test stored units change as units with counters do"""
+        log.info('Starting stat store unit-test')
+
+        (plain, plainChanges) = self._newUnits()
+        (stored, storedChanges) = self._newUnits()
+        store = statstore.StatStore(stored)
+        self.assertEqual(self._stats(plain), self._stats(stored))
+
+        rand = random.Random(9)
+        for step in range(1000):
+            index = rand.randrange(len(plain))
+            (name, args) = rand.choice([
+                ('kill', ()), ('reset', ()),
+                ('damage', (rand.randrange(20),)),
+                ('heal', (rand.randrange(20),)),
+                ('damageFraction', (rand.random(),)),
+                ('buff', (rand.choice(statstore.STATS),
+                          rand.randrange(-30, 30)))])
+            self.assertEqual(getattr(plain[index], name)(*args),
+                             getattr(stored[index], name)(*args))
+            self.assertEqual(self._stats(plain), self._stats(stored),
+                             'Stored stats differ at step %d' % step)
+
+        self.assertEqual(plainChanges, storedChanges)
+        self.assertEqual(store.liveTeams(),
+                         [teamId for teamId in ('rebels', 'autoarmy')
+                          if any(unt.state() != unit.DEAD and
+                                 unt.team.teamId == teamId for unt in plain)])
+        self.assertRaises(UnitException, statstore.StatStore, stored * 2)
+
+    def testViewsMatchFastCounters(self):
+        """Test stat views are slotted and behave as fast counters"""
+        log.info('Starting stat view unit-test')
+
+        arrays = {name: array.array(statstore.TYPECODE, [0, 0])
+                  for name in statstore.FIELDS}
+        view = statstore.StatView(arrays, 1)
+        fast = counter.FastCounter(50)
+        for name in statstore.FIELDS:
+            setattr(view, name, getattr(fast, name))
+        self.assertFalse(hasattr(view, '__dict__'), 'Stat view has a dict')
+
+        rand = random.Random(4)
+        for step in range(1000):
+            (name, args) = rand.choice([
+                ('tick', ()), ('min', ()), ('reset', ()), ('getValue', ()),
+                ('reduce', (rand.randrange(20),)),
+                ('increase', (rand.randrange(20),)),
+                ('increase', (rand.randrange(-2, 3), True)),
+                ('reduceFraction', (rand.random(),)),
+                ('increaseFraction', (rand.random(),))])
+            try:
+                expected = getattr(fast, name)(*args)
+            except CounterException:
+                self.assertRaises(CounterException,
+                                  getattr(view, name), *args)
+                continue
+            self.assertEqual(getattr(view, name)(*args), expected)
+            self.assertEqual([getattr(view, field)
+                              for field in statstore.FIELDS],
+                             [getattr(fast, field)
+                              for field in statstore.FIELDS],
+                             'Stat view differs at step %d' % step)
+        self.assertEqual(arrays['value'][0], 0, 'View changed another slot')
+
+    def testMassCombatStats(self):
+        """Test the stats of a mass combat stay on the fast path"""
+        log.info('Starting mass combat stats unit-test')
+
+        units = [unit.Unit(unitId, teamId)
+                 for unitId in ('drone', 'mech') * 3
+                 for teamId in ('rebels', 'autoarmy')]
+        combat.Combat(units, headless=True, seed=1, mass=True)
+
+        for unt in units:
+            for stat in statstore.STATS:
+                view = statstore.StatStore._counter(unt, stat)
+                self.assertIsInstance(view, statstore.StatView)
+                self.assertNotIsInstance(view, counter.Counter,
+                                         'Stat view is a logging counter')
+                self.assertFalse(hasattr(view, '__dict__'))
+
+    def testBulkChanges(self):
+        """Test bulk changes match changing each unit, with and without
+        NumPy
+
+        """
+        log.info('Starting stat store bulk unit-test')
+
+        for vectorised in (True, False):
+            if vectorised and statstore.numpy is None:
+                continue
+
+            (plain, plainChanges) = self._newUnits()
+            (stored, storedChanges) = self._newUnits()
+            store = statstore.StatStore(stored)
+            if not vectorised:
+                store.views = None
+
+            plain[1].kill()
+            stored[1].kill()
+
+            for unt in plain[:6]:
+                unt.damage(12)
+            store.damage(12, units=stored[:6])
+            self.assertEqual([unt.buff(unit.DEF, 70) for unt in plain
+                              if unt.team.teamId == 'autoarmy'],
+                             store.buff(unit.DEF, 70, teamId='autoarmy'))
+            self.assertEqual([unt.buff(unit.HP, -8) for unt in plain
+                              if unt.team.teamId == 'rebels'],
+                             store.buff(unit.HP, -8, teamId='rebels'))
+
+            self.assertEqual(self._stats(plain), self._stats(stored))
+            self.assertEqual(plainChanges, storedChanges)
+
+            for unt in plain:
+                unt.kill()
+            store.damage(1000, teamId='rebels')
+            self.assertEqual(store.liveTeams(), ['autoarmy'])
+            store.damage(1000, units=stored)
+            self.assertEqual(store.liveTeams(), [])
+            self.assertRaises(UnitException, store.buff, unit.ATT, 1,
+                              units=stored)
+
 if __name__ == "__main__":
-    for testClass in [TestUnitModule]:
+    for testClass in [TestUnitModule,
+                      TestPolicyModule,
+                      TestStatStoreModule]:
         suite = unittest.TestLoader().loadTestsFromTestCase(testClass)
         unittest.TextTestRunner(verbosity=3).run(suite)
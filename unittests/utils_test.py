@@ -5,6 +5,9 @@
 
 # Python imports
 import logging as log
+import os
+import random
+import tempfile
 import unittest
 import sys
 
@@ -12,6 +15,9 @@ sys.path.append('.')
 
 # Module imports.
 import utils.counter as counter
+import utils.logs as logs
+import utils.registry as registry
+from utils.exceptions import ConfigException, CounterException
 
 log.basicConfig(filename='logs/utiltests.log',
                 level=log.DEBUG,
@@ -57,7 +63,193 @@ class TestCounterModule(unittest.TestCase):
         newCounter.reduceFraction(0.25)
         self.assertEqual(newCounter.getValue(), 56)
 
+    def testFastCounter(self):
+        """Test fast counters behave as counters"""
+        log.info('Starting fast counter unit-test')
+
+        rand = random.Random(3)
+
+        for initFull in (True, False):
+            slow = counter.Counter(40, initFull)
+            fast = counter.FastCounter(40, initFull)
+
+            for step in range(2000):
+                (name, args) = rand.choice([
+                    ('reduce', (rand.randrange(-10, 20),)),
+                    ('increase', (rand.uniform(-20, 20),)),
+                    ('increase', (rand.randrange(-3, 3), True)),
+                    ('min', ()), ('reset', ()),
+                    ('reduceFraction', (rand.random(),)),
+                    ('increaseFraction', (rand.random(),))])
+
+                try:
+                    expected = getattr(slow, name)(*args)
+                except CounterException:
+                    self.assertRaises(CounterException,
+                                      getattr(fast, name), *args)
+                else:
+                    self.assertEqual(getattr(fast, name)(*args), expected)
+
+                self.assertEqual(
+                    [getattr(fast, field) for field in fast.__slots__],
+                    [getattr(slow, field) for field in fast.__slots__],
+                    'Fast counter differs at step %d' % step)
+
+        timer = counter.FastCounter(2)
+        self.assertFalse(timer.tick())
+        self.assertTrue(timer.tick())
+        self.assertTrue(timer.tick())
+        self.assertFalse(hasattr(timer, '__dict__'))
+
+
+class TestRegistryModule(unittest.TestCase):
+    """Unit tests for the registry module"""
+
+    def _writeConfig(self, path, text, mtime):
+        """Writes a config file with a fixed modification time"""
+        with open(path, 'w') as configFile:
+            configFile.write(text)
+        os.utime(path, ns=(mtime, mtime))
+
+    def testCustomDefinitions(self):
+        """Test that all custom config files compile"""
+        log.info('Starting registry definitions unit-test')
+
+        self.assertTrue(registry.tileTypes()['O'].accessible)
+        self.assertFalse(registry.tileTypes()['I'].accessible)
+        self.assertTrue(registry.objectTypes()['p'].decorative)
+        self.assertEqual(registry.hostileTypes()['s'].name, 'Slime')
+        self.assertEqual(registry.commands()['armour'].buffAttrs,
+                         ('defence',))
+        self.assertIn('rebels', registry.teams()['rebels'].allies)
+        self.assertEqual(registry.unitTemplates()['mech'].stats['hitpoints'],
+                         50)
+
+    def testParsedOnce(self):
+        """Test that definitions are shared until the file changes"""
+        log.info('Starting registry reload unit-test')
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'tile.ini')
+            self._writeConfig(path, '[X]\naccess: yes\ndisplay: x\n', 10**9)
+
+            configFile = registry.ConfigFile(path, registry._buildTile)
+            first = configFile.get()
+            self.assertIs(first, configFile.get())
+            self.assertTrue(first['X'].accessible)
+
+            with self.assertRaises(AttributeError):
+                first['X'].display = 'y'
+
+            self._writeConfig(path, '[X]\naccess: no\ndisplay: x\n',
+                              2 * 10**9)
+            second = configFile.get()
+            self.assertIsNot(first, second)
+            self.assertFalse(second['X'].accessible)
+
+    def testInvalidConfig(self):
+        """Test that malformed entries are rejected"""
+        log.info('Starting registry validation unit-test')
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'unit.ini')
+            self._writeConfig(path, '[bad]\nname: Bad\nhitpoints: lots\n'
+                              'commands:\n', 10**9)
+
+            configFile = registry.ConfigFile(path, registry._buildUnit)
+            with self.assertRaises(ConfigException):
+                configFile.get()
+
+class TestLogsModule(unittest.TestCase):
+    """Unit tests for the logs module"""
+
+    def tearDown(self):
+        """Return the mine loggers to their unconfigured state"""
+        logs.shutdown()
+        root = log.getLogger(logs.ROOT)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.setLevel(log.NOTSET)
+        root.propagate = True
+        for subsystem in logs.SUBSYSTEMS:
+            logs.getLogger(subsystem).setLevel(log.NOTSET)
+
+    def testParseLevels(self):
+        """Test parsing of level specifications"""
+        self.assertEqual(logs.parseLevels('info'), (logs.INFO, {}))
+        self.assertEqual(logs.parseLevels('WARNING, combat=DEBUG'),
+                         (logs.WARNING, {logs.COMBAT: logs.DEBUG}))
+        self.assertEqual(logs.parseLevels(''), (None, {}))
+
+        for text in ['LOUD', 'nowhere=DEBUG']:
+            with self.assertRaises(ConfigException):
+                logs.parseLevels(text)
+
+    def testQueuedLogging(self):
+        """Test records reach the log file at the levels set"""
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'logs', 'mine.log')
+            logs.setup(path, 'WARNING,maps=DEBUG')
+
+            self.assertFalse(logs.combatLog.isEnabledFor(logs.INFO))
+            self.assertTrue(logs.mapsLog.isEnabledFor(logs.DEBUG))
+
+            logs.mapsLog.debug('Map message %d', 1)
+            logs.combatLog.info('Combat message %d', 2)
+            logs.combatLog.error('Combat error %d', 3)
+            logs.shutdown()
+
+            with open(path) as logFile:
+                lines = logFile.read().splitlines()
+
+        self.assertEqual(lines, ['DEBUG mine.maps >> Map message 1',
+                                 'ERROR mine.combat >> Combat error 3'])
+
+    def testGuardedHotPaths(self):
+        """Test hot paths make no debug calls while debug is off"""
+        import combat.event as event
+        import display.interface as intface
+        import units.unit as unit
+
+        loggers = (logs.utilsLog, logs.combatLog, logs.unitsLog,
+                   logs.displayLog)
+
+        def debug(*args):
+            raise AssertionError('Debug call with debug off: %s' % (args,))
+
+        newUnit = unit.Unit('drone', 'rebels')
+        deadUnit = unit.Unit('drone', 'rebels')
+        deadUnit.kill()
+        newEvent = event.Event(3)
+        slow = counter.Counter(10)
+        previous = intface.setSink(intface.MemorySink())
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            logs.setup(os.path.join(tmpDir, 'mine.log'), 'WARNING')
+            for logger in loggers:
+                logger.debug = debug
+            try:
+                slow.reduce(3)
+                slow.increase(5)
+                slow.increase(-20)
+                slow.reset()
+                slow.getValue()
+                newEvent.checkValid()
+                newUnit.canDamage()
+                newUnit.canHeal()
+                self.assertEqual(newUnit.state(), unit.OK)
+                self.assertEqual(deadUnit.state(), unit.DEAD)
+                intface.printLine('Line')
+                intface.printText('Text')
+                intface.printSpacer()
+            finally:
+                for logger in loggers:
+                    del logger.debug
+                intface.setSink(previous)
+                logs.shutdown()
+
 if __name__ == "__main__":
-    for testClass in [TestCounterModule]:
+    for testClass in [TestCounterModule, TestRegistryModule,
+                      TestLogsModule]:
         suite = unittest.TestLoader().loadTestsFromTestCase(testClass)
         unittest.TextTestRunner(verbosity=1).run(suite)
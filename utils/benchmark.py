@@ -0,0 +1,148 @@
+#------------------------------------------------------------------------------
+# Module: benchmark
+#------------------------------------------------------------------------------
+"""Microbenchmarks of the combat hot path.
+
+Turns are timed as a headless combat takes them: the scheduler pops the
+next combatant, which chooses and resolves its command, changing the stats
+of its target.  The same combat is timed with the timers and stats of its
+units held as _Counter_ and as _FastCounter_.
+
+Stat changes are timed too, as a hit and a heal to every combatant, with
+stats held as _Counter_, as _FastCounter_ and as the views of a stat store,
+as in a mass combat (see _units.statstore_).
+
+Benchmarks may be run with:
+   python -m utils.benchmark [--combatants 1000] [--turns 200]
+
+"""
+
+# Python imports.
+import argparse
+import array
+import time
+import timeit
+
+# Module imports.
+import utils.counter as counter
+import combat.combat as combat
+import units.statstore as statstore
+import units.unit as unit
+
+# Unit types and teams given to combatants in turn.
+ROSTER = (('mech', 'rebels'), ('drone', 'autoarmy'))
+
+# Seed of the combats timed.
+SEED = 0
+
+
+def _slowCounter(fast):
+    """Returns a _Counter_ holding the fields of _fast_"""
+    slow = counter.Counter(fast.maximum)
+    slow.minimum = fast.minimum
+    slow.value = fast.value
+    slow.default = fast.default
+    return slow
+
+
+def _useCounters(unt):
+    """Holds the timer and stats of _unt_ as _Counter_ instead"""
+    unt.time = _slowCounter(unt.time)
+    for stat in statstore.STATS:
+        attributes = unt.attributes
+        if stat not in attributes:
+            attributes = attributes[unit.ATT]
+        attributes[stat] = _slowCounter(attributes[stat])
+
+
+def _combat(counterClass, combatants):
+    """Returns a headless combat of _combatants_ units, holding their timers
+    and stats as _counterClass_
+
+    """
+    units = [unit.Unit(*ROSTER[num % len(ROSTER)])
+             for num in range(combatants)]
+    if counterClass is counter.Counter:
+        for unt in units:
+            _useCounters(unt)
+    return combat.Combat(units, headless=True, seed=SEED)
+
+
+def benchTurns(combatants, turns):
+    """Returns the time per turn, in seconds, of a headless combat with each
+    kind of counter
+
+    """
+    results = {}
+    for (name, counterClass) in (('Counter', counter.Counter),
+                                 ('FastCounter', counter.FastCounter)):
+        best = None
+        for repeat in range(3):
+            newCombat = _combat(counterClass, combatants)
+            start = time.perf_counter()
+            newCombat.run(maxTurns=turns)
+            elapsed = (time.perf_counter() - start) / newCombat.turns
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    return results
+
+
+def _stats(counterClass, combatants):
+    """Returns a hitpoints stat of _counterClass_ for each combatant, or
+    views of a stat store if _counterClass_ is None
+
+    """
+    if counterClass is not None:
+        return [counterClass(100) for num in range(combatants)]
+
+    arrays = {name: array.array(statstore.TYPECODE, [100] * combatants)
+              for name in statstore.FIELDS}
+    arrays['minimum'] = array.array(statstore.TYPECODE, [0] * combatants)
+    return [statstore.StatView(arrays, slot) for slot in range(combatants)]
+
+
+def changeStats(stats):
+    """Hits and heals every stat, as _Unit.damage_ and _Unit.heal_ do"""
+    for stat in stats:
+        stat.reduce(1)
+        stat.increase(1)
+
+
+def benchStats(combatants, rounds):
+    """Returns the time per round of stat changes, in seconds, of each kind
+    of stat
+
+    """
+    results = {}
+    for (name, counterClass) in (('Counter', counter.Counter),
+                                 ('FastCounter', counter.FastCounter),
+                                 ('StatView', None)):
+        stats = _stats(counterClass, combatants)
+        results[name] = min(timeit.repeat(lambda: changeStats(stats),
+                                          number=rounds, repeat=3)) / rounds
+    return results
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(
+        description='Time the turns and stat changes of combats.')
+    parser.add_argument('--combatants', type=int, default=1000,
+                        help='Combatants per combat (default: %(default)s)')
+    parser.add_argument('--turns', type=int, default=200,
+                        help='Turns, and rounds of stat changes, timed '
+                             '(default: %(default)s)')
+    args = parser.parse_args()
+
+    results = benchTurns(args.combatants, args.turns)
+    for (name, perTurn) in results.items():
+        print('%-12s %8.1f us per turn' % (name, perTurn * 10 ** 6))
+    print('Speed-up: %.1fx' % (results['Counter'] / results['FastCounter']))
+
+    results = benchStats(args.combatants, args.turns)
+    for (name, perRound) in results.items():
+        print('%-12s %8.1f us per round of stat changes' %
+              (name, perRound * 10 ** 6))
+
+if __name__ == '__main__':
+    main()
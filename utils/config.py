@@ -5,7 +5,7 @@
 
 # Module imports.
 from utils.exceptions import ConfigException
-import logging as log
+from utils.logs import utilsLog as log
 
 
 def getBool(value):
@@ -14,5 +14,5 @@ def getBool(value):
         return True
     if value.lower() == 'false':
         return False
-    log.error('Expected \'true\' or \'false\', got \'%s\'' % value)
+    log.error("Expected 'true' or 'false', got '%s'", value)
     raise ConfigException
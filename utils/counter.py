@@ -1,13 +1,17 @@
 #-----------------------------------------------------------------------------
 # Module: Counter
 #-----------------------------------------------------------------------------
-"""Contains root class for handling counters"""
+"""Contains root class for handling counters.
 
-# Python imports
-import logging as log
+_FastCounter_ behaves as _Counter_, but keeps its fields in slots and does
+no logging, for the timers and stats used on every turn of a combat.
+
+"""
 
 # Module imports
 from utils.exceptions import CounterException
+from utils.logs import utilsLog as log
+import utils.logs as logs
 
 
 class Counter:
@@ -35,19 +39,24 @@ class Counter:
 
     def _cleanup(self):
         """Clean-up value to a valid range"""
-        log.debug('Clean-up a counter.')
+        debug = log.isEnabledFor(logs.DEBUG)
+        if debug:
+            log.debug('Clean-up a counter.')
 
         if self.value > self.maximum:
-            log.debug('Decreasing value from %d to maximum.', self.value)
+            if debug:
+                log.debug('Decreasing value from %d to maximum.', self.value)
             self.value = self.maximum
 
         elif self.value < self.minimum:
-            log.debug('Increasing value from %d to minimum.', self.value)
+            if debug:
+                log.debug('Increasing value from %d to minimum.', self.value)
             self.value = self.minimum
 
     def getValue(self):
         """Returns the counter value"""
-        log.debug('Returning the counter value')
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Returning the counter value')
         return(self.value)
 
     def reduce(self, amount, default=False):
@@ -56,7 +65,8 @@ class Counter:
         If the default flag is active then the default value is decremented.
 
         """
-        log.debug('Decreasing a counter.')
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Decreasing a counter.')
         return self.increase((-1 * amount), default)
 
     def increase(self, amount, default=False):
@@ -65,12 +75,15 @@ class Counter:
         If the default flag is active then the default value is incremented.
 
         """
-        log.debug('Increasing a counter.')
+        debug = log.isEnabledFor(logs.DEBUG)
+        if debug:
+            log.debug('Increasing a counter.')
         initial = self.value
         amount = int(amount)
 
         if default:
-            log.debug('Changing default value')
+            if debug:
+                log.debug('Changing default value')
             if (((self.default + amount) < self.minimum) or
                     ((self.default + amount) > self.maximum)):
                 log.error('Default out of range')
@@ -80,7 +93,8 @@ class Counter:
                                            self.maximum))
             self.default += amount
         else:
-            log.debug('Change regular value')
+            if debug:
+                log.debug('Change regular value')
             self.value += amount
             self._cleanup()
 
@@ -88,7 +102,8 @@ class Counter:
 
     def min(self):
         """Minimise the counter"""
-        log.debug('Minimise a counter.')
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Minimise a counter.')
         initial = self.value
 
         self.value = self.minimum
@@ -96,7 +111,8 @@ class Counter:
 
     def reset(self):
         """Reset the counter"""
-        log.debug('Resetting a counter.')
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Resetting a counter.')
         initial = self.value
 
         self.value = self.default
@@ -104,7 +120,8 @@ class Counter:
 
     def reduceFraction(self, fraction):
         """Reduce the amount by a fraction"""
-        log.debug('Reducing the counter by a fraction')
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Reducing the counter by a fraction')
         initial = self.value
 
         newValue = self.value * (1 - fraction)
@@ -114,10 +131,101 @@ class Counter:
 
     def increaseFraction(self, fraction):
         """Increase the amount by a fraction"""
-        log.debug('Increasing the counter by a fraction')
+        if log.isEnabledFor(logs.DEBUG):
+            log.debug('Increasing the counter by a fraction')
         initial = self.value
 
         newValue = self.value * (1 + fraction)
         self.value = int(newValue)
 
         return (self.value - initial)
+
+
+class FastCounter:
+    """Class for counters on the hot path of combats
+
+    Behaves as _Counter_, without its logging.
+
+    """
+
+    __slots__ = ('maximum', 'minimum', 'value', 'default')
+
+    def __init__(self, numCount, initFull=True):
+        """Initializes a new counter"""
+        numCount = int(numCount)
+
+        self.maximum = numCount
+        self.minimum = 0
+        self.value = numCount if initFull else 0
+        self.default = self.value
+
+    def getValue(self):
+        """Returns the counter value"""
+        return self.value
+
+    def reduce(self, amount, default=False):
+        """Decrease the counter
+
+        If the default flag is active then the default value is decremented.
+
+        """
+        return self.increase(-amount, default)
+
+    def increase(self, amount, default=False):
+        """Increase a counter.
+
+        If the default flag is active then the default value is incremented.
+
+        """
+        amount = int(amount)
+
+        if default:
+            if not self.minimum <= self.default + amount <= self.maximum:
+                log.error('Default out of range')
+                raise CounterException('Default incremented to {0}, over '
+                                       'maximum of counter ({1})'.format(
+                                           (self.default + amount),
+                                           self.maximum))
+            self.default += amount
+            return 0
+
+        initial = self.value
+        value = initial + amount
+        if value > self.maximum:
+            value = self.maximum
+        elif value < self.minimum:
+            value = self.minimum
+        self.value = value
+        return value - initial
+
+    def tick(self):
+        """Reduces the counter by one, returning whether it is now zero"""
+        value = self.value - 1
+        if value < self.minimum:
+            value = self.minimum
+        self.value = value
+        return value == 0
+
+    def min(self):
+        """Minimise the counter"""
+        initial = self.value
+        self.value = self.minimum
+        return self.value - initial
+
+    def reset(self):
+        """Reset the counter"""
+        initial = self.value
+        self.value = self.default
+        return self.value - initial
+
+    def reduceFraction(self, fraction):
+        """Reduce the amount by a fraction"""
+        initial = self.value
+        self.value = int(initial * (1 - fraction))
+        return self.value - initial
+
+    def increaseFraction(self, fraction):
+        """Increase the amount by a fraction"""
+        initial = self.value
+        self.value = int(initial * (1 + fraction))
+        return self.value - initial
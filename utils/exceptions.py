@@ -35,3 +35,11 @@ class ConfigException(Exception):
 
 class ActionException(Exception):
     pass
+
+
+class MapException(Exception):
+    pass
+
+
+class RecordException(Exception):
+    pass
@@ -0,0 +1,154 @@
+#------------------------------------------------------------------------------
+# Module: logs
+#------------------------------------------------------------------------------
+"""Module for logging.
+
+Each subsystem logs through its own logger, under the 'mine' logger, so that
+levels may be set per subsystem:
+   maps     - fields, tiles and their occupiers
+   combat   - combats, commands and actions
+   units    - units and their stats
+   display  - the terminal interface
+   utils    - configuration and shared helpers
+
+Messages should be given their arguments rather than formatted in advance,
+so that nothing is formatted for messages below the logger's level.  Code
+which logs inside a loop, or builds arguments at some cost, should first
+check _isEnabledFor_.
+
+Once _setup_ is called, records are passed over a queue to a background
+thread which writes them to file, so logging never waits on file I/O.
+
+Levels are set by the _MINE_LOGLEVEL_ environment variable, holding either a
+single level or a comma-separated list of levels per subsystem, e.g.
+   MINE_LOGLEVEL=INFO,combat=DEBUG
+
+"""
+
+# Python imports.
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+# Module imports.
+from utils.exceptions import ConfigException
+
+# Levels.
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+# Logger names.
+ROOT = 'mine'
+MAPS = 'maps'
+COMBAT = 'combat'
+UNITS = 'units'
+DISPLAY = 'display'
+UTILS = 'utils'
+
+SUBSYSTEMS = (MAPS, COMBAT, UNITS, DISPLAY, UTILS)
+
+# Default log file and level.
+LOGFILE = 'logs/mine.log'
+LEVEL = 'WARNING'
+LEVELVAR = 'MINE_LOGLEVEL'
+
+FORMAT = '%(levelname)s %(name)s >> %(message)s'
+
+
+def getLogger(subsystem):
+    """Returns the logger for a subsystem"""
+    return logging.getLogger('.'.join([ROOT, subsystem]))
+
+mapsLog = getLogger(MAPS)
+combatLog = getLogger(COMBAT)
+unitsLog = getLogger(UNITS)
+displayLog = getLogger(DISPLAY)
+utilsLog = getLogger(UTILS)
+
+# Listener writing queued records, while logging is set up.
+_listener = None
+
+
+def parseLevels(text):
+    """Parses a level specification.
+
+    Returns the level for all subsystems and a mapping of subsystem to level
+    for those set individually.
+
+    """
+    level = None
+    levels = {}
+
+    for entry in text.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        (subsystem, sep, name) = entry.rpartition('=')
+        value = logging.getLevelName(name.strip().upper())
+        if not isinstance(value, int):
+            raise ConfigException('Unknown log level "%s"' % name)
+
+        if not sep:
+            level = value
+        elif subsystem.strip() in SUBSYSTEMS:
+            levels[subsystem.strip()] = value
+        else:
+            raise ConfigException('Unknown subsystem "%s"' % subsystem)
+
+    return (level, levels)
+
+
+def setup(path=LOGFILE, levels=None):
+    """Sends all logging to _path_ by way of a background thread.
+
+    _levels_ is a level specification, by default taken from the
+    environment.
+
+    """
+    global _listener
+
+    if _listener:
+        shutdown()
+
+    (level, subsystemLevels) = parseLevels(
+        levels if levels is not None else os.environ.get(LEVELVAR, LEVEL))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    handler = logging.FileHandler(path, mode='w')
+    handler.setFormatter(logging.Formatter(FORMAT))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger(ROOT)
+    for oldHandler in list(root.handlers):
+        root.removeHandler(oldHandler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level if level is not None else WARNING)
+    root.propagate = False
+
+    for subsystem in SUBSYSTEMS:
+        getLogger(subsystem).setLevel(subsystemLevels.get(subsystem,
+                                                          logging.NOTSET))
+
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+
+def shutdown():
+    """Writes out any queued records and stops the background thread"""
+    global _listener
+
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(shutdown)
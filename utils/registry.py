@@ -0,0 +1,244 @@
+#------------------------------------------------------------------------------
+# Module: Registry
+#------------------------------------------------------------------------------
+"""Process-wide registry of compiled config definitions.
+
+Each of the _custom/*.ini_ files is parsed once, validated and turned into a
+mapping of frozen definitions.  A file is only re-parsed when its
+modification time changes, so constructors may consult the registry as often
+as they like.
+
+Definitions available:
+   tileTypes()     - _TileType_ by tile ID (custom/tile.ini)
+   objectTypes()   - _ObjectType_ by object ID (custom/object.ini)
+   hostileTypes()  - _HostileType_ by hostile ID (custom/hostile.ini)
+   commands()      - _CommandDef_ by command ID (custom/command.ini)
+   teams()         - _TeamDef_ by team ID (custom/team.ini)
+   unitTemplates() - _UnitTemplate_ by unit ID (custom/unit.ini)
+
+"""
+
+# Python imports.
+import collections
+import configparser
+import os
+import types
+
+# Module imports.
+from utils.exceptions import ConfigException
+from utils.logs import utilsLog as log
+from utils.config import getBool
+
+TILEFILE = 'custom/tile.ini'
+OBJECTFILE = 'custom/object.ini'
+HOSTILEFILE = 'custom/hostile.ini'
+COMMANDFILE = 'custom/command.ini'
+TEAMFILE = 'custom/team.ini'
+UNITFILE = 'custom/unit.ini'
+
+# Unit fields which are not integer stats.
+UNITINFO = ['name', 'commands', 'policy']
+
+TileType = collections.namedtuple('TileType',
+                                  ['tileId', 'display', 'accessible'])
+
+ObjectType = collections.namedtuple('ObjectType',
+                                    ['objectId', 'name', 'decorative',
+                                     'display'])
+
+HostileType = collections.namedtuple('HostileType',
+                                     ['hostileId', 'name', 'display'])
+
+CommandDef = collections.namedtuple('CommandDef',
+                                    ['commandId', 'description', 'selfOnly',
+                                     'offensive', 'amount', 'actionType',
+                                     'buffAttrs', 'delay', 'delayDescription',
+                                     'expiry', 'expiryDescription'])
+
+TeamDef = collections.namedtuple('TeamDef', ['teamId', 'name', 'allies'])
+
+UnitTemplate = collections.namedtuple('UnitTemplate',
+                                      ['unitId', 'name', 'stats', 'commands',
+                                       'policy'])
+
+
+def _getInt(config, section, field, path):
+    """Reads an integer entry, raising a config error if it is malformed"""
+    value = config.get(section, field)
+    try:
+        return int(value)
+    except ValueError:
+        log.error("Expected integer for %s in [%s] of %s, got '%s'",
+                  field, section, path, value)
+        raise ConfigException('Invalid integer for %s in [%s] of %s' %
+                              (field, section, path))
+
+
+def _getList(config, section, field):
+    """Reads a comma-seperated entry into a tuple, dropping blank entries"""
+    entries = config.get(section, field).split(',')
+    return tuple(entry.strip() for entry in entries if entry.strip())
+
+
+def _buildTile(config, section, path):
+    """Builds a tile type from a config section"""
+    access = config.get(section, 'access').lower()
+    return TileType(tileId=section,
+                    display=config.get(section, 'display'),
+                    accessible=(access == 'true' or access == 'yes'))
+
+
+def _buildObject(config, section, path):
+    """Builds a object type from a config section"""
+    return ObjectType(objectId=section,
+                      name=config.get(section, 'name'),
+                      decorative=getBool(config.get(section, 'decorative')),
+                      display=config.get(section, 'display'))
+
+
+def _buildHostile(config, section, path):
+    """Builds a hostile type from a config section"""
+    return HostileType(hostileId=section,
+                       name=config.get(section, 'name'),
+                       display=config.get(section, 'display'))
+
+
+def _buildCommand(config, section, path):
+    """Builds a command definition from a config section"""
+    delay = _getInt(config, section, 'delay', path)
+    expiry = _getInt(config, section, 'expiry', path)
+
+    def getDescription(field, needed):
+        if needed:
+            return config.get(section, field)
+        return None
+
+    return CommandDef(commandId=section,
+                      description=config.get(section, 'description'),
+                      selfOnly=getBool(config.get(section, 'self')),
+                      offensive=getBool(config.get(section, 'offensive')),
+                      amount=_getInt(config, section, 'amount', path),
+                      actionType=config.get(section, 'type'),
+                      buffAttrs=_getList(config, section, 'buffattr'),
+                      delay=delay,
+                      delayDescription=getDescription('delay_description',
+                                                      delay),
+                      expiry=expiry,
+                      expiryDescription=getDescription('expiry_description',
+                                                       expiry))
+
+
+def _buildTeam(config, section, path):
+    """Builds a team definition from a config section"""
+    # Kept as the raw split (including blank entries) to match how teams have
+    # always read their allies.
+    allies = config.get(section, 'allies').split(',')
+
+    # Implicitly, we must be allied with our own team.
+    if section not in allies:
+        allies.append(section)
+
+    return TeamDef(teamId=section,
+                   name=config.get(section, 'name'),
+                   allies=tuple(allies))
+
+
+def _buildUnit(config, section, path):
+    """Builds a unit template from a config section"""
+    stats = {}
+    for field in config.options(section):
+        if field not in UNITINFO:
+            stats[field] = _getInt(config, section, field, path)
+
+    return UnitTemplate(unitId=section,
+                        name=config.get(section, 'name'),
+                        stats=types.MappingProxyType(stats),
+                        commands=_getList(config, section, 'commands'),
+                        policy=config.get(section, 'policy').strip())
+
+
+class ConfigFile:
+    """A single config file compiled into a mapping of definitions.
+
+    The file is re-read only when its modification time has changed since the
+    previous load.
+
+    """
+
+    def __init__(self, path, builder):
+        """Sets up a lazily-loaded config file"""
+        self.path = path
+        self.builder = builder
+        self.mtime = None
+        self.definitions = None
+
+    def get(self):
+        """Returns the definitions, reloading the file if it has changed"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            log.error('Unable to read config file %s', self.path)
+            raise ConfigException('Unable to read config file %s' % self.path)
+
+        if mtime != self.mtime:
+            self.definitions = self._load()
+            self.mtime = mtime
+
+        return self.definitions
+
+    def _load(self):
+        """Parses and validates the config file"""
+        log.info('Loading config file %s', self.path)
+
+        config = configparser.ConfigParser()
+        config.read(self.path)
+
+        definitions = {}
+        for section in config.sections():
+            try:
+                definitions[section] = self.builder(config, section,
+                                                    self.path)
+            except (configparser.Error, ConfigException) as err:
+                log.error('Invalid entry [%s] in %s: %s',
+                          section, self.path, err)
+                raise ConfigException('Invalid entry [%s] in %s' %
+                                      (section, self.path))
+
+        return types.MappingProxyType(definitions)
+
+_tiles = ConfigFile(TILEFILE, _buildTile)
+_objects = ConfigFile(OBJECTFILE, _buildObject)
+_hostiles = ConfigFile(HOSTILEFILE, _buildHostile)
+_commands = ConfigFile(COMMANDFILE, _buildCommand)
+_teams = ConfigFile(TEAMFILE, _buildTeam)
+_units = ConfigFile(UNITFILE, _buildUnit)
+
+
+def tileTypes():
+    """Returns all tile types"""
+    return _tiles.get()
+
+
+def objectTypes():
+    """Returns all object types"""
+    return _objects.get()
+
+
+def hostileTypes():
+    """Returns all hostile types"""
+    return _hostiles.get()
+
+
+def commands():
+    """Returns all command definitions"""
+    return _commands.get()
+
+
+def teams():
+    """Returns all team definitions"""
+    return _teams.get()
+
+
+def unitTemplates():
+    """Returns all unit templates"""
+    return _units.get()